@@ -0,0 +1,262 @@
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Tuple
+from collections import deque
+import asyncio
+import math
+import time
+
+import httpx
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from .settings import settings
+
+# ------------------------------
+# Admission control for streaming endpoints
+# ------------------------------
+# /api/proxy, /api/music/stream/* and /api/proxy/audius/stream all go through
+# range_proxy, which takes a slot here before opening an upstream stream.
+# Limits: global and per-client concurrency, plus a bounded FIFO wait queue
+# with a timeout; beyond that the request gets 503 + Retry-After. A watchdog
+# closes upstream responses of streams that made no progress for
+# STREAM_IDLE_TIMEOUT (client stopped reading), returning the connection.
+# A streamed response gives its slot back when its ASGI call ends, however it
+# ends (finished, disconnected, or failed before the first body chunk).
+
+
+class Slot:
+    """One admitted stream. `release()` is idempotent."""
+
+    def __init__(self, controller: "AdmissionController", client: str, path: str):
+        self.controller = controller
+        self.client = client
+        self.path = path
+        self.started = time.monotonic()
+        self.last_progress = self.started
+        self.bytes_sent = 0
+        self.upstreams: List[httpx.Response] = []
+        self.pacer = None          # flow.StreamPacer when adaptive streaming is on
+        self.released = False
+
+    def watch(self, resp: httpx.Response) -> None:
+        """Register an upstream response the watchdog may close if this stream stalls."""
+        self.upstreams = [r for r in self.upstreams if not r.is_closed] + [resp]
+
+    def progress(self, n: int) -> None:
+        self.bytes_sent += n
+        self.last_progress = time.monotonic()
+
+    def public(self, now: float) -> Dict[str, Any]:
+        out = {
+            "client": self.client,
+            "path": self.path,
+            "age_s": round(now - self.started, 1),
+            "bytes_sent": self.bytes_sent,
+            "idle_s": round(now - self.last_progress, 1),
+        }
+        if self.pacer is not None:
+            out.update(self.pacer.stats())
+        return out
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class AdmittedResponse(StreamingResponse):
+    """`response` holding `slot` until the ASGI call returns; then its upstreams are closed."""
+
+    def __init__(self, slot: Slot, response: StreamingResponse):
+        super().__init__(response.body_iterator, status_code=response.status_code,
+                         background=response.background)
+        self.raw_headers = response.raw_headers
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                aclose = getattr(self.body_iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+                for resp in self.slot.upstreams:
+                    await resp.aclose()       # a body that never started didn't close them
+            finally:
+                self.slot.release()
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = 64, max_per_client: int = 6,
+                 max_queue: int = 32, queue_timeout: float = 5.0, idle_timeout: float = 60.0):
+        self.max_concurrent = max_concurrent
+        self.max_per_client = max_per_client
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.idle_timeout = idle_timeout
+        self.active: List[Slot] = []
+        self.per_client: Dict[str, int] = {}
+        self._waiters: "deque[Tuple[str, str, asyncio.Future]]" = deque()
+        self.admitted = self.rejected = self.timed_out = self.reclaimed = 0
+        self._watchdog: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def client_id(request: Request) -> str:
+        return request.client.host if request.client else "-"
+
+    def _can_admit(self, client: str) -> bool:
+        return (len(self.active) < self.max_concurrent
+                and self.per_client.get(client, 0) < self.max_per_client)
+
+    def _admit(self, client: str, path: str) -> Slot:
+        slot = Slot(self, client, path)
+        self.active.append(slot)
+        self.per_client[client] = self.per_client.get(client, 0) + 1
+        self.admitted += 1
+        return slot
+
+    def _release(self, slot: Slot) -> None:
+        if slot in self.active:
+            self.active.remove(slot)
+        n = self.per_client.get(slot.client, 1) - 1
+        if n > 0:
+            self.per_client[slot.client] = n
+        else:
+            self.per_client.pop(slot.client, None)
+        self._wake()
+
+    def _wake(self) -> None:
+        # FIFO, but a waiter blocked only by its own per-client cap doesn't block others
+        for item in list(self._waiters):
+            client, path, fut = item
+            if fut.done():
+                self._waiters.remove(item)
+                continue
+            if len(self.active) >= self.max_concurrent:
+                break
+            if self._can_admit(client):
+                self._waiters.remove(item)
+                fut.set_result(self._admit(client, path))
+
+    def _reject(self) -> HTTPException:
+        self.rejected += 1
+        retry = max(1, math.ceil(self.queue_timeout))
+        return HTTPException(503, "Too many concurrent streams, retry shortly",
+                             headers={"Retry-After": str(retry)})
+
+    async def acquire(self, request: Request) -> Slot:
+        client = self.client_id(request)
+        path = request.url.path
+        # Waiters still queued are blocked by their own client's cap (_wake admits the
+        # rest), so only this client's earlier waiters have to go first
+        if self._can_admit(client) and not any(c == client for c, _, _ in self._waiters):
+            return self._admit(client, path)
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject()
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        item = (client, path, fut)
+        self._waiters.append(item)
+        self._wake()
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if item in self._waiters:
+                self._waiters.remove(item)
+            if fut.done() and not fut.cancelled():
+                fut.result().release()   # admitted just as we gave up
+            else:
+                fut.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise self._reject()
+            raise
+
+    def try_acquire(self, client: str, path: str) -> Optional[Slot]:
+        """
+        Low-priority slot for speculative work (read-ahead): never waits, and only
+        taken while nobody is queued and one more real stream would still fit.
+        """
+        if self._waiters:
+            return None
+        if (len(self.active) + 1 >= self.max_concurrent
+                or self.per_client.get(client, 0) + 1 >= self.max_per_client):
+            return None
+        return self._admit(client, path)
+
+    def hold(self, slot: Slot, response):
+        """Keep `slot` for the lifetime of a streamed response; release right away otherwise."""
+        if not isinstance(response, StreamingResponse):
+            slot.release()
+            return response
+        inner = response.body_iterator
+
+        async def body():
+            try:
+                async for chunk in inner:
+                    slot.progress(len(chunk))
+                    yield chunk
+            finally:
+                if hasattr(inner, "aclose"):
+                    await inner.aclose()
+
+        response.body_iterator = body()
+        return AdmittedResponse(slot, response)
+
+    # ---- watchdog -------------------------------------------------------
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 4))
+            now = time.monotonic()
+            for slot in list(self.active):
+                if now - slot.last_progress > self.idle_timeout and slot.upstreams:
+                    for resp in slot.upstreams:
+                        try:
+                            await resp.aclose()
+                        except Exception:
+                            pass
+                    slot.upstreams = []
+                    self.reclaimed += 1
+
+    def start(self) -> None:
+        if self._watchdog is None or self._watchdog.done():
+            self._watchdog = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._watchdog:
+            self._watchdog.cancel()
+            try:
+                await self._watchdog
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._watchdog = None
+
+    def pressure(self) -> float:
+        """0..1 share of global stream capacity in use (full while streams queue for it)."""
+        if self._waiters and len(self.active) >= self.max_concurrent:
+            return 1.0
+        return len(self.active) / self.max_concurrent if self.max_concurrent else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "in_flight": len(self.active),
+            "queued": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_per_client": self.max_per_client,
+            "per_client": dict(self.per_client),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "reclaimed": self.reclaimed,
+            "streams": [slot.public(now) for slot in self.active],
+        }
+
+
+admission = AdmissionController(
+    max_concurrent=settings.STREAM_MAX_CONCURRENT,
+    max_per_client=settings.STREAM_MAX_PER_CLIENT,
+    max_queue=settings.STREAM_QUEUE_MAX,
+    queue_timeout=settings.STREAM_QUEUE_TIMEOUT,
+    idle_timeout=settings.STREAM_IDLE_TIMEOUT,
+)
@@ -1,19 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Body, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Body, Query
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import httpx
-import datetime as dt
 from pathlib import Path
-from typing import Optional, Dict, Any, List
-from urllib.parse import urlencode  # <-- added
+import asyncio
+from typing import Optional, Dict, Any, List, Callable, Awaitable
 
-from . import models, schemas
-from .dependencies import get_db
+from . import hedging, models, schemas, upstream
+from .admission import admission
+from .audius_nodes import audius_nodes
+from .conditional import is_not_modified, not_modified_response, validators
+from .image_cache import image_cache
+from . import local_media
+from .library import SORT_PATTERN, library
+from .peaks import peaks
+from .prefetch import prefetcher
+from .readahead import readahead
+from .renditions import HINT_HEADERS, apply_quality, rendition_registry, select_quality
+from .dependencies import get_async_db, get_async_write_db, get_db
+from .federation import federation, merge_ranked
+from .normalize import (
+    audius_music_items, audius_external_items, pixabay_video_items,
+    pixabay_external_items, pexels_video_items, encode,
+)
 from .settings import settings
+from .suggest import suggest_index
+from .warmup import warmer
 from .services import (
-    audius_search_tracks, audius_resolve_stream,
-    pixabay_video_search, range_proxy
+    audius_search_tracks, audius_stream, stream_urls,
+    pixabay_video_search, pexels_video_search, range_proxy
 )
-from .utils import list_files, host_allowed
+from .segment_cache import segment_cache
+from .search_cache import CacheEntry, search_cache, make_key, normalize_query, cached_response
+from .utils import host_allowed
 from .ws import create_room, get_room, close_room
 
 router = APIRouter()
@@ -21,42 +42,124 @@ router = APIRouter()
 BASE_DIR = Path(__file__).resolve().parent
 MEDIA_DIR = BASE_DIR.parent / "media"
 
-# ---- helpers ---------------------------------------------------------------
-
-def _year_from_date(s: Optional[str]) -> Optional[int]:
-    if not s:
-        return None
-    # Accept ISO-ish strings; only the first 10 chars are used (YYYY-MM-DD)
-    try:
-        return dt.date.fromisoformat(s[:10]).year
-    except Exception:
-        return None
+QUALITY_PATTERN = "^(auto|tiny|small|medium|large)$"
 
-# ---- Auth (demo plaintext)
+# ---- Auth (demo plaintext); async sessions, so logins don't queue for threadpool slots
 @router.post("/signup")
-def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
-    if db_user:
+async def signup(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_write_db)):
+    # insert first and let the unique index catch duplicates: one write, no read-then-write race
+    db.add(models.User(username=user.username, password=user.password))
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
         raise HTTPException(400, "Username already registered")
-    new_user = models.User(username=user.username, password=user.password)
-    db.add(new_user); db.commit(); db.refresh(new_user)
     return {"message": "User created successfully"}
 
 @router.post("/login")
-def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
+async def login(user: schemas.UserLogin, db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.scalar(select(models.User).where(models.User.username == user.username))
     if not db_user or db_user.password != user.password:
         raise HTTPException(400, "Invalid credentials")
     return {"message": "Login successful", "username": db_user.username}
 
-# ---- Local media lists
+# ---- Local media lists (served from the library index, see library.py)
 @router.get("/music")
-def get_music_list():
-    return {"music": list_files(MEDIA_DIR / "music")}
+def get_music_list(
+    sort: str = Query("name", pattern=SORT_PATTERN),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    q: Optional[str] = None,
+    artist: Optional[str] = None,
+    mime: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    """
+    Without `limit`/`cursor`: `{"music": [every name]}` as before. With them
+    (paging is opt-in): one page of `items` with size, mtime, mime and tags,
+    `next_cursor` for the following page, and that page's names in `music`.
+    """
+    library.refresh_sync("music")      # picks up added/removed files before the next scan
+    if limit is None and cursor is None:
+        return {"music": library.names(db, "music", sort, order, q, artist, mime)}
+    page = library.page(db, "music", sort, order, q, artist, mime, cursor, limit or 100)
+    return {"music": [i["name"] for i in page["items"]], **page}
 
 @router.get("/videos")
-def get_video_list():
-    return {"videos": list_files(MEDIA_DIR / "videos")}
+def get_video_list(
+    sort: str = Query("name", pattern=SORT_PATTERN),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    q: Optional[str] = None,
+    mime: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    library.refresh_sync("video")      # picks up added/removed files before the next scan
+    if limit is None and cursor is None:
+        return {"videos": library.names(db, "video", sort, order, q, None, mime)}
+    page = library.page(db, "video", sort, order, q, None, mime, cursor, limit or 100)
+    return {"videos": [i["name"] for i in page["items"]], **page}
+
+# ---- /api/media/{music|videos}/{name}  (local files: Range, multi-range, no read loop)
+@router.api_route("/media/{folder}/{name}", methods=["GET", "HEAD"])
+async def local_media_file(request: Request, folder: str, name: str):
+    # async on purpose: only cached validators and an open()/fstat() happen before streaming
+    if folder not in ("music", "videos"):
+        raise HTTPException(404, "Not found")
+    return local_media.serve_local(request, folder, name)
+
+# ---- Waveform peaks for local music (precomputed, see peaks.py)
+@router.get("/music/{name}/peaks")
+async def music_peaks(
+    request: Request,
+    name: str,
+    width: int = Query(1000, ge=1, le=1_000_000),
+    format: str = Query("json", pattern="^(json|bin)$"),
+):
+    """
+    Min/max pairs (int8, -127..127) at the coarsest resolution with at least
+    `width` peaks. `bin` returns the raw pairs with the layout in X-Peaks-*
+    headers. 202 + Retry-After while a new track is still being decoded.
+    """
+    info = library.files.get(("music", name))
+    if peaks is None or info is None or not peaks.decodable(name):
+        raise HTTPException(404, "Not found")
+    etag = '"pk-%s-%d-%s"' % (info.etag.strip('"'), width, format)
+    headers = {"Cache-Control": "public, max-age=3600"}
+    if is_not_modified(request, etag, None):
+        return not_modified_response(etag, None, headers)
+
+    pf = await peaks.load(name, info.etag)
+    if pf is None:
+        try:
+            await asyncio.wait_for(asyncio.shield(peaks.compute(name, info.etag)), settings.PEAKS_WAIT)
+        except asyncio.TimeoutError:
+            return Response(encode({"status": "pending"}), status_code=202, media_type="application/json",
+                            headers={"Retry-After": "2", "Cache-Control": "no-store"})
+        except Exception:
+            raise HTTPException(422, "Could not decode track")
+        pf = await peaks.load(name, info.etag)
+        if pf is None:
+            raise HTTPException(503, "Peaks unavailable", headers={"Retry-After": "2"})
+
+    spp, count, _ = level = pf.level_for(width)
+    pairs = pf.pairs(level)
+    headers["ETag"] = etag
+    if format == "bin":
+        headers.update({"X-Peaks-Sample-Rate": str(pf.rate), "X-Peaks-Samples": str(pf.samples),
+                        "X-Peaks-Samples-Per-Peak": str(spp), "X-Peaks-Count": str(count)})
+        return Response(pairs, media_type="application/octet-stream", headers=headers)
+    body = encode({
+        "name": name,
+        "sample_rate": pf.rate,
+        "samples": pf.samples,
+        "samples_per_peak": spp,
+        "count": count,
+        "peaks": memoryview(pairs).cast("b").tolist(),
+    })
+    return Response(body, media_type="application/json", headers=headers)
 
 # =============================================================================
 # SEARCH ENDPOINTS expected by the front-end
@@ -65,132 +168,239 @@ def get_video_list():
 # ---- /api/search/music  (Audius)
 @router.get("/search/music")
 async def search_music(
+    request: Request,
     q: str = Query(..., min_length=1),
     limit: int = Query(25, ge=1, le=50),
     offset: int = Query(0, ge=0),
-) -> Dict[str, Any]:
+):
     """
     Search Audius and normalize results for the UI.
     Returns items with fields the client already understands:
     id, title, artist, artwork, source, release_date, year, stream_url
     """
-    rows = await audius_search_tracks(q=q, limit=limit, offset=offset)
-    items: List[Dict[str, Any]] = []
-
-    for t in rows:
-        tid = t.get("id")
-        user = (t.get("user") or {}).get("name") or ""
-        art = (t.get("artwork") or {})
-        artwork = art.get("480x480") or art.get("1000x1000") or art.get("150x150")
-        release = t.get("release_date") or t.get("created_at")
-        year = _year_from_date(release)
-        items.append({
-            "id": tid,
-            "title": t.get("title") or "Untitled",
-            "artist": user,
-            "artwork": artwork,
-            "source": "audius",
-            "release_date": release,
-            "year": year,
-            # IMPORTANT: front-end can play this directly
-            "stream_url": f"/api/music/stream/{tid}" if tid else None,
-        })
-    return {"items": items}
+    entry = await _music_page(q, limit, offset)
+    _learn(q, "music", entry)
+    _prefetch_after(entry, make_key("music", q, limit, offset + limit), limit,
+                    lambda: _music_page(q, limit, offset + limit))
+    return cached_response(request, entry)
+
+async def _music_page(q: str, limit: int, offset: int) -> CacheEntry:
+    async def fetch() -> Dict[str, Any]:
+        rows = await audius_search_tracks(q=normalize_query(q), limit=limit, offset=offset)
+        items = audius_music_items(rows)
+        suggest_index.note_names((n for i in items for n in (i.title, i.artist)), "music")
+        return {"items": items}
+
+    return await search_cache.get_or_fetch(make_key("music", q, limit, offset), fetch)
 
 # ---- /api/music/stream/{track_id}  (range-capable stream)
 @router.get("/music/stream/{track_id}")
 async def music_stream(track_id: str, request: Request):
-    # Resolve to final CDN URL, then pipe with Range support
-    final_url = await audius_resolve_stream(track_id)
-    return await range_proxy(request, final_url)
+    # Resolve to final CDN URL (cached per track), then pipe with Range support
+    return await audius_stream(request, track_id)
 
 # ---- /api/search/videos  (Pixabay)
 @router.get("/search/videos")
 async def search_videos(
+    request: Request,
     q: str = Query(..., min_length=1),
     page: int = Query(1, ge=1),
     per_page: int = Query(12, ge=1, le=50),
-) -> Dict[str, Any]:
+    quality: Optional[str] = Query(None, pattern=QUALITY_PATTERN),
+):
     """
     Search Pixabay videos and normalize results.
-    Returns items with: title, thumbnail, source, year, stream_url
+    Returns items with: title, thumbnail, source, year, stream_url, quality, renditions
+    stream_url follows ?quality= or the client hints (Save-Data, Downlink, Viewport-Width).
     """
-    j = await pixabay_video_search(q, page, per_page)
-    hits = j.get("hits", []) or []
-
-    items: List[Dict[str, Any]] = []
-    for v in hits:
-        videos = v.get("videos", {}) or {}
-        file = videos.get("large") or videos.get("medium") or videos.get("small") or {}
-        direct = file.get("url")
-        if not direct:
+    chosen = select_quality(request, quality)
+    entry = await _videos_page(q, page, per_page, chosen)
+    _learn(q, "video", entry)
+    _prefetch_after(entry, make_key("videos", q, page + 1, per_page), per_page,
+                    lambda: _videos_page(q, page + 1, per_page), resolve_streams=False)
+    return cached_response(request, entry, HINT_HEADERS)
+
+async def _videos_page(q: str, page: int, per_page: int, quality: str = "large") -> CacheEntry:
+    async def fetch() -> Dict[str, Any]:
+        j = await pixabay_video_search(normalize_query(q), page, per_page)
+        items = pixabay_video_items(j.hits)
+        # Pixabay titles are tag lists ("nature, forest, trees"); each tag is a term
+        suggest_index.note_names((t.strip() for i in items for t in i.title.split(",")), "video")
+        return {"items": items}
+
+    key = make_key("videos", q, page, per_page)
+    base = await search_cache.get_or_fetch(key, fetch)
+    return await _with_quality(base, key, quality, "large")
+
+async def _pexels_page(q: str, page: int, per_page: int, quality: str = "large") -> CacheEntry:
+    async def fetch() -> Dict[str, Any]:
+        j = await pexels_video_search(normalize_query(q), page, per_page)
+        items = pexels_video_items(j.videos)
+        suggest_index.note_names((i.title for i in items), "video")
+        return {"items": items}
+
+    key = make_key("pexels", q, page, per_page)
+    base = await search_cache.get_or_fetch(key, fetch)
+    return await _with_quality(base, key, quality, "large")
+
+async def _with_quality(base: CacheEntry, key: str, quality: str, default: str) -> CacheEntry:
+    """Variant of a cached video page with stream_url on another rendition (cached too)."""
+    if quality == default:
+        return base
+
+    async def fetch() -> Dict[str, Any]:
+        data = base.data()
+        return dict(data, items=apply_quality(data.get("items", []), quality))
+
+    return await search_cache.get_or_fetch(f"{key}|q={quality}", fetch)
+
+# ---- Warm-up targets: the page shapes the front-end asks for by default
+if warmer is not None:
+    warmer.register("music", lambda q: make_key("music", q, 25, 0), lambda q: _music_page(q, 25, 0))
+    if settings.pixabay_key:
+        warmer.register("video", lambda q: make_key("videos", q, 1, 12), lambda q: _videos_page(q, 1, 12))
+
+# ---- Federated search (all configured providers, per-provider deadline)
+SEARCH_KINDS = {"audius": "music", "pixabay": "video", "pexels": "video"}
+
+@router.get("/search")
+async def search_all(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(24, ge=1, le=100),
+    types: str = Query("music,video"),
+    deadline: Optional[float] = Query(None, gt=0, le=10, description="seconds per provider"),
+    quality: Optional[str] = Query(None, pattern=QUALITY_PATTERN),
+):
+    """
+    Fan out to Audius, Pixabay and Pexels at once and merge what arrives in time.
+    Items keep the per-source shape of /search/music and /search/videos plus `kind`;
+    `providers` reports ok / timeout / error / disabled for each source.
+    """
+    wanted = {t.strip() for t in types.split(",") if t.strip()}
+    per = min(limit, 50)
+    chosen = select_quality(request, quality)
+    calls = {
+        "audius": lambda: _music_page(q, per, 0),
+        "pixabay": lambda: _videos_page(q, 1, per, chosen),
+        "pexels": lambda: _pexels_page(q, 1, per, chosen),
+    }
+    enabled = {
+        "audius": True,
+        "pixabay": bool(settings.pixabay_key),
+        "pexels": bool(settings.pexels_key),
+    }
+    providers: Dict[str, Any] = {}
+    status: Dict[str, Dict[str, Any]] = {}
+    for name, call in calls.items():
+        if SEARCH_KINDS[name] not in wanted:
             continue
-        # Prefer a thumbnail if present
-        thumb = None
-        pics = v.get("video_pictures")
-        if isinstance(pics, list) and pics:
-            thumb = pics[0].get("picture")
-        thumb = thumb or v.get("userImageURL") or v.get("previewURL")
-
-        items.append({
-            "id": str(v.get("id")),
-            "title": v.get("tags") or f"Pixabay {v.get('id')}",
-            "thumbnail": thumb,
-            "source": "pixabay",
-            "year": None,  # Pixabay doesn't provide an ISO publish date
-            # IMPORTANT: use your range proxy; front-end will play this
-            "stream_url": "/api/proxy?" + urlencode({"u": direct}),  # <-- changed
-        })
-
-    return {"items": items}
+        if not enabled[name]:
+            status[name] = {"status": "disabled"}
+            continue
+        providers[name] = (lambda call=call: _page_items(call))
+
+    results, ran = await federation.fan_out(providers, deadline or settings.SEARCH_PROVIDER_DEADLINE)
+    status.update(ran)
+    for name, items in results.items():
+        results[name] = [dict(item, kind=SEARCH_KINDS[name]) for item in items]
+        if items:
+            suggest_index.note_query(q, SEARCH_KINDS[name])
+
+    partial = any(s["status"] in ("timeout", "error") for s in status.values())
+    body = encode({
+        "items": merge_ranked(results, q, limit),
+        "providers": status,
+        "partial": partial,
+    })
+    # partial pages must not stick in browser caches; complete ones can briefly
+    return Response(body, media_type="application/json",
+                    headers={"Cache-Control": "no-store" if partial else "public, max-age=30", **HINT_HEADERS})
+
+async def _page_items(call) -> List[Dict[str, Any]]:
+    entry = await call()
+    return entry.data().get("items", [])
+
+# ---- /api/search/suggest  (autocomplete from past searches, no upstream calls)
+@router.get("/search/suggest")
+async def search_suggest(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(8, ge=1, le=20),
+    kind: Optional[str] = Query(None, pattern="^(music|video)$"),
+):
+    """
+    Terms starting with `q` (past queries, result titles and artists) by decayed
+    popularity. `cached: true` marks queries whose first page is served from cache.
+    """
+    body = encode({"q": q, "suggestions": suggest_index.suggest(q, limit, kind, _first_page_cached)})
+    return Response(body, media_type="application/json",
+                    headers={"Cache-Control": "public, max-age=60"})
+
+def _first_page_cached(term: str, kinds) -> bool:
+    # default page shapes of /search/music and /search/videos
+    if "music" in kinds and search_cache.peek(make_key("music", term, 25, 0)) is not None:
+        return True
+    return "video" in kinds and search_cache.peek(make_key("videos", term, 1, 12)) is not None
+
+def _learn(q: str, kind: str, entry: CacheEntry) -> None:
+    """Count a search that returned something towards the suggest index."""
+    if entry.data().get("items"):
+        suggest_index.note_query(q, kind)
+
+# ---- Background prefetch (next page + top-k stream URLs)
+def _prefetch_after(entry: CacheEntry, next_key: str, page_size: int,
+                    next_page: Callable[[], Awaitable[CacheEntry]], resolve_streams: bool = True) -> None:
+    """
+    After serving `entry`, warm the following page and the first tracks' stream URLs.
+    `resolve_streams` marks Audius pages; only those jobs back off while Audius is degraded.
+    """
+    if prefetcher is None:
+        return
+    items = entry.data().get("items", []) or []
+    if len(items) >= page_size and not search_cache.is_fresh(next_key):
+        prefetcher.schedule(next_key, next_page, audius=resolve_streams)
+    if not resolve_streams:
+        return
+    for item in items[: settings.PREFETCH_TOP_K]:
+        tid = item.get("id")
+        if tid and stream_urls.peek(str(tid)) is None:
+            prefetcher.schedule(f"stream:{tid}", lambda tid=str(tid): stream_urls.resolve(tid), audius=True)
 
 # ---- Existing external endpoints (kept for compatibility)
 @router.get("/external/music/audius")
-async def audius_search_external(q: str = "lofi", limit: int = 20, cursor: str | None = None):
+async def audius_search_external(request: Request, q: str = "lofi", limit: int = 20, cursor: str | None = None):
     offset = int(cursor or 0)
-    data = await audius_search_tracks(q, limit, offset)
-    items = []
-    for t in data:
-        items.append({
-            "id": t["id"],
-            "title": t.get("title"),
-            "artist": (t.get("user") or {}).get("name"),
-            "duration": t.get("duration"),
-            "thumb": (t.get("artwork") or {}).get("150x150"),
-            "stream_url": f"/api/proxy/audius/stream?id={t['id']}",
-            "source": "audius",
-            "license": "Audius terms"
-        })
-    next_cursor = (offset + len(items)) if items else None
-    return {"items": items, "next": str(next_cursor) if next_cursor is not None else None}
+    entry = await _ext_audius_page(q, limit, offset)
+    _prefetch_after(entry, make_key("ext-audius", q, limit, offset + limit), limit,
+                    lambda: _ext_audius_page(q, limit, offset + limit))
+    return cached_response(request, entry)
+
+async def _ext_audius_page(q: str, limit: int, offset: int) -> CacheEntry:
+    async def fetch() -> Dict[str, Any]:
+        data = await audius_search_tracks(normalize_query(q), limit, offset)
+        items = audius_external_items(data)
+        next_cursor = (offset + len(items)) if items else None
+        return {"items": items, "next": str(next_cursor) if next_cursor is not None else None}
+
+    return await search_cache.get_or_fetch(make_key("ext-audius", q, limit, offset), fetch)
 
 @router.get("/proxy/audius/stream")
 async def proxy_audius_stream(id: str, request: Request):
-    final_url = await audius_resolve_stream(id)
-    return await range_proxy(request, final_url)
+    return await audius_stream(request, id)
 
 @router.get("/external/videos/pixabay")
-async def pixabay_videos_external(q: str = "nature", page: int = 1, per_page: int = 10):
-    j = await pixabay_video_search(q, page, per_page)
-    items = []
-    for v in j.get("hits", []):
-        videos = v.get("videos", {})
-        file = videos.get("medium") or videos.get("small") or videos.get("large") or {}
-        direct = file.get("url")
-        if not direct:
-            continue
-        items.append({
-            "id": str(v["id"]),
-            "title": v.get("tags") or f"Pixabay {v['id']}",
-            "artist": None,
-            "duration": None,
-            "thumb": v.get("userImageURL") or v.get("previewURL"),
-            "stream_url": "/api/proxy?" + urlencode({"u": direct}),  # <-- changed
-            "source": "pixabay",
-            "license": "Pixabay Content License"
-        })
-    next_page = page + 1 if items else None
-    return {"items": items, "next": str(next_page) if next_page else None}
+async def pixabay_videos_external(request: Request, q: str = "nature", page: int = 1, per_page: int = 10,
+                                  quality: Optional[str] = Query(None, pattern=QUALITY_PATTERN)):
+    async def fetch() -> Dict[str, Any]:
+        j = await pixabay_video_search(normalize_query(q), page, per_page)
+        items = pixabay_external_items(j.hits)
+        next_page = page + 1 if items else None
+        return {"items": items, "next": str(next_page) if next_page else None}
+
+    key = make_key("ext-pixabay", q, page, per_page)
+    base = await search_cache.get_or_fetch(key, fetch)
+    entry = await _with_quality(base, key, select_quality(request, quality, default="medium"), "medium")
+    return cached_response(request, entry, HINT_HEADERS)
 
 # ---- Generic proxy (now accepts u OR url)
 @router.get("/proxy")
@@ -198,14 +408,68 @@ async def proxy(
     request: Request,
     u: Optional[str] = Query(default=None),
     url: Optional[str] = Query(default=None),
+    quality: Optional[str] = Query(default=None, pattern=QUALITY_PATTERN),
 ):
     target = u or url
     if not target:
         raise HTTPException(400, "Missing url (use ?u= or ?url=)")
-    if not host_allowed(target):
+    if quality:
+        # switch to a sibling rendition (e.g. step down mid-session); "auto" uses client hints
+        chosen = select_quality(request, quality, default="")
+        if chosen:
+            target = rendition_registry.switch(target, chosen)
+    if not host_allowed(target, settings.proxy_extra_hosts_list):
         raise HTTPException(400, "Host not allowed")
     return await range_proxy(request, target)
 
+# ---- Artwork / thumbnails through the on-disk image cache
+@router.get("/image")
+async def image(request: Request, u: str = Query(..., min_length=1)):
+    """
+    Cached copy of an allowed image URL. The ETag is the content hash, so
+    browsers keep it for IMAGE_BROWSER_MAX_AGE and revalidate with a local 304.
+    """
+    if not host_allowed(u, settings.proxy_extra_hosts_list):
+        raise HTTPException(400, "Host not allowed")
+    if image_cache is None:
+        return await range_proxy(request, u)
+    entry, body = await image_cache.get(u)
+    headers = {"Cache-Control": f"public, max-age={settings.IMAGE_BROWSER_MAX_AGE}"}
+    if is_not_modified(request, entry.etag, None):
+        return not_modified_response(entry.etag, None, headers)
+    headers.update({"ETag": entry.etag, "X-Content-Type-Options": "nosniff"})
+    return Response(body, media_type=entry.content_type, headers=headers)
+
+# ---- Upstream diagnostics (pool + Audius node health)
+@router.get("/upstream/stats")
+async def upstream_stats() -> Dict[str, Any]:
+    return {
+        "pool": upstream.stats(),
+        "audius_nodes": audius_nodes.stats(),
+        "search_cache": search_cache.stats(),
+        "federation": federation.stats(),
+        "hedging": hedging.stats(),
+        "prefetch": prefetcher.stats() if prefetcher else None,
+        "suggest": suggest_index.stats(),
+        "warmup": warmer.stats() if warmer else None,
+        "stream_urls": stream_urls.stats(),
+        "segment_cache": segment_cache.stats() if segment_cache else None,
+        "image_cache": image_cache.stats() if image_cache else None,
+        "library": library.stats(),
+        "local_media": local_media.stats(),
+        "peaks": peaks.stats() if peaks else None,
+    }
+
+# ---- Streaming diagnostics (in-flight streams, read-ahead, validators)
+@router.get("/stream/stats")
+async def stream_stats() -> Dict[str, Any]:
+    return {
+        "admission": admission.stats(),
+        "readahead": readahead.stats() if readahead else None,
+        "validators": validators.stats(),
+        "renditions": rendition_registry.stats(),
+    }
+
 # ============================================================================
 # COMUNI: Accept username from JSON body OR from ?username= query param
 # ============================================================================
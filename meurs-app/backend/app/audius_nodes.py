@@ -0,0 +1,258 @@
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+import asyncio
+import random
+import time
+
+import httpx
+
+from . import upstream
+from .settings import settings
+
+# ------------------------------
+# Audius discovery-node selection
+# ------------------------------
+# The node list from api.audius.co is fetched in the background and cached
+# with a TTL. Every request through `request()` records latency and errors
+# per node; the fastest healthy node is picked and failures fail over to
+# the next one. A node that keeps failing is put on a cooldown.
+
+EWMA_ALPHA = 0.3
+DEFAULT_LATENCY = 0.5      # optimistic guess for nodes we have not measured yet
+FAILS_BEFORE_COOLDOWN = 3
+COOLDOWN_BASE = 15.0       # seconds, doubled per extra failure
+COOLDOWN_MAX = 300.0
+PROBE_COUNT = 6            # nodes health-checked after each list refresh
+
+
+class NodeStats:
+    def __init__(self) -> None:
+        self.latency: Optional[float] = None   # EWMA seconds
+        self.error_rate = 0.0                  # EWMA of failures (0..1)
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.requests += 1
+        if ok:
+            self.latency = latency if self.latency is None else (
+                EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency)
+            self.error_rate *= (1 - EWMA_ALPHA)
+            self.consecutive_failures = 0
+            self.cooldown_until = 0.0
+        else:
+            self.failures += 1
+            self.error_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_rate
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= FAILS_BEFORE_COOLDOWN:
+                extra = self.consecutive_failures - FAILS_BEFORE_COOLDOWN
+                self.cooldown_until = time.monotonic() + min(COOLDOWN_MAX, COOLDOWN_BASE * (2 ** extra))
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def score(self) -> float:
+        # Lower is better: expected latency inflated by the recent error rate
+        lat = self.latency if self.latency is not None else DEFAULT_LATENCY
+        return lat * (1 + 10 * self.error_rate)
+
+    def public(self, now: float) -> Dict[str, Any]:
+        return {
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "requests": self.requests,
+            "failures": self.failures,
+            "healthy": self.healthy(now),
+        }
+
+
+async def fetch_audius_nodes() -> List[str]:
+    r = await upstream.client(settings.AUDIUS_API).get(settings.AUDIUS_API, timeout=10)
+    r.raise_for_status()
+    return [str(h).rstrip("/") for h in (r.json().get("data") or []) if h]
+
+
+class DiscoveryNodes:
+    def __init__(
+        self,
+        fetch_nodes: Optional[Callable[[], Awaitable[List[str]]]] = None,
+        static_nodes: Optional[List[str]] = None,
+        ttl: float = 600.0,
+        attempts: int = 3,
+        probe: bool = True,
+    ):
+        """
+        fetch_nodes: coroutine returning the node list (default: api.audius.co).
+        static_nodes: fixed node list (no fetching at all) for offline/testing use.
+        """
+        self.fetch_nodes = fetch_nodes or fetch_audius_nodes
+        self.static_nodes = [n.rstrip("/") for n in (static_nodes or []) if n]
+        self.ttl = ttl
+        self.attempts = max(1, attempts)
+        self.probe = probe
+        self.hosts: List[str] = list(self.static_nodes)
+        self.stats_by_host: Dict[str, NodeStats] = {h: NodeStats() for h in self.hosts}
+        self.fetched_at = time.monotonic() if self.static_nodes else 0.0
+        self.last_refresh_error: Optional[str] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._probe_task: Optional[asyncio.Task] = None
+
+    # ---- node list ------------------------------------------------------
+    def _expired(self) -> bool:
+        return not self.hosts or time.monotonic() - self.fetched_at > self.ttl
+
+    async def refresh(self, force: bool = False) -> List[str]:
+        if self.static_nodes:
+            return self.hosts
+        async with self._lock:
+            if not force and not self._expired():
+                return self.hosts
+            try:
+                hosts = await self.fetch_nodes()
+            except Exception as e:
+                # Keep serving the previous (stale) list if we have one
+                self.last_refresh_error = str(e) or type(e).__name__
+                if not self.hosts:
+                    raise
+                self.fetched_at = time.monotonic() - self.ttl / 2  # retry sooner
+                return self.hosts
+            if hosts:
+                self.hosts = hosts
+                self.stats_by_host = {h: self.stats_by_host.get(h) or NodeStats() for h in hosts}
+                self.fetched_at = time.monotonic()
+                self.last_refresh_error = None
+        if self.probe and (self._probe_task is None or self._probe_task.done()):
+            # in the background: picking a node never waits for health checks
+            self._probe_task = asyncio.create_task(self._probe())
+        return self.hosts
+
+    async def _probe(self) -> None:
+        """Seed latency for a few unmeasured nodes with a cheap health check."""
+        fresh = [h for h in self.hosts if self.stats_by_host[h].latency is None]
+        sample = random.sample(fresh, min(PROBE_COUNT, len(fresh)))
+
+        async def check(host: str) -> None:
+            t0 = time.monotonic()
+            try:
+                r = await upstream.client(host).get(f"{host}/health_check", timeout=5)
+                self.record(host, time.monotonic() - t0, r.status_code < 500)
+            except httpx.HTTPError:
+                self.record(host, time.monotonic() - t0, False)
+
+        await asyncio.gather(*(check(h) for h in sample))
+
+    # ---- selection ------------------------------------------------------
+    def ranked(self) -> List[str]:
+        """Healthy nodes, fastest first; cooled-down nodes only as a last resort."""
+        now = time.monotonic()
+        hosts = sorted(self.hosts, key=lambda h: self.stats_by_host[h].score())
+        healthy = [h for h in hosts if self.stats_by_host[h].healthy(now)]
+        return healthy + [h for h in hosts if h not in healthy]
+
+    async def pick(self) -> str:
+        if self._expired():
+            await self.refresh()
+        ranked = self.ranked()
+        if not ranked:
+            raise httpx.ConnectError("No Audius discovery nodes available")
+        return ranked[0]
+
+    def record(self, host: str, latency: float, ok: bool) -> None:
+        st = self.stats_by_host.get(host)
+        if st is not None:
+            st.record(latency, ok)
+
+    def degraded(self) -> bool:
+        """Every known node is cooling down. An empty list (not fetched yet) is unknown, not degraded."""
+        now = time.monotonic()
+        return bool(self.hosts) and not any(self.stats_by_host[h].healthy(now) for h in self.hosts)
+
+    async def request(self, method: str, path: str, hedger=None, **kwargs) -> httpx.Response:
+        """
+        Send `path` to the best node, failing over to the next one on
+        transport errors, 5xx and 429. Other statuses are returned as-is.
+        With a `hedger` (hedging.Hedger), a slow first attempt is raced
+        against a second one that starts on the next-best node.
+        """
+        if self._expired():
+            await self.refresh()
+        candidates = self.ranked()[: self.attempts]
+        if not candidates:
+            raise httpx.ConnectError("No Audius discovery nodes available")
+        if hedger is None:
+            return await self._request_on(candidates, method, path, **kwargs)
+        alternate = candidates[1:] + candidates[:1]   # a single node just gets retried
+        return await hedger.run(
+            lambda: self._request_on(candidates, method, path, **kwargs),
+            lambda: self._request_on(alternate, method, path, **kwargs),
+        )
+
+    async def _request_on(self, candidates: List[str], method: str, path: str, **kwargs) -> httpx.Response:
+        last_exc: Optional[Exception] = None
+        resp: Optional[httpx.Response] = None
+        for host in candidates:
+            t0 = time.monotonic()
+            try:
+                resp = await upstream.client(host).request(method, f"{host}{path}", **kwargs)
+            except httpx.TransportError as e:
+                self.record(host, time.monotonic() - t0, False)
+                last_exc = e
+                continue
+            ok = resp.status_code < 500 and resp.status_code != 429
+            self.record(host, time.monotonic() - t0, ok)
+            if ok:
+                return resp
+        if resp is not None:
+            return resp
+        raise last_exc  # type: ignore[misc]
+
+    # ---- background refresh ---------------------------------------------
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh(force=True)
+            except Exception:
+                pass
+            # small jitter so multiple workers don't refresh in lockstep
+            await asyncio.sleep(self.ttl * random.uniform(0.8, 1.0))
+
+    def start(self) -> None:
+        if self.static_nodes or (self._task and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        for task in (self._task, self._probe_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._task = self._probe_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "static": bool(self.static_nodes),
+            "age_s": round(now - self.fetched_at, 1) if self.fetched_at else None,
+            "last_refresh_error": self.last_refresh_error,
+            "ranked": self.ranked()[:5],
+            "nodes": {h: self.stats_by_host[h].public(now) for h in self.hosts},
+        }
+
+
+def _static_from_settings() -> List[str]:
+    raw = settings.AUDIUS_NODES or ""
+    return [h.strip() for h in raw.split(",") if h.strip()]
+
+
+# Shared instance used by services.py; AUDIUS_NODES=http://127.0.0.1:9000 pins it offline
+audius_nodes = DiscoveryNodes(
+    static_nodes=_static_from_settings(),
+    ttl=settings.AUDIUS_NODES_TTL,
+    attempts=settings.AUDIUS_NODE_ATTEMPTS,
+)
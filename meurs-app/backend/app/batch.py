@@ -0,0 +1,133 @@
+from __future__ import annotations
+from typing import Dict, Any, List, Optional
+import asyncio
+import re
+
+import httpx
+import msgspec
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+
+from .schemas import BatchItem, BatchRequest
+from .settings import settings
+
+# ------------------------------
+# /api/batch: several GETs in one round-trip
+# ------------------------------
+# Sub-requests are dispatched in-process through the ASGI app itself
+# (httpx.ASGITransport), so they go through the normal routes, share the
+# upstream pool and every cache, and see the caller's client address for
+# admission control. Only JSON GET endpoints on the list below are allowed;
+# media streams and /api/batch itself are not. Bodies are spliced into the
+# reply as raw JSON without being decoded again.
+
+BATCHABLE = [re.compile(p) for p in (
+    r"/api/search",
+    r"/api/search/(music|videos|suggest)",
+    r"/api/external/(music/audius|videos/pixabay)",
+    r"/api/(music|videos)",
+    r"/api/comuni/rooms/[^/]+",
+    r"/api/(upstream|stream)/stats",
+)]
+
+# Client hints / validators a sub-request may carry; everything else is dropped
+FORWARD_HEADERS = {
+    "if-none-match", "accept-language", "save-data", "downlink", "viewport-width", "ect",
+}
+
+
+class SubResponse(msgspec.Struct):
+    id: str
+    status: int
+    etag: Optional[str] = None
+    cache_control: Optional[str] = None
+    body: Optional[msgspec.Raw] = None
+    error: Optional[str] = None
+
+
+def batchable(path: str) -> bool:
+    return any(p.fullmatch(path) for p in BATCHABLE)
+
+
+def _sub_headers(request: Request, item: BatchItem) -> Dict[str, str]:
+    headers = {k: v for k, v in request.headers.items() if k in FORWARD_HEADERS - {"if-none-match"}}
+    headers.update({k.lower(): v for k, v in item.headers.items() if k.lower() in FORWARD_HEADERS})
+    return headers
+
+
+async def _run_one(client: httpx.AsyncClient, request: Request, item: BatchItem) -> SubResponse:
+    try:
+        r = await asyncio.wait_for(
+            client.get(item.path, params=item.params, headers=_sub_headers(request, item)),
+            settings.BATCH_TIMEOUT,
+        )
+    except asyncio.TimeoutError:
+        return SubResponse(id=item.id, status=504, error="timeout")
+    except httpx.HTTPError as e:
+        return SubResponse(id=item.id, status=502, error=type(e).__name__)
+    except Exception as e:
+        # ASGITransport re-raises a route's unhandled exception; it fails this item only
+        return SubResponse(id=item.id, status=500, error=type(e).__name__)
+
+    out = SubResponse(
+        id=item.id,
+        status=r.status_code,
+        etag=r.headers.get("etag"),
+        cache_control=r.headers.get("cache-control"),
+    )
+    if r.content and "json" in r.headers.get("content-type", ""):
+        out.body = msgspec.Raw(r.content)
+    elif r.status_code != 304:
+        out.error = "non-JSON response"
+    return out
+
+
+def _client(request: Request) -> httpx.AsyncClient:
+    peer = (request.client.host, request.client.port) if request.client else ("127.0.0.1", 0)
+    transport = httpx.ASGITransport(app=request.app, client=peer)
+    return httpx.AsyncClient(transport=transport, base_url="http://batch",
+                             timeout=settings.BATCH_TIMEOUT)
+
+
+router = APIRouter()
+
+
+@router.post("/batch")
+async def batch(request: Request, body: BatchRequest):
+    """
+    Run up to BATCH_MAX_REQUESTS GET sub-requests concurrently in-process.
+    Body: {"requests": [{"id", "path", "params"?, "headers"?}], "stream": false}
+    Returns {"responses": {id: {status, etag, cache_control, body}}}; with
+    "stream": true, NDJSON lines in completion order instead.
+    """
+    items: List[BatchItem] = body.requests
+    if not items:
+        raise HTTPException(400, "No requests")
+    if len(items) > settings.BATCH_MAX_REQUESTS:
+        raise HTTPException(413, f"At most {settings.BATCH_MAX_REQUESTS} requests per batch")
+    ids = [i.id for i in items]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(400, "Request ids must be unique")
+    for item in items:
+        if not batchable(item.path):
+            raise HTTPException(400, f"Path not allowed in a batch: {item.path}")
+
+    if body.stream:
+        async def lines():
+            async with _client(request) as client:
+                tasks = [asyncio.create_task(_run_one(client, request, i)) for i in items]
+                try:
+                    for fut in asyncio.as_completed(tasks):
+                        yield msgspec.json.encode(await fut) + b"\n"
+                finally:
+                    for t in tasks:
+                        t.cancel()
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson",
+                                 headers={"Cache-Control": "no-store"})
+
+    async with _client(request) as client:
+        results = await asyncio.gather(*(_run_one(client, request, i) for i in items))
+    payload: Dict[str, Any] = {"responses": {r.id: r for r in results}}
+    return Response(msgspec.json.encode(payload), media_type="application/json",
+                    headers={"Cache-Control": "no-store"})
@@ -0,0 +1,100 @@
+from __future__ import annotations
+from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+import time
+
+from fastapi import Request, Response
+
+from .utils import etag_matches
+
+# ------------------------------
+# Conditional requests for the media proxy
+# ------------------------------
+# Validators (ETag / Last-Modified) seen for proxied objects are remembered
+# for a while so If-None-Match / If-Modified-Since can be answered with a
+# local 304 without contacting the CDN. If-Range is evaluated against the
+# same validators: a mismatch means "send the whole object", not the range.
+
+Validators = Tuple[Optional[str], Optional[str]]   # (etag, last_modified)
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def is_not_modified(request: Request, etag: Optional[str], last_modified: Optional[str]) -> bool:
+    """RFC 9110 evaluation order: If-None-Match wins over If-Modified-Since."""
+    inm = request.headers.get("if-none-match")
+    if inm:
+        return etag_matches(inm, etag)
+    ims = _http_date(request.headers.get("if-modified-since"))
+    lm = _http_date(last_modified)
+    return ims is not None and lm is not None and lm <= ims
+
+
+def if_range_matches(request: Request, etag: Optional[str], last_modified: Optional[str]) -> bool:
+    """True if the Range header should be honored (no If-Range, or it still matches)."""
+    value = (request.headers.get("if-range") or "").strip()
+    if not value:
+        return True
+    if value.startswith('"') or value.startswith("W/"):
+        # strong comparison: weak tags never satisfy If-Range
+        return bool(etag) and not value.startswith("W/") and not etag.startswith("W/") and value == etag
+    return bool(last_modified) and _http_date(value) is not None and _http_date(value) == _http_date(last_modified)
+
+
+def not_modified_response(etag: Optional[str], last_modified: Optional[str],
+                          extra: Optional[Dict[str, str]] = None) -> Response:
+    headers = dict(extra or {})
+    if etag:
+        headers["etag"] = etag
+    if last_modified:
+        headers["last-modified"] = last_modified
+    return Response(status_code=304, headers=headers)
+
+
+CONDITIONAL_HEADERS = ("if-none-match", "if-modified-since", "if-range")
+
+
+def forward_conditionals(request: Request) -> Dict[str, str]:
+    return {h: request.headers[h] for h in CONDITIONAL_HEADERS if h in request.headers}
+
+
+class ValidatorCache:
+    """Recently seen validators per proxied object (bounded LRU with TTL)."""
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, Tuple[Optional[str], Optional[str], float]]" = OrderedDict()
+        self.local_304 = 0
+
+    def remember(self, key: str, headers) -> None:
+        etag, lm = headers.get("etag"), headers.get("last-modified")
+        if not etag and not lm:
+            return
+        self.entries[key] = (etag, lm, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Validators]:
+        hit = self.entries.get(key)
+        if hit is None:
+            return None
+        if hit[2] < time.monotonic():
+            del self.entries[key]
+            return None
+        return hit[0], hit[1]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self.entries), "local_304": self.local_304}
+
+
+validators = ValidatorCache()
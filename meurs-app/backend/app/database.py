@@ -1,14 +1,70 @@
 # backend/app/database.py  (only the URL line needs adjusting)
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+from .settings import settings
+
 DB_DIR = os.getenv("DB_DIR", ".")  # default current backend dir
 os.makedirs(DB_DIR, exist_ok=True)
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(DB_DIR, 'database.db')}"
+DB_PATH = os.path.join(DB_DIR, 'database.db')
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH}"
+
+# ------------------------------
+# SQLite tuning (applied to every new connection, sync and async)
+# ------------------------------
+# WAL lets readers run alongside the single writer (and across uvicorn
+# workers) instead of queueing behind it; synchronous=NORMAL is durable under
+# WAL except for the last commits on power loss; busy_timeout makes a writer
+# wait for the lock instead of failing with "database is locked"; mmap_size
+# serves reads from the page cache without read() copies. Pools are sized for
+# the threadpool (sync handlers) and the event loop (async handlers).
+# SQLite has one writer at a time anyway, so async writes go through their own
+# single-connection engine: they queue in order on the pool instead of
+# sleeping in SQLite's busy handler and retrying.
+
+def _sqlite_pragmas(dbapi_conn, _record) -> None:
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute(f"PRAGMA busy_timeout={int(settings.DB_BUSY_TIMEOUT * 1000)}")
+    cur.execute(f"PRAGMA mmap_size={settings.DB_MMAP_SIZE}")
+    cur.execute(f"PRAGMA cache_size=-{settings.DB_CACHE_KIB}")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.close()
+
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": settings.DB_BUSY_TIMEOUT},
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
 )
+event.listen(engine, "connect", _sqlite_pragmas)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async path (aiosqlite): handlers using get_async_db don't hold a threadpool slot
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args={"timeout": settings.DB_BUSY_TIMEOUT},
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+)
+async_write_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args={"timeout": settings.DB_BUSY_TIMEOUT},
+    pool_size=1,
+    max_overflow=0,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+)
+for _eng in (async_engine, async_write_engine):
+    event.listen(_eng.sync_engine, "connect", _sqlite_pragmas)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession,
+                                       autoflush=False, expire_on_commit=False)
+AsyncWriteSessionLocal = async_sessionmaker(async_write_engine, class_=AsyncSession,
+                                            autoflush=False, expire_on_commit=False)
 Base = declarative_base()
@@ -1,5 +1,6 @@
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from .database import SessionLocal
+from .database import AsyncSessionLocal, AsyncWriteSessionLocal, SessionLocal
 from .settings import settings
 
 def get_db():
@@ -9,5 +10,20 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    db: AsyncSession = AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+async def get_async_write_db():
+    # for handlers that write: one connection per worker, so writers queue in order
+    db: AsyncSession = AsyncWriteSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
 def get_settings():
     return settings
@@ -0,0 +1,101 @@
+from __future__ import annotations
+from typing import Dict, Any, List, Callable, Awaitable, Tuple
+import asyncio
+import re
+import time
+
+import httpx
+from fastapi import HTTPException
+
+# ------------------------------
+# Federated search: fan out, wait for a deadline, merge
+# ------------------------------
+# Every provider call starts at once. Whatever has answered when the deadline
+# passes is merged; the rest is reported as "timeout" but keeps running in the
+# background, so its result still lands in the search cache for the next
+# request. Ranking mixes a simple query/text match with each provider's own
+# order, which interleaves sources instead of listing one after the other.
+
+Provider = Callable[[], Awaitable[List[Dict[str, Any]]]]
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def _tokens(s: str) -> set:
+    return {t for t in _WORD.findall(s.lower()) if t}
+
+
+def relevance(q_tokens: set, item: Dict[str, Any]) -> float:
+    """Share of query words found in the item's title/artist (0..1)."""
+    if not q_tokens:
+        return 0.0
+    text = " ".join(str(item.get(k) or "") for k in ("title", "artist"))
+    return len(q_tokens & _tokens(text)) / len(q_tokens)
+
+
+def merge_ranked(results: Dict[str, List[Dict[str, Any]]], q: str, limit: int) -> List[Dict[str, Any]]:
+    q_tokens = _tokens(q)
+    scored: List[Tuple[float, int, int, Dict[str, Any]]] = []
+    seen = set()
+    for p_idx, items in enumerate(results.values()):
+        for pos, item in enumerate(items):
+            key = (item.get("source"), item.get("id"))
+            if key in seen:
+                continue
+            seen.add(key)
+            score = 2.0 * relevance(q_tokens, item) + 1.0 / (1 + pos)
+            scored.append((-score, pos, p_idx, item))
+    scored.sort(key=lambda t: t[:3])
+    return [t[3] for t in scored[:limit]]
+
+
+class Federation:
+    def __init__(self):
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, name: str, status: str) -> None:
+        per = self.counts.setdefault(name, {})
+        per[status] = per.get(status, 0) + 1
+
+    async def fan_out(self, providers: Dict[str, Provider], deadline: float
+                      ) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, Dict[str, Any]]]:
+        """Run all providers concurrently; return (results, status) at the deadline."""
+        started = time.monotonic()
+        tasks = {asyncio.create_task(call()): name for name, call in providers.items()}
+        done_at: Dict[str, float] = {}
+        for task, name in tasks.items():
+            task.add_done_callback(
+                lambda t, name=name: done_at.setdefault(name, time.monotonic() - started))
+        if tasks:
+            await asyncio.wait(tasks, timeout=deadline)
+
+        results: Dict[str, List[Dict[str, Any]]] = {}
+        status: Dict[str, Dict[str, Any]] = {}
+        for task, name in tasks.items():
+            if not task.done():
+                # keep going: the search cache picks the result up when it lands
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                status[name] = {"status": "timeout", "ms": int(deadline * 1000)}
+            elif task.exception() is not None:
+                status[name] = {"status": "error", "error": _describe(task.exception()),
+                                "ms": int(done_at.get(name, 0) * 1000)}
+            else:
+                results[name] = task.result()
+                status[name] = {"status": "ok", "count": len(results[name]),
+                                "ms": int(done_at.get(name, 0) * 1000)}
+            self._count(name, status[name]["status"])
+        return results, status
+
+    def stats(self) -> Dict[str, Any]:
+        return {"providers": {k: dict(v) for k, v in self.counts.items()}}
+
+
+def _describe(exc: BaseException) -> str:
+    if isinstance(exc, HTTPException):
+        return f"{exc.status_code}: {exc.detail}"
+    if isinstance(exc, httpx.HTTPStatusError):
+        return f"upstream {exc.response.status_code}"
+    return type(exc).__name__
+
+
+federation = Federation()
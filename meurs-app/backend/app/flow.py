@@ -0,0 +1,77 @@
+from __future__ import annotations
+from typing import Dict, Any, AsyncIterator
+import time
+
+from .settings import settings
+
+# ------------------------------
+# Backpressure-aware chunking for streamed media
+# ------------------------------
+# The time a `yield` stays suspended is the time the ASGI server needed to
+# hand the chunk to the client socket (uvicorn's send waits while the
+# transport buffer is full). That gives a per-stream drain rate, which sets
+# the next chunk size: large for fast consumers, small for slow ones. Bytes
+# are only pulled from upstream while the local buffer is below one chunk,
+# so a stream never holds more than STREAM_BUFFER_CEILING bytes and a slow
+# client pauses the upstream read instead of piling data up in memory.
+
+UPSTREAM_READ_SIZE = 64 * 1024     # bytes per upstream/disk pull
+EWMA_ALPHA = 0.3
+
+
+class StreamPacer:
+    def __init__(self, min_chunk: int = 16 * 1024, max_chunk: int = 512 * 1024,
+                 ceiling: int = 1 << 20, target_interval: float = 0.25):
+        self.ceiling = max(ceiling, min_chunk + UPSTREAM_READ_SIZE)
+        self.min_chunk = min_chunk
+        self.max_chunk = max(min_chunk, min(max_chunk, self.ceiling - UPSTREAM_READ_SIZE))
+        self.target_interval = target_interval   # aim for roughly this much time per send
+        self.rate: float = 0.0                    # EWMA bytes/sec to the client
+        self.started = time.monotonic()
+        self.bytes_sent = 0
+        self.peak_buffer = 0
+
+    def chunk_size(self) -> int:
+        if self.rate <= 0:
+            return self.min_chunk * 4   # unknown yet: start modest
+        want = int(self.rate * self.target_interval)
+        return max(self.min_chunk, min(self.max_chunk, want))
+
+    def record(self, nbytes: int, seconds: float) -> None:
+        self.bytes_sent += nbytes
+        inst = nbytes / max(seconds, 1e-4)
+        self.rate = inst if self.rate <= 0 else EWMA_ALPHA * inst + (1 - EWMA_ALPHA) * self.rate
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = max(time.monotonic() - self.started, 1e-3)
+        return {
+            "rate_bps": int(self.rate),
+            "avg_bps": int(self.bytes_sent / elapsed),
+            "chunk": self.chunk_size(),
+            "peak_buffer": self.peak_buffer,
+        }
+
+
+async def paced(source: AsyncIterator[bytes], pacer: StreamPacer) -> AsyncIterator[bytes]:
+    """Re-chunk `source` to the pacer's adaptive size, pulling only when the buffer has room."""
+    buf = bytearray()
+    async for chunk in source:
+        buf += chunk
+        pacer.peak_buffer = max(pacer.peak_buffer, len(buf))
+        while len(buf) >= pacer.chunk_size():
+            n = pacer.chunk_size()
+            out = bytes(buf[:n])
+            del buf[:n]
+            t0 = time.monotonic()
+            yield out
+            pacer.record(len(out), time.monotonic() - t0)
+    if buf:
+        yield bytes(buf)
+
+
+def new_pacer() -> StreamPacer:
+    return StreamPacer(
+        min_chunk=settings.STREAM_MIN_CHUNK,
+        max_chunk=settings.STREAM_MAX_CHUNK,
+        ceiling=settings.STREAM_BUFFER_CEILING,
+    )
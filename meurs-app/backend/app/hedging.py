@@ -0,0 +1,127 @@
+from __future__ import annotations
+from typing import Dict, Any, Optional, Callable, Awaitable, TypeVar
+from collections import deque
+import asyncio
+import time
+
+from .settings import settings
+
+# ------------------------------
+# Hedged requests
+# ------------------------------
+# If the first attempt has not answered after the recent p95 (or whichever
+# HEDGE_PERCENTILE) latency of the same operation, a second attempt is sent
+# (another Audius node, or a plain retry for Pixabay) and the first to
+# succeed wins; the other is cancelled. Hedges draw from a token bucket that
+# refills by HEDGE_BUDGET per call, so hedging adds at most that share of
+# extra upstream requests on average.
+
+T = TypeVar("T")
+
+MIN_SAMPLES = 20           # below this the delay stays at max_delay
+BUCKET_MAX = 10.0          # hedges that may fire back to back after a quiet period
+
+
+class Hedger:
+    def __init__(self, name: str, percentile: float = 0.95, min_delay: float = 0.05,
+                 max_delay: float = 2.0, budget: float = 0.1, window: int = 512):
+        self.name = name
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.samples: "deque[float]" = deque(maxlen=window)
+        self.tokens = BUCKET_MAX
+        self.calls = self.hedged = self.hedge_wins = self.no_budget = 0
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def delay(self) -> float:
+        if len(self.samples) < MIN_SAMPLES:
+            return self.max_delay
+        ordered = sorted(self.samples)
+        value = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+        return max(self.min_delay, min(self.max_delay, value))
+
+    def _take_token(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        self.no_budget += 1
+        return False
+
+    async def _timed(self, call: Callable[[], Awaitable[T]]) -> T:
+        t0 = time.monotonic()
+        result = await call()
+        self.observe(time.monotonic() - t0)
+        return result
+
+    async def run(self, primary: Callable[[], Awaitable[T]], hedge: Callable[[], Awaitable[T]]) -> T:
+        """Await `primary`; past the hedge delay also start `hedge` and take the first success."""
+        self.calls += 1
+        self.tokens = min(BUCKET_MAX, self.tokens + self.budget)
+        started = time.monotonic()
+        first = asyncio.create_task(self._timed(primary))
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.delay())
+            if done or not self._take_token():
+                return await first
+            self.hedged += 1
+            second = asyncio.create_task(self._timed(hedge))
+            pending = {first, second}
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            if task is second:
+                                self.hedge_wins += 1
+                            return task.result()
+                # both failed: surface the primary's error
+                return first.result()
+            finally:
+                if not first.done():
+                    # a lost primary still tells us the first attempt was at least this slow
+                    self.observe(time.monotonic() - started)
+                for task in (first, second):
+                    if not task.done():
+                        task.cancel()
+        finally:
+            if not first.done():
+                first.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.calls, 4) if self.calls else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "no_budget": self.no_budget,
+            "delay_ms": round(self.delay() * 1000, 1),
+            "samples": len(self.samples),
+        }
+
+
+def _hedger(name: str) -> Hedger:
+    return Hedger(
+        name,
+        percentile=settings.HEDGE_PERCENTILE,
+        min_delay=settings.HEDGE_MIN_DELAY,
+        max_delay=settings.HEDGE_MAX_DELAY,
+        budget=settings.HEDGE_BUDGET,
+    )
+
+
+# One per operation, so search latency doesn't set the delay for stream resolves
+hedgers: Dict[str, Hedger] = {
+    name: _hedger(name) for name in ("audius_search", "audius_resolve", "pixabay_search")
+} if settings.HEDGE_ENABLED else {}
+
+
+def hedger(name: str) -> Optional[Hedger]:
+    return hedgers.get(name)
+
+
+def stats() -> Dict[str, Any]:
+    return {name: h.stats() for name, h in hedgers.items()}
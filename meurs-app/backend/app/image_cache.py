@@ -0,0 +1,272 @@
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import asyncio
+import hashlib
+import os
+import sqlite3
+import time
+
+import httpx
+from fastapi import HTTPException
+
+from . import upstream
+from .database import DB_DIR
+from .settings import settings
+
+# ------------------------------
+# On-disk artwork / thumbnail cache for /api/image
+# ------------------------------
+# Images are stored content-addressed (<sha256>.bin) so the same picture
+# behind several URLs is kept once, and the digest doubles as a strong
+# ETag: the browser can cache /api/image?u=... for a long time and
+# revalidate for free. A SQLite index maps source URL -> digest, type and
+# the CDN's own validators. Entries older than IMAGE_REVALIDATE_AFTER are
+# still served, while a background conditional GET (If-None-Match /
+# If-Modified-Since) checks them upstream. Concurrent misses for one URL
+# share a single fetch; least recently used URLs are dropped past the cap.
+# The URL/refcount maps are only touched on the event loop; blob writes,
+# blob deletes and index writes run in order on one disk thread, so a
+# delete queued for a digest can't overtake a later write of the same one.
+
+ACCESS_PERSIST_INTERVAL = 60.0   # seconds between last_access writes per entry
+
+
+class ImageEntry:
+    __slots__ = ("url", "digest", "content_type", "size", "upstream_etag", "last_modified",
+                 "fetched_at", "last_access", "persisted_access")
+
+    def __init__(self, url: str, digest: str, content_type: str, size: int,
+                 upstream_etag: Optional[str], last_modified: Optional[str],
+                 fetched_at: float, last_access: Optional[float] = None):
+        self.url = url
+        self.digest = digest
+        self.content_type = content_type
+        self.size = size
+        self.upstream_etag = upstream_etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.last_access = last_access or time.time()
+        self.persisted_access = self.last_access
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.digest[:32]}"'
+
+
+class ImageCache:
+    def __init__(self, root: Path, max_bytes: int = 256 << 20, max_object: int = 5 << 20,
+                 revalidate_after: float = 86_400.0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_object = max_object
+        self.revalidate_after = revalidate_after
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_path = str(root / "index.db")
+        self.entries: Dict[str, ImageEntry] = {}
+        self.refs: Dict[str, int] = {}          # digest -> URLs pointing at it
+        self.bytes = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._disk = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-cache")
+        self.hits = self.misses = self.coalesced = self.revalidated = self.evictions = 0
+        self._load_index()
+
+    # ---- index ----------------------------------------------------------
+    def _db(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.index_path, timeout=5)
+
+    def _load_index(self) -> None:
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS images ("
+                " url TEXT PRIMARY KEY, digest TEXT NOT NULL, content_type TEXT NOT NULL,"
+                " size INTEGER NOT NULL, upstream_etag TEXT, last_modified TEXT,"
+                " fetched_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            for row in db.execute("SELECT * FROM images"):
+                entry = ImageEntry(*row)
+                if self.blob_path(entry.digest).exists():
+                    self._link(entry)
+
+    def _save(self, entry: ImageEntry) -> None:
+        with self._db() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry.url, entry.digest, entry.content_type, entry.size, entry.upstream_etag,
+                 entry.last_modified, entry.fetched_at, entry.last_access),
+            )
+        entry.persisted_access = entry.last_access
+
+    def _drop(self, urls: List[str], digests: List[str]) -> None:
+        for digest in digests:
+            self.blob_path(digest).unlink(missing_ok=True)
+        if urls:
+            with self._db() as db:
+                db.executemany("DELETE FROM images WHERE url = ?", [(u,) for u in urls])
+
+    async def _on_disk(self, fn, *args) -> None:
+        await asyncio.get_running_loop().run_in_executor(self._disk, fn, *args)
+
+    # ---- storage --------------------------------------------------------
+    def blob_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / f"{digest}.bin"
+
+    def _link(self, entry: ImageEntry) -> None:
+        self.entries[entry.url] = entry
+        if self.refs.get(entry.digest, 0) == 0:
+            self.bytes += entry.size
+        self.refs[entry.digest] = self.refs.get(entry.digest, 0) + 1
+
+    def _unlink(self, entry: ImageEntry) -> Optional[str]:
+        """Drop `entry` from memory; returns its digest once no URL points at the blob."""
+        if self.entries.get(entry.url) is entry:
+            del self.entries[entry.url]
+        left = self.refs.get(entry.digest, 1) - 1
+        if left > 0:
+            self.refs[entry.digest] = left
+            return None
+        self.refs.pop(entry.digest, None)
+        self.bytes -= entry.size
+        return entry.digest
+
+    def _write_blob(self, digest: str, body: bytes) -> None:
+        path = self.blob_path(digest)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(body)
+        os.replace(tmp, path)
+
+    def _read_blob(self, digest: str) -> Optional[bytes]:
+        try:
+            return self.blob_path(digest).read_bytes()
+        except OSError:
+            return None
+
+    async def _evict(self, keep: Optional[ImageEntry] = None) -> None:
+        """Drop least recently used URLs down to 90% of the cap, never the blob of `keep`."""
+        target = int(self.max_bytes * 0.9)
+        urls: List[str] = []
+        digests: List[str] = []
+        for entry in sorted(self.entries.values(), key=lambda e: e.last_access):
+            if self.bytes <= target:
+                break
+            if keep is not None and entry.digest == keep.digest:
+                continue
+            dead = self._unlink(entry)
+            if dead is not None:
+                digests.append(dead)
+            urls.append(entry.url)
+            self.evictions += 1
+        if urls:
+            await self._on_disk(self._drop, urls, digests)
+
+    # ---- fetching -------------------------------------------------------
+    async def _fetch(self, url: str, previous: Optional[ImageEntry]) -> ImageEntry:
+        headers: Dict[str, str] = {}
+        if previous is not None:
+            if previous.upstream_etag:
+                headers["If-None-Match"] = previous.upstream_etag
+            if previous.last_modified:
+                headers["If-Modified-Since"] = previous.last_modified
+        try:
+            async with upstream.client(url).stream("GET", url, headers=headers, follow_redirects=True) as r:
+                if r.status_code == 304 and previous is not None:
+                    previous.fetched_at = time.time()
+                    await self._on_disk(self._save, previous)
+                    self.revalidated += 1
+                    return previous
+                if r.status_code >= 400:
+                    raise HTTPException(404 if r.status_code in (404, 410) else 502,
+                                        f"Image upstream returned {r.status_code}")
+                ctype = r.headers.get("content-type", "").split(";")[0].strip().lower()
+                if not ctype.startswith("image/"):
+                    raise HTTPException(502, "Upstream did not return an image")
+                if int(r.headers.get("content-length") or 0) > self.max_object:
+                    raise HTTPException(502, "Image too large")
+                chunks, total = [], 0
+                async for chunk in r.aiter_bytes():
+                    total += len(chunk)
+                    if total > self.max_object:
+                        raise HTTPException(502, "Image too large")
+                    chunks.append(chunk)
+        except httpx.HTTPError as e:
+            raise HTTPException(502, f"Image upstream error: {type(e).__name__}")
+
+        body = b"".join(chunks)
+        digest = hashlib.sha256(body).hexdigest()
+        await self._on_disk(self._write_blob, digest, body)
+        entry = ImageEntry(url, digest, ctype, len(body), r.headers.get("etag"),
+                           r.headers.get("last-modified"), time.time())
+        old = self.entries.get(url)
+        self._link(entry)       # before unlinking `old`: with unchanged bytes they share the blob
+        dead = self._unlink(old) if old is not None else None
+        if dead is not None:
+            await self._on_disk(self._drop, [], [dead])
+        await self._on_disk(self._save, entry)
+        if self.bytes > self.max_bytes:
+            await self._evict(entry)
+        return entry
+
+    def _single_flight(self, url: str, previous: Optional[ImageEntry]) -> asyncio.Task:
+        task = self._inflight.get(url)
+        if task is not None:
+            self.coalesced += 1
+            return task
+        task = asyncio.create_task(self._fetch(url, previous))
+        self._inflight[url] = task
+        task.add_done_callback(lambda _t: self._inflight.pop(url, None))
+        return task
+
+    def _revalidate(self, entry: ImageEntry) -> None:
+        task = self._single_flight(entry.url, entry)
+        # nobody awaits a background revalidation; keep its errors out of the log
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def get(self, url: str) -> Tuple[ImageEntry, bytes]:
+        """Cached image for `url` (fetched once if missing). Raises HTTPException on upstream trouble."""
+        entry = self.entries.get(url)
+        if entry is not None:
+            body = await asyncio.to_thread(self._read_blob, entry.digest)
+            if body is not None:
+                self.hits += 1
+                entry.last_access = time.time()
+                if entry.last_access - entry.persisted_access > ACCESS_PERSIST_INTERVAL:
+                    await self._on_disk(self._save, entry)
+                if entry.last_access - entry.fetched_at > self.revalidate_after:
+                    self._revalidate(entry)
+                return entry, body
+            self._unlink(entry)       # blob vanished underneath us; refetch (nothing left to delete)
+        self.misses += 1
+        entry = await asyncio.shield(self._single_flight(url, None))
+        body = await asyncio.to_thread(self._read_blob, entry.digest)
+        if body is None:
+            raise HTTPException(503, "Image evicted, retry")
+        return entry, body
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "images": len(self.entries),
+            "blobs": len(self.refs),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "revalidated": self.revalidated,
+            "evictions": self.evictions,
+        }
+
+
+def _build() -> Optional[ImageCache]:
+    if not settings.IMAGE_CACHE_ENABLED:
+        return None
+    root = Path(settings.IMAGE_CACHE_DIR or os.path.join(DB_DIR, "image_cache"))
+    return ImageCache(root, settings.IMAGE_CACHE_MAX_BYTES, settings.IMAGE_MAX_BYTES,
+                      settings.IMAGE_REVALIDATE_AFTER)
+
+
+image_cache = _build()
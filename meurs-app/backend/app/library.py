@@ -0,0 +1,378 @@
+from __future__ import annotations
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+from pathlib import Path
+import asyncio
+import base64
+import mimetypes
+import os
+import random
+import struct
+import threading
+import wave
+from urllib.parse import quote
+
+import msgspec
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import MediaFile
+from .settings import settings
+
+try:
+    import mutagen          # optional: tags/duration for mp3, flac, ogg, m4a, mp4 ...
+except ImportError:
+    mutagen = None
+
+# ------------------------------
+# Local media library index (media/music, media/videos)
+# ------------------------------
+# A background loop walks both directories with os.scandir off the event
+# loop and compares size + mtime against the media_files table; only new or
+# changed files are opened to read tags (mutagen when installed, the RIFF
+# INFO chunk + `wave` for WAV otherwise), and vanished files are deleted.
+# /api/music and /api/videos then read one indexed page from SQLite, with
+# sorting, filters and a keyset cursor, instead of listing the directory.
+# Validators (size, mtime, ETag, type) of every file are also kept in memory
+# so /api/media can answer without touching SQLite. The app waits for the
+# first scan before serving. After that, a list request rescans right away
+# when its directory's mtime moved (entries added, removed or renamed).
+# Files rewritten in place keep the directory mtime, so they wait for the
+# next periodic scan (LIBRARY_SCAN_INTERVAL).
+
+MEDIA_DIR = Path(__file__).resolve().parent.parent / "media"
+KIND_DIRS = {"music": "music", "video": "videos"}
+
+# RIFF INFO ids -> MediaFile columns
+WAV_INFO = {b"INAM": "title", b"IART": "artist", b"IPRD": "album", b"IGNR": "genre", b"ICRD": "year"}
+
+SORTS = {
+    "name": MediaFile.name,
+    "mtime": MediaFile.mtime,
+    "size": MediaFile.size,
+    "title": func.coalesce(MediaFile.title, ""),
+    "artist": func.coalesce(MediaFile.artist, ""),
+    "duration": func.coalesce(MediaFile.duration, 0.0),
+}
+SORT_PATTERN = "^(" + "|".join(SORTS) + ")$"
+
+
+class FileInfo(NamedTuple):
+    size: int
+    mtime: float
+    etag: str
+    mime: Optional[str]
+
+
+def file_etag(size: int, mtime: float) -> str:
+    return f'"{size:x}-{int(mtime * 1_000_000):x}"'
+
+
+def _year(value: Any) -> Optional[int]:
+    digits = str(value or "")[:4]
+    return int(digits) if digits.isdigit() else None
+
+
+def _wav_tags(path: Path) -> Dict[str, Any]:
+    tags: Dict[str, Any] = {}
+    try:
+        with wave.open(str(path), "rb") as w:
+            if w.getframerate():
+                tags["duration"] = w.getnframes() / w.getframerate()
+    except (wave.Error, EOFError, OSError):
+        pass
+    try:
+        with open(path, "rb") as f:
+            head = f.read(12)
+            if head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+                return tags
+            while True:
+                hdr = f.read(8)
+                if len(hdr) < 8:
+                    break
+                cid, size = hdr[:4], struct.unpack("<I", hdr[4:])[0]
+                if cid != b"LIST" or size > 1 << 16:
+                    f.seek(size + (size & 1), os.SEEK_CUR)
+                    continue
+                body = f.read(size)
+                if body[:4] != b"INFO":
+                    continue
+                pos = 4
+                while pos + 8 <= len(body):
+                    sid, n = body[pos:pos + 4], struct.unpack("<I", body[pos + 4:pos + 8])[0]
+                    value = body[pos + 8:pos + 8 + n].split(b"\0", 1)[0].decode("utf-8", "replace").strip()
+                    if sid in WAV_INFO and value:
+                        tags[WAV_INFO[sid]] = value
+                    pos += 8 + n + (n & 1)
+    except OSError:
+        pass
+    return tags
+
+
+def _mutagen_tags(path: Path) -> Dict[str, Any]:
+    try:
+        f = mutagen.File(str(path), easy=True)
+    except Exception:
+        return {}
+    if f is None:
+        return {}
+    tags: Dict[str, Any] = {}
+    length = getattr(getattr(f, "info", None), "length", None)
+    if length:
+        tags["duration"] = float(length)
+    for key in ("title", "artist", "album", "genre"):
+        values = (f.tags or {}).get(key) if f.tags is not None else None
+        if values:
+            tags[key] = str(values[0])
+    if f.tags is not None and f.tags.get("date"):
+        tags["year"] = f.tags["date"][0]
+    return tags
+
+
+def probe(path: Path, mime: Optional[str]) -> Dict[str, Any]:
+    """Tags and duration for one file; whatever could not be read is left out."""
+    tags: Dict[str, Any] = {}
+    if mutagen is not None:
+        tags = _mutagen_tags(path)
+    if not tags and (mime in ("audio/wav", "audio/x-wav") or path.suffix.lower() == ".wav"):
+        tags = _wav_tags(path)
+    if "year" in tags:
+        tags["year"] = _year(tags["year"])
+    return tags
+
+
+def _encode_cursor(value: Any, row_id: int) -> str:
+    return base64.urlsafe_b64encode(msgspec.json.encode([value, row_id])).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[Any, int]:
+    try:
+        value, row_id = msgspec.json.decode(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return value, int(row_id)
+    except (ValueError, TypeError, msgspec.DecodeError):
+        raise HTTPException(400, "Invalid cursor")
+
+
+def item(row: MediaFile) -> Dict[str, Any]:
+    return {
+        "name": row.name,
+        "size": row.size,
+        "mtime": row.mtime,
+        "mime": row.mime,
+        "title": row.title,
+        "artist": row.artist,
+        "album": row.album,
+        "genre": row.genre,
+        "year": row.year,
+        "duration": row.duration,
+        "url": f"/api/media/{KIND_DIRS[row.kind]}/{quote(row.name)}",
+    }
+
+
+class Library:
+    def __init__(self, root: Path = MEDIA_DIR, interval: float = 60.0):
+        self.root = root
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._scan_lock = threading.Lock()    # scans run in worker threads, also from list requests
+        self._dir_mtimes: Dict[str, int] = {}
+        self.files: Dict[Tuple[str, str], FileInfo] = {}     # (kind, name) -> validators
+        self.scans = self.indexed = self.removed = 0
+        self.last_scan: Optional[Dict[str, Any]] = None
+
+    def directory(self, kind: str) -> Path:
+        return self.root / KIND_DIRS[kind]
+
+    # ---- indexing (runs in a worker thread) -----------------------------
+    def _values(self, kind: str, path: Path, st: os.stat_result) -> Dict[str, Any]:
+        mime = mimetypes.guess_type(path.name)[0]
+        return {
+            "kind": kind, "name": path.name, "size": st.st_size, "mtime": st.st_mtime,
+            "mime": mime, "etag": file_etag(st.st_size, st.st_mtime),
+            "title": None, "artist": None, "album": None, "genre": None, "year": None, "duration": None,
+            **probe(path, mime),
+        }
+
+    def _upsert(self, db: Session, row_id: Optional[int], values: Dict[str, Any]) -> None:
+        self.files[(values["kind"], values["name"])] = FileInfo(
+            values["size"], values["mtime"], values["etag"], values["mime"])
+        if row_id is None:
+            db.add(MediaFile(**values))
+        else:
+            db.query(MediaFile).filter(MediaFile.id == row_id).update(values)
+        self.indexed += 1
+
+    def scan_sync(self) -> Dict[str, int]:
+        """Bring media_files in line with the directories; only changed files are probed."""
+        with self._scan_lock:
+            counts = self._scan()
+            self.scans += 1
+            self.last_scan = counts
+        return counts
+
+    def refresh_sync(self, kind: str) -> bool:
+        """Rescan now if `kind`'s directory changed since the last scan (runs in a worker thread)."""
+        try:
+            mtime = os.stat(self.directory(kind)).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._dir_mtimes.get(kind):
+            return False
+        self.scan_sync()
+        return True
+
+    def _scan(self) -> Dict[str, int]:
+        counts = {"seen": 0, "changed": 0, "removed": 0}
+        with SessionLocal() as db:
+            for kind in KIND_DIRS:
+                d = self.directory(kind)
+                d.mkdir(parents=True, exist_ok=True)
+                # taken before listing, so entries added during the scan trigger the next one
+                self._dir_mtimes[kind] = os.stat(d).st_mtime_ns
+                known = {}
+                for row_id, name, size, mtime, etag, mime in db.execute(
+                        select(MediaFile.id, MediaFile.name, MediaFile.size, MediaFile.mtime,
+                               MediaFile.etag, MediaFile.mime).where(MediaFile.kind == kind)):
+                    known[name] = (row_id, size, mtime)
+                    self.files[(kind, name)] = FileInfo(size, mtime, etag, mime)
+                seen = set()
+                with os.scandir(d) as it:
+                    for entry in it:
+                        if entry.name.startswith(".") or not entry.is_file():
+                            continue   # dotfiles include in-progress uploads
+                        st = entry.stat()
+                        seen.add(entry.name)
+                        old = known.get(entry.name)
+                        if old is not None and old[1] == st.st_size and old[2] == st.st_mtime:
+                            continue
+                        self._upsert(db, old[0] if old else None, self._values(kind, Path(entry.path), st))
+                        counts["changed"] += 1
+                gone = [known[name][0] for name in known.keys() - seen]
+                if gone:
+                    db.execute(delete(MediaFile).where(MediaFile.id.in_(gone)))
+                for name in known.keys() - seen:
+                    self.files.pop((kind, name), None)
+                counts["seen"] += len(seen)
+                counts["removed"] += len(gone)
+            db.commit()
+        self.removed += counts["removed"]
+        return counts
+
+    def index_file_sync(self, kind: str, name: str) -> Optional[MediaFile]:
+        """(Re)index a single file right away, e.g. after it was written by the app."""
+        with SessionLocal() as db:
+            row = self.index_into(db, kind, name)
+            db.commit()
+            return row
+
+    def index_into(self, db: Session, kind: str, name: str) -> Optional[MediaFile]:
+        """Like index_file_sync inside the caller's transaction (nothing is committed)."""
+        path = self.directory(kind) / name
+        row = self.get(db, kind, name)
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            self.files.pop((kind, name), None)
+            if row is not None:
+                db.delete(row)
+            return None
+        self._upsert(db, row.id if row else None, self._values(kind, path, st))
+        db.flush()
+        return self.get(db, kind, name)
+
+    async def scan(self) -> Dict[str, int]:
+        async with self._lock:
+            return await asyncio.to_thread(self.scan_sync)
+
+    async def index_file(self, kind: str, name: str) -> Optional[MediaFile]:
+        return await asyncio.to_thread(self.index_file_sync, kind, name)
+
+    # ---- queries --------------------------------------------------------
+    @staticmethod
+    def _filtered(stmt, q: Optional[str], artist: Optional[str], mime: Optional[str]):
+        if q:
+            like = f"%{q}%"
+            stmt = stmt.where(MediaFile.name.ilike(like) | MediaFile.title.ilike(like) | MediaFile.artist.ilike(like))
+        if artist:
+            stmt = stmt.where(MediaFile.artist == artist)
+        if mime:
+            stmt = stmt.where(MediaFile.mime.startswith(mime))
+        return stmt
+
+    def names(self, db: Session, kind: str, sort: str = "name", order: str = "asc",
+              q: Optional[str] = None, artist: Optional[str] = None, mime: Optional[str] = None) -> List[str]:
+        """Every matching file name (the legacy, unpaged list), in (sort, id) order."""
+        key = SORTS[sort]
+        stmt = self._filtered(select(MediaFile.name).where(MediaFile.kind == kind), q, artist, mime)
+        if order == "asc":
+            stmt = stmt.order_by(key.asc(), MediaFile.id.asc())
+        else:
+            stmt = stmt.order_by(key.desc(), MediaFile.id.desc())
+        return list(db.execute(stmt).scalars())
+
+    def page(self, db: Session, kind: str, sort: str = "name", order: str = "asc",
+             q: Optional[str] = None, artist: Optional[str] = None, mime: Optional[str] = None,
+             cursor: Optional[str] = None, limit: int = 100) -> Dict[str, Any]:
+        """One page of `kind` ordered by (sort, id); `next_cursor` continues after its last row."""
+        key = SORTS[sort]
+        stmt = self._filtered(select(MediaFile).where(MediaFile.kind == kind), q, artist, mime)
+        if cursor:
+            value, row_id = _decode_cursor(cursor)
+            after = tuple_(key, MediaFile.id)
+            stmt = stmt.where(after > (value, row_id) if order == "asc" else after < (value, row_id))
+        if order == "asc":
+            stmt = stmt.order_by(key.asc(), MediaFile.id.asc())
+        else:
+            stmt = stmt.order_by(key.desc(), MediaFile.id.desc())
+        rows = db.execute(stmt.limit(limit + 1)).scalars().all()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = None
+        if more:
+            last = rows[-1]
+            value = {"name": last.name, "mtime": last.mtime, "size": last.size, "title": last.title or "",
+                     "artist": last.artist or "", "duration": last.duration or 0.0}[sort]
+            next_cursor = _encode_cursor(value, last.id)
+        return {"items": [item(r) for r in rows], "next_cursor": next_cursor}
+
+    def get(self, db: Session, kind: str, name: str) -> Optional[MediaFile]:
+        return db.execute(select(MediaFile).where(MediaFile.kind == kind, MediaFile.name == name)).scalar_one_or_none()
+
+    # ---- background loop ------------------------------------------------
+    async def _loop(self) -> None:
+        while True:
+            if self.scans:      # the first scan already ran at startup
+                await asyncio.sleep(self.interval * random.uniform(0.8, 1.2))
+            try:
+                await self.scan()
+            except Exception:
+                await asyncio.sleep(self.interval * random.uniform(0.8, 1.2))
+
+    def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "files": len(self.files),
+            "scans": self.scans,
+            "indexed": self.indexed,
+            "removed": self.removed,
+            "last_scan": self.last_scan,
+            "tags": "mutagen" if mutagen is not None else "wav-only",
+        }
+
+
+library = Library(interval=settings.LIBRARY_SCAN_INTERVAL)
@@ -0,0 +1,253 @@
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Tuple, Union
+from collections import OrderedDict
+from pathlib import Path
+import asyncio
+import os
+import secrets
+import time
+
+from fastapi import HTTPException, Request, Response
+
+from .conditional import if_range_matches, is_not_modified, not_modified_response
+from .library import KIND_DIRS, FileInfo, file_etag, library
+from .settings import settings
+from .utils import parse_byte_ranges, resolve_byte_range
+
+# ------------------------------
+# Local media streaming (/api/media/{music|videos}/{name})
+# ------------------------------
+# Validators come from the library index (size, mtime, ETag precomputed by
+# the scanner), so a 304 or a 416 never touches the disk. Whole files go out
+# through the ASGI "http.response.pathsend" extension when the server has it
+# (it opens and sends the file itself). Uvicorn offers no such extension and
+# ranges can't use it, so everything else is read with os.pread in a worker
+# thread, MEDIA_READ_BATCH bytes per thread hop and one body message per
+# batch: disk waits never block the event loop, and a file truncated
+# mid-send only ends that response short. Each read also hints the kernel
+# (POSIX_FADV_WILLNEED) to fetch the next batch. Open fds of hot files are
+# shared by all listeners through a refcounted LRU; pread takes explicit
+# offsets, so concurrent readers never race on a file position. stats()
+# splits responses and bytes by path, so the pread fallback shows up.
+
+READ_BATCH = settings.MEDIA_READ_BATCH
+MAX_RANGES = 16
+
+Part = Union[bytes, Tuple[int, int]]     # literal bytes or (offset, count) of the file
+
+
+class FileHandle:
+    __slots__ = ("key", "path", "fd", "size", "mtime", "etag", "refs", "opened_at", "stale")
+
+    def __init__(self, key: Tuple[str, str], path: Path, fd: int, st: os.stat_result, etag: str):
+        self.key = key
+        self.path = path
+        self.fd = fd
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.etag = etag
+        self.refs = 0
+        self.opened_at = time.monotonic()
+        self.stale = False
+
+    def read(self, offset: int, n: int, ahead: int) -> bytes:
+        """pread `n` bytes at `offset` (runs in a worker thread); hint the next `ahead` bytes."""
+        data = os.pread(self.fd, n, offset)
+        if ahead > 0 and hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(self.fd, offset + n, ahead, os.POSIX_FADV_WILLNEED)
+        return data
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class HandleCache:
+    """(kind, name) -> open fd; handles in use are never closed."""
+
+    def __init__(self, max_open: int = 64, ttl: float = 30.0):
+        self.max_open = max_open
+        self.ttl = ttl        # re-stat hot files this often, so edits on disk are picked up
+        self.handles: "OrderedDict[Tuple[str, str], FileHandle]" = OrderedDict()
+        self.hits = self.opens = 0
+
+    def acquire(self, kind: str, name: str, path: Path, info: Optional[FileInfo]) -> FileHandle:
+        key = (kind, name)
+        h = self.handles.get(key)
+        if h is not None and time.monotonic() - h.opened_at < self.ttl and (
+                info is None or info.etag == h.etag):
+            self.hits += 1
+            self.handles.move_to_end(key)
+            h.refs += 1
+            return h
+        if h is not None:
+            self._retire(h)
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except (FileNotFoundError, IsADirectoryError):
+            raise HTTPException(404, "Not found")
+        st = os.fstat(fd)
+        # trust the index's ETag only while the file is still what was indexed
+        fresh = info is not None and info.size == st.st_size and info.mtime == st.st_mtime
+        h = FileHandle(key, path, fd, st, info.etag if fresh else file_etag(st.st_size, st.st_mtime))
+        self.opens += 1
+        self.handles[key] = h
+        h.refs += 1
+        self._trim()
+        return h
+
+    def release(self, h: FileHandle) -> None:
+        h.refs -= 1
+        if h.refs == 0 and h.stale:
+            h.close()
+
+    def _retire(self, h: FileHandle) -> None:
+        if self.handles.get(h.key) is h:
+            del self.handles[h.key]
+        h.stale = True
+        if h.refs == 0:
+            h.close()
+
+    def _trim(self) -> None:
+        for h in list(self.handles.values()):
+            if len(self.handles) <= self.max_open:
+                break
+            if h.refs == 0:
+                self._retire(h)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "open": len(self.handles),
+            "in_use": sum(1 for h in self.handles.values() if h.refs),
+            "hits": self.hits,
+            "opens": self.opens,
+        }
+
+
+handles = HandleCache(max_open=settings.MEDIA_MAX_OPEN_FILES, ttl=settings.MEDIA_HANDLE_TTL)
+sent = {"pathsend": 0, "pathsend_bytes": 0, "pread": 0, "pread_bytes": 0, "reads": 0, "short": 0}
+
+
+class LocalFileResponse(Response):
+    """Sends `parts` of an open FileHandle; the handle is released when done."""
+
+    def __init__(self, handle: FileHandle, parts: List[Part], status_code: int,
+                 headers: Dict[str, str], media_type: Optional[str], body: bool = True):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.handle = handle
+        self.parts = parts
+        self.send_body = body
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await send({"type": "http.response.start", "status": self.status_code,
+                        "headers": self.raw_headers})
+            if self.send_body and self.parts:
+                await self._send_parts(scope, receive, send)
+            else:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            handles.release(self.handle)
+
+    async def _send_parts(self, scope, receive, send) -> None:
+        ext = scope.get("extensions") or {}
+        h = self.handle
+        if "http.response.pathsend" in ext and self.parts == [(0, h.size)] and not h.stale:
+            sent["pathsend"] += 1
+            sent["pathsend_bytes"] += h.size
+            await send({"type": "http.response.pathsend", "path": str(h.path)})
+            return
+
+        disconnected = asyncio.Event()
+
+        async def watch() -> None:
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        watcher = asyncio.create_task(watch())
+        sent["pread"] += 1
+        try:
+            for part in self.parts:
+                if isinstance(part, bytes):
+                    await send({"type": "http.response.body", "body": part, "more_body": True})
+                    continue
+                offset, count = part
+                end = offset + count
+                while offset < end and not disconnected.is_set():
+                    n = min(READ_BATCH, end - offset)
+                    data = await asyncio.to_thread(h.read, offset, n, min(READ_BATCH, end - offset - n))
+                    sent["reads"] += 1
+                    if not data:
+                        # truncated on disk: the promised length can't be met, so end
+                        # without completing the body and the server drops the connection
+                        sent["short"] += 1
+                        return
+                    await send({"type": "http.response.body", "body": data, "more_body": True})
+                    offset += len(data)
+                    sent["pread_bytes"] += len(data)
+                if disconnected.is_set():
+                    return
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            watcher.cancel()
+
+
+def _resolve(kind: str, name: str) -> Path:
+    if not name or name.startswith(".") or "/" in name or "\\" in name:
+        raise HTTPException(404, "Not found")
+    return library.directory(kind) / name
+
+
+def serve_local(request: Request, folder: str, name: str) -> Response:
+    """Full, single-range and multi-range (multipart/byteranges) responses for one local file."""
+    kind = next(k for k, d in KIND_DIRS.items() if d == folder)
+    info = library.files.get((kind, name))
+    base = {"Accept-Ranges": "bytes", "Cache-Control": "public, max-age=0, must-revalidate"}
+
+    # Validators straight from the index: no open(), no stat()
+    if info is not None and is_not_modified(request, info.etag, None):
+        return not_modified_response(info.etag, None, base)
+
+    h = handles.acquire(kind, name, _resolve(kind, name), info)
+    try:
+        mime = (info.mime if info is not None else None) or "application/octet-stream"
+        headers = dict(base, ETag=h.etag)
+        if is_not_modified(request, h.etag, None):
+            handles.release(h)
+            return not_modified_response(h.etag, None, base)
+        head_only = request.method == "HEAD"
+
+        ranges = parse_byte_ranges(request.headers.get("range"), MAX_RANGES)
+        if ranges is None or not if_range_matches(request, h.etag, None):
+            headers["Content-Length"] = str(h.size)
+            return LocalFileResponse(h, [(0, h.size)] if h.size else [], 200, headers, mime, not head_only)
+
+        resolved = [r for r in (resolve_byte_range(r, h.size) for r in ranges) if r is not None]
+        if not resolved:
+            handles.release(h)
+            return Response(status_code=416, headers={**base, "Content-Range": f"bytes */{h.size}"})
+
+        if len(resolved) == 1:
+            start, end = resolved[0]
+            headers["Content-Range"] = f"bytes {start}-{end}/{h.size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return LocalFileResponse(h, [(start, end - start + 1)], 206, headers, mime, not head_only)
+
+        boundary = secrets.token_hex(12)
+        parts: List[Part] = []
+        for start, end in resolved:
+            parts.append((f"--{boundary}\r\nContent-Type: {mime}\r\n"
+                          f"Content-Range: bytes {start}-{end}/{h.size}\r\n\r\n").encode())
+            parts.append((start, end - start + 1))
+            parts.append(b"\r\n")
+        parts.append(f"--{boundary}--\r\n".encode())
+        headers["Content-Length"] = str(sum(len(p) if isinstance(p, bytes) else p[1] for p in parts))
+        return LocalFileResponse(h, parts, 206, headers, f"multipart/byteranges; boundary={boundary}",
+                                 not head_only)
+    except Exception:
+        handles.release(h)
+        raise
+
+
+def stats() -> Dict[str, Any]:
+    return {"handles": handles.stats(), "sent": dict(sent)}
@@ -1,12 +1,23 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 
 from .settings import settings
-from .database import engine
+from . import upstream
+from .admission import admission
+from .audius_nodes import audius_nodes
+from .library import library
+from .peaks import peaks
+from .prefetch import prefetcher
+from .warmup import warmer
+from .database import async_engine, async_write_engine, engine
 from .models import Base
 from .api import router as api_router
+from .batch import router as batch_router
+from .uploads import router as uploads_router
+from .routes.playlist_routes import router as playlist_router
 from .ws import comuni_ws
 
 # NEW: import the survival RPG router (file sits alongside main.py)
@@ -31,10 +42,45 @@ FRONTEND_PUBLIC_DIR = BASE_DIR / "frontend" / "public"
 FRONTEND_BUILD_DIR = BASE_DIR / "frontend" / "build"
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared pooled upstream client (keep-alive + HTTP/2) for all outbound calls
+    upstream.start()
+    # Background refresh of the Audius discovery-node list
+    audius_nodes.start()
+    # Watchdog reclaiming upstreams of stalled media streams
+    admission.start()
+    # Incremental scan of media/music and media/videos into the library index;
+    # the first one finishes before serving so the lists are never empty
+    await library.scan()
+    library.start()
+    # Waveform peaks for new/changed local tracks, decoded in a process pool
+    if peaks is not None:
+        peaks.start()
+    # Fill the search cache for default/popular queries (jittered, skipped when degraded)
+    if warmer is not None:
+        warmer.start()
+    try:
+        yield
+    finally:
+        if warmer is not None:
+            await warmer.stop()
+        if prefetcher is not None:
+            await prefetcher.stop()
+        if peaks is not None:
+            await peaks.stop()
+        await library.stop()
+        await admission.stop()
+        await audius_nodes.stop()
+        await upstream.close()
+        await async_engine.dispose()
+        await async_write_engine.dispose()
+
+
 def create_app() -> FastAPI:
     Base.metadata.create_all(bind=engine)
 
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
 
     # ---- CORS --------------------------------------------------------------
     default_origins = ["http://localhost:3000", "http://127.0.0.1:3000"]
@@ -54,6 +100,9 @@ def create_app() -> FastAPI:
 
     # ---- API & WS ----------------------------------------------------------
     app.include_router(api_router, prefix="/api")
+    app.include_router(batch_router, prefix="/api")    # /api/batch (dispatches back into this app)
+    app.include_router(uploads_router, prefix="/api")  # /api/uploads (resumable, tus-style)
+    app.include_router(playlist_router, prefix="/api") # /api/playlists (+ items, keyset-paged)
     app.include_router(survival_router)     # adds /api/rpg/survival endpoints (router has its own prefix)
     app.include_router(llm_router)          # <--- NEW: /api/llm/test
     app.add_api_websocket_route("/ws/comuni/{room_id}", comuni_ws)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -20,3 +20,62 @@ class Playlist(Base):
     owner_id = Column(Integer, ForeignKey("users.id"))
 
     owner = relationship("User", back_populates="playlists")
+    # thousands of rows for some users: page through them (routes/playlist_routes.py), never lazy-load
+    items = relationship("PlaylistItem", back_populates="playlist", lazy="raise",
+                         cascade="all, delete-orphan", passive_deletes=True)
+
+class PlaylistItem(Base):
+    """
+    One entry of a playlist. `position` is sparse (steps of POSITION_GAP), so
+    inserting or moving entries only writes the rows that move; the entries
+    after a gap are pushed up only when it runs out.
+    """
+    __tablename__ = "playlist_items"
+
+    id = Column(Integer, primary_key=True)
+    playlist_id = Column(Integer, ForeignKey("playlists.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)
+    source = Column(String, nullable=False)      # "local", "audius", "pixabay", "pexels"
+    ref = Column(String, nullable=False)         # file name, track id or video id at the source
+    title = Column(String)
+    duration = Column(Float)                     # seconds
+    added_at = Column(Float, nullable=False)     # unix time
+
+    playlist = relationship("Playlist", back_populates="items")
+
+    __table_args__ = (
+        Index("ix_playlist_items_playlist_position", "playlist_id", "position", "id"),
+    )
+
+class MediaFile(Base):
+    """One file under media/music or media/videos (kept in sync by library.py)."""
+    __tablename__ = "media_files"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)        # "music" or "video"
+    name = Column(String, nullable=False)        # file name inside the kind's directory
+    size = Column(Integer, nullable=False)
+    mtime = Column(Float, nullable=False)
+    mime = Column(String)
+    etag = Column(String)                        # from size + mtime, served as-is
+    title = Column(String)
+    artist = Column(String)
+    album = Column(String)
+    genre = Column(String)
+    year = Column(Integer)
+    duration = Column(Float)                     # seconds
+
+    __table_args__ = (
+        UniqueConstraint("kind", "name"),
+        Index("ix_media_files_kind_mtime", "kind", "mtime", "id"),
+        Index("ix_media_files_kind_size", "kind", "size", "id"),
+    )
+
+class MediaHash(Base):
+    """sha256 of a file that came in through /api/uploads, for de-duplication."""
+    __tablename__ = "media_hashes"
+
+    sha256 = Column(String, primary_key=True)
+    kind = Column(String, primary_key=True)
+    name = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
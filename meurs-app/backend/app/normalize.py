@@ -0,0 +1,336 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Type, TypeVar, Union
+from urllib.parse import quote_plus
+import datetime as dt
+
+import msgspec
+from fastapi import HTTPException
+
+from .renditions import QUALITIES, pick, quality_for_height, rendition_registry
+from .settings import settings
+from .utils import host_allowed
+
+# ------------------------------
+# Upstream payloads -> normalized search items
+# ------------------------------
+# Upstream JSON is decoded straight into compact structs that only carry the
+# fields we read (everything else is skipped by the decoder, not built and
+# thrown away). The normalized items are structs as well and are encoded by
+# msgspec when the search cache stores a page, so a page never exists as a
+# tree of dicts on the hot path. Field order matches the JSON the front-end
+# already gets.
+
+T = TypeVar("T")
+Number = Union[int, float]
+
+
+def decode(content: bytes, type: Type[T]) -> T:
+    try:
+        return msgspec.json.decode(content, type=type)
+    except (msgspec.DecodeError, msgspec.ValidationError) as e:
+        raise HTTPException(502, f"Unexpected upstream payload: {e}")
+
+
+encode = msgspec.json.encode
+
+
+def year_from_date(s: Optional[str]) -> Optional[int]:
+    if not s:
+        return None
+    # Accept ISO-ish strings; only the first 10 chars are used (YYYY-MM-DD)
+    try:
+        return dt.date.fromisoformat(s[:10]).year
+    except Exception:
+        return None
+
+
+# quote_plus() for ASCII input as one str.translate call (several URLs per item add up)
+_SAFE = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_.-~")
+_QUOTE_TABLE = {i: (chr(i) if chr(i) in _SAFE else "+" if i == 32 else f"%{i:02X}") for i in range(128)}
+
+
+def _quote(value: str) -> str:
+    return value.translate(_QUOTE_TABLE) if value.isascii() else quote_plus(value)
+
+
+def proxy_url(direct: str) -> str:
+    # same as "/api/proxy?" + urlencode({"u": direct})
+    return "/api/proxy?u=" + _quote(direct)
+
+
+_REWRITE_IMAGES = settings.IMAGE_PROXY_REWRITE and settings.IMAGE_CACHE_ENABLED
+
+
+def image_url(direct: Optional[str]) -> Optional[str]:
+    """Artwork/thumbnail through the /api/image cache when IMAGE_PROXY_REWRITE is on."""
+    if not direct or not _REWRITE_IMAGES or not host_allowed(direct, settings.proxy_extra_hosts_list):
+        return direct
+    return "/api/image?u=" + _quote(direct)
+
+
+# ---- Audius -----------------------------------------------------------------
+
+class AudiusUser(msgspec.Struct):
+    name: Optional[str] = None
+
+
+class AudiusTrack(msgspec.Struct):
+    id: Optional[str] = None                     # tracks without one are skipped
+    title: Optional[str] = None
+    user: Optional[AudiusUser] = None
+    artwork: Optional[Dict[str, Any]] = None     # size keys, plus "mirrors": [...] and the like
+    release_date: Optional[str] = None
+    created_at: Optional[str] = None
+    duration: Optional[Number] = None
+
+
+class AudiusSearch(msgspec.Struct):
+    data: List[AudiusTrack] = []
+
+
+class MusicItem(msgspec.Struct):
+    id: str
+    title: str
+    artist: str
+    artwork: Optional[str]
+    source: str
+    release_date: Optional[str]
+    year: Optional[int]
+    stream_url: str
+
+
+class Rendition(msgspec.Struct):
+    url: str                      # proxied, playable as-is
+    width: Optional[int] = None
+    height: Optional[int] = None
+    size: Optional[int] = None
+
+
+class ExternalItem(msgspec.Struct, omit_defaults=True):
+    id: str
+    title: Optional[str]
+    artist: Optional[str]
+    duration: Optional[Number]
+    thumb: Optional[str]
+    stream_url: str
+    source: str
+    license: str
+    quality: Optional[str] = None                       # videos only
+    renditions: Optional[Dict[str, Rendition]] = None
+
+
+def audius_music_items(tracks: List[AudiusTrack]) -> List[MusicItem]:
+    items: List[MusicItem] = []
+    for t in tracks:
+        if not t.id:
+            continue
+        art = t.artwork or {}
+        release = t.release_date or t.created_at
+        items.append(MusicItem(
+            id=t.id,
+            title=t.title or "Untitled",
+            artist=(t.user.name if t.user else None) or "",
+            artwork=image_url(art.get("480x480") or art.get("1000x1000") or art.get("150x150")),
+            source="audius",
+            release_date=release,
+            year=year_from_date(release),
+            # IMPORTANT: front-end can play this directly
+            stream_url=f"/api/music/stream/{t.id}",
+        ))
+    return items
+
+
+def audius_external_items(tracks: List[AudiusTrack]) -> List[ExternalItem]:
+    return [
+        ExternalItem(
+            id=t.id,
+            title=t.title,
+            artist=t.user.name if t.user else None,
+            duration=t.duration,
+            thumb=image_url((t.artwork or {}).get("150x150")),
+            stream_url=f"/api/proxy/audius/stream?id={t.id}",
+            source="audius",
+            license="Audius terms",
+        )
+        for t in tracks
+        if t.id
+    ]
+
+
+# ---- Pixabay ----------------------------------------------------------------
+
+class PixabayFile(msgspec.Struct):
+    url: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    size: Optional[int] = None
+
+
+class PixabayPicture(msgspec.Struct):
+    picture: Optional[str] = None
+
+
+class PixabayHit(msgspec.Struct):
+    id: int
+    tags: Optional[str] = None
+    videos: Dict[str, PixabayFile] = {}
+    video_pictures: Optional[List[PixabayPicture]] = None
+    userImageURL: Optional[str] = None
+    previewURL: Optional[str] = None
+
+
+class PixabaySearch(msgspec.Struct):
+    hits: List[PixabayHit] = []
+
+
+class VideoItem(msgspec.Struct):
+    id: str
+    title: str
+    thumbnail: Optional[str]
+    source: str
+    year: Optional[int]
+    stream_url: str
+    quality: Optional[str] = None
+    renditions: Dict[str, Rendition] = {}
+
+
+def _pixabay_renditions(hit: PixabayHit) -> Dict[str, Rendition]:
+    """All usable renditions, proxied; also registers them for /api/proxy?quality= switching."""
+    direct = {name: hit.videos[name].url for name in QUALITIES
+              if name in hit.videos and hit.videos[name].url}
+    if len(direct) > 1:
+        rendition_registry.register(direct)
+    return {
+        name: Rendition(url=proxy_url(url), width=hit.videos[name].width,
+                        height=hit.videos[name].height, size=hit.videos[name].size)
+        for name, url in direct.items()
+    }
+
+
+def pixabay_video_items(hits: List[PixabayHit], quality: str = "large") -> List[VideoItem]:
+    items: List[VideoItem] = []
+    for v in hits:
+        renditions = _pixabay_renditions(v)
+        chosen = pick(renditions, quality)
+        if chosen is None:
+            continue
+        # Prefer a thumbnail if present
+        thumb = v.video_pictures[0].picture if v.video_pictures else None
+        items.append(VideoItem(
+            id=str(v.id),
+            title=v.tags or f"Pixabay {v.id}",
+            thumbnail=image_url(thumb or v.userImageURL or v.previewURL),
+            source="pixabay",
+            year=None,  # Pixabay doesn't provide an ISO publish date
+            stream_url=renditions[chosen].url,
+            quality=chosen,
+            renditions=renditions,
+        ))
+    return items
+
+
+def pixabay_external_items(hits: List[PixabayHit], quality: str = "medium") -> List[ExternalItem]:
+    items: List[ExternalItem] = []
+    for v in hits:
+        renditions = _pixabay_renditions(v)
+        chosen = pick(renditions, quality)
+        if chosen is None:
+            continue
+        items.append(ExternalItem(
+            id=str(v.id),
+            title=v.tags or f"Pixabay {v.id}",
+            artist=None,
+            duration=None,
+            thumb=image_url(v.userImageURL or v.previewURL),
+            stream_url=renditions[chosen].url,
+            source="pixabay",
+            license="Pixabay Content License",
+            quality=chosen,
+            renditions=renditions,
+        ))
+    return items
+
+
+# ---- Pexels -----------------------------------------------------------------
+
+class PexelsFile(msgspec.Struct):
+    link: Optional[str] = None
+    file_type: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+
+class PexelsUser(msgspec.Struct):
+    name: Optional[str] = None
+
+
+class PexelsVideo(msgspec.Struct):
+    id: int
+    url: Optional[str] = None
+    image: Optional[str] = None
+    user: Optional[PexelsUser] = None
+    video_files: List[PexelsFile] = []
+
+
+class PexelsSearch(msgspec.Struct):
+    videos: List[PexelsVideo] = []
+
+
+class CreditedVideoItem(msgspec.Struct):
+    id: str
+    title: str
+    artist: Optional[str]
+    thumbnail: Optional[str]
+    source: str
+    year: Optional[int]
+    stream_url: str
+    quality: Optional[str] = None
+    renditions: Dict[str, Rendition] = {}
+
+
+def _pexels_title(page_url: Optional[str]) -> Optional[str]:
+    # Pexels has no title field; the page slug reads like one ("/video/ocean-waves-1234/")
+    if not page_url:
+        return None
+    slug = page_url.rstrip("/").rsplit("/", 1)[-1]
+    words = [w for w in slug.split("-") if not w.isdigit()]
+    return " ".join(words).capitalize() or None
+
+
+def _pexels_renditions(v: PexelsVideo) -> Dict[str, Rendition]:
+    files = [f for f in v.video_files if f.link]
+    mp4 = [f for f in files if (f.file_type or "").endswith("mp4")] or files
+    chosen: Dict[str, PexelsFile] = {}
+    # smallest first, so each name ends up with its largest file; above 1080p only if nothing else
+    for f in sorted(mp4, key=lambda f: (f.width or 0) * (f.height or 0)):
+        name = quality_for_height(f.height)
+        if name not in chosen or (f.height or 0) <= 1080:
+            chosen[name] = f
+    direct = {name: f.link for name, f in chosen.items()}
+    if len(direct) > 1:
+        rendition_registry.register(direct)
+    return {
+        name: Rendition(url=proxy_url(f.link), width=f.width, height=f.height)
+        for name, f in chosen.items()
+    }
+
+
+def pexels_video_items(videos: List[PexelsVideo], quality: str = "large") -> List[CreditedVideoItem]:
+    items: List[CreditedVideoItem] = []
+    for v in videos:
+        renditions = _pexels_renditions(v)
+        chosen = pick(renditions, quality)
+        if chosen is None:
+            continue
+        items.append(CreditedVideoItem(
+            id=str(v.id),
+            title=_pexels_title(v.url) or f"Pexels {v.id}",
+            artist=v.user.name if v.user else None,
+            thumbnail=image_url(v.image),
+            source="pexels",
+            year=None,
+            stream_url=renditions[chosen].url,
+            quality=chosen,
+            renditions=renditions,
+        ))
+    return items
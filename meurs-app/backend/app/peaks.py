@@ -0,0 +1,307 @@
+from __future__ import annotations
+from typing import Dict, Any, Callable, Iterator, List, Optional, Set, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import asyncio
+import hashlib
+import os
+import struct
+import wave
+
+import numpy as np
+
+from .database import DB_DIR
+from .library import library
+from .settings import settings
+
+# ------------------------------
+# Waveform peaks for local music (/api/music/{name}/peaks)
+# ------------------------------
+# A background job decodes tracks under media/music in a process pool and
+# stores min/max peaks at several resolutions (256, 1024, ... samples per
+# peak) as int8 pairs in one small binary file per track under
+# <DB_DIR>/peaks, tagged with the track's ETag so edits are noticed. The
+# finest level is computed block by block with NumPy (reshape + min/max),
+# coarser ones by reducing the level below, so memory stays bounded by one
+# decode block. Decoders are looked up by file suffix; WAV/PCM is built in,
+# other formats can be added with register_decoder() at import time (the
+# pool workers import this module too). Pool jobs, finished peak files and
+# decode failures are all keyed by (name, ETag): after each library scan the
+# backfill only looks at tracks whose pair it has not seen yet, reading just
+# the header of their peak file, and a track that failed to decode is not
+# retried until it changes.
+
+MAGIC = b"MPK1"
+BASE = 256                  # samples per peak at the finest level
+FACTOR = 4                  # each level is this much coarser than the one below
+LEVELS = 5                  # 256 .. 65536 samples per peak
+BLOCK_FRAMES = BASE * 4096  # frames decoded at a time
+
+# A decoder yields (sample_rate, blocks of mono float32 samples in [-1, 1])
+Decoder = Callable[[Path], Tuple[int, Iterator[np.ndarray]]]
+DECODERS: Dict[str, Decoder] = {}
+
+
+def register_decoder(suffixes: List[str], decoder: Decoder) -> None:
+    for s in suffixes:
+        DECODERS[s.lower()] = decoder
+
+
+def _pcm_to_float(raw: bytes, width: int, channels: int) -> np.ndarray:
+    if width == 1:
+        x = (np.frombuffer(raw, np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        x = np.frombuffer(raw, "<i2").astype(np.float32) / 32768.0
+    elif width == 3:
+        b = np.frombuffer(raw, np.uint8).reshape(-1, 3).astype(np.int32)
+        v = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        x = (np.where(v & 0x800000, v - (1 << 24), v)).astype(np.float32) / float(1 << 23)
+    elif width == 4:
+        x = np.frombuffer(raw, "<i4").astype(np.float32) / float(1 << 31)
+    else:
+        raise ValueError(f"unsupported sample width {width}")
+    if channels > 1:
+        x = x[: len(x) - len(x) % channels].reshape(-1, channels).mean(axis=1)
+    return x
+
+
+def decode_wav(path: Path) -> Tuple[int, Iterator[np.ndarray]]:
+    w = wave.open(str(path), "rb")
+    rate, width, channels = w.getframerate(), w.getsampwidth(), w.getnchannels()
+
+    def blocks() -> Iterator[np.ndarray]:
+        with w:
+            while True:
+                raw = w.readframes(BLOCK_FRAMES)
+                if not raw:
+                    break
+                yield _pcm_to_float(raw, width, channels)
+
+    return rate, blocks()
+
+
+register_decoder([".wav", ".wave"], decode_wav)
+
+
+def _reduce(mins: np.ndarray, maxs: np.ndarray, factor: int) -> Tuple[np.ndarray, np.ndarray]:
+    pad = -len(mins) % factor
+    if pad:
+        mins = np.pad(mins, (0, pad), mode="edge")
+        maxs = np.pad(maxs, (0, pad), mode="edge")
+    return mins.reshape(-1, factor).min(axis=1), maxs.reshape(-1, factor).max(axis=1)
+
+
+def _quantize(mins: np.ndarray, maxs: np.ndarray) -> bytes:
+    pairs = np.empty(len(mins) * 2, np.int8)
+    pairs[0::2] = np.clip(np.round(mins * 127), -127, 127)
+    pairs[1::2] = np.clip(np.round(maxs * 127), -127, 127)
+    return pairs.tobytes()
+
+
+def compute_peaks(src: str, dst: str, etag: str) -> int:
+    """Decode `src` and write its peak file to `dst` (runs in a pool worker). Returns samples read."""
+    decoder = DECODERS.get(Path(src).suffix.lower())
+    if decoder is None:
+        raise ValueError(f"no decoder for {src}")
+    rate, blocks = decoder(Path(src))
+    mins_parts, maxs_parts, carry, total = [], [], np.empty(0, np.float32), 0
+    for block in blocks:
+        total += len(block)
+        x = np.concatenate([carry, block]) if len(carry) else block
+        usable = len(x) - len(x) % BASE
+        if usable:
+            frames = x[:usable].reshape(-1, BASE)
+            mins_parts.append(frames.min(axis=1))
+            maxs_parts.append(frames.max(axis=1))
+        carry = x[usable:]
+    if len(carry):
+        mins_parts.append(carry.min(keepdims=True))
+        maxs_parts.append(carry.max(keepdims=True))
+    mins = np.concatenate(mins_parts) if mins_parts else np.zeros(0, np.float32)
+    maxs = np.concatenate(maxs_parts) if maxs_parts else np.zeros(0, np.float32)
+
+    levels: List[Tuple[int, bytes, int]] = []
+    spp = BASE
+    for _ in range(LEVELS):
+        levels.append((spp, _quantize(mins, maxs), len(mins)))
+        if len(mins) <= 1:
+            break
+        mins, maxs = _reduce(mins, maxs, FACTOR)
+        spp *= FACTOR
+
+    tag = etag.encode()
+    out = [struct.pack("<4sIQH", MAGIC, rate, total, len(levels)), struct.pack("<H", len(tag)), tag]
+    out += [struct.pack("<II", spp, count) for spp, _, count in levels]
+    out += [data for _, data, _ in levels]
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"".join(out))
+    os.replace(tmp, dst)
+    return total
+
+
+class PeakFile:
+    __slots__ = ("rate", "samples", "etag", "levels", "data")
+
+    def __init__(self, blob: bytes):
+        magic, self.rate, self.samples, n = struct.unpack_from("<4sIQH", blob, 0)
+        if magic != MAGIC:
+            raise ValueError("not a peak file")
+        pos = struct.calcsize("<4sIQH")
+        (tlen,) = struct.unpack_from("<H", blob, pos)
+        self.etag = blob[pos + 2:pos + 2 + tlen].decode()
+        pos += 2 + tlen
+        self.levels: List[Tuple[int, int, int]] = []     # (samples per peak, count, data offset)
+        offset = pos + 8 * n
+        for i in range(n):
+            spp, count = struct.unpack_from("<II", blob, pos + 8 * i)
+            self.levels.append((spp, count, offset))
+            offset += 2 * count
+        self.data = blob
+
+    def level_for(self, width: int) -> Tuple[int, int, int]:
+        """Coarsest level that still has at least `width` peaks (else the finest)."""
+        fitting = [lv for lv in self.levels if lv[1] >= width]
+        return fitting[-1] if fitting else self.levels[0]
+
+    def pairs(self, level: Tuple[int, int, int]) -> bytes:
+        _, count, offset = level
+        return self.data[offset:offset + 2 * count]
+
+
+class PeaksService:
+    def __init__(self, root: Path, workers: int = 2, poll: float = 2.0):
+        self.root = root
+        self.workers = max(1, workers)
+        self.poll = poll
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._done: Set[Tuple[str, str]] = set()      # peak file on disk matches the track
+        self._failed: Set[Tuple[str, str]] = set()    # decoding this version failed
+        self._task: Optional[asyncio.Task] = None
+        self.computed = self.failed = 0
+
+    def path(self, name: str) -> Path:
+        return self.root / f"{hashlib.sha1(name.encode()).hexdigest()}.peaks"
+
+    @staticmethod
+    def decodable(name: str) -> bool:
+        return Path(name).suffix.lower() in DECODERS
+
+    def _load(self, name: str, etag: str) -> Optional[PeakFile]:
+        try:
+            pf = PeakFile(self.path(name).read_bytes())
+        except (OSError, ValueError, struct.error):
+            return None
+        return pf if pf.etag == etag else None
+
+    def _stored_etag(self, name: str) -> Optional[str]:
+        """ETag a track's peak file was computed for, reading only the header."""
+        head = struct.calcsize("<4sIQH")
+        try:
+            with open(self.path(name), "rb") as f:
+                blob = f.read(head + 2)
+                if blob[:4] != MAGIC:
+                    return None
+                (tlen,) = struct.unpack_from("<H", blob, head)
+                return f.read(tlen).decode()
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def _missing(self, todo: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        return [(n, e) for n, e in todo if self._stored_etag(n) != e]
+
+    async def load(self, name: str, etag: str) -> Optional[PeakFile]:
+        return await asyncio.to_thread(self._load, name, etag)
+
+    def compute(self, name: str, etag: str) -> asyncio.Future:
+        """Start (or join) the pool job for this version of `name`; resolves once its peak file is written."""
+        key = (name, etag)
+        job = self._jobs.get(key)
+        if job is not None:
+            return job
+        if key in self._failed:
+            job = asyncio.get_running_loop().create_future()
+            job.set_exception(ValueError(f"could not decode {name}"))
+            return job
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        src = str(library.directory("music") / name)
+        job = asyncio.wrap_future(self._pool.submit(compute_peaks, src, str(self.path(name)), etag))
+        self._jobs[key] = job
+
+        def done(f: asyncio.Future) -> None:
+            self._jobs.pop(key, None)
+            if f.cancelled():
+                self.failed += 1
+            elif f.exception() is not None:
+                self.failed += 1
+                self._failed.add(key)
+            else:
+                self.computed += 1
+                self._done.add(key)
+
+        job.add_done_callback(done)
+        return job
+
+    async def backfill(self) -> None:
+        """Compute peaks for new or changed tracks that have none (or stale ones), `workers` at a time."""
+        current = {(name, info.etag) for (kind, name), info in list(library.files.items())
+                   if kind == "music" and self.decodable(name)}
+        self._done &= current           # forget removed and replaced versions
+        self._failed &= current
+        todo = sorted(current - self._done - self._failed)
+        if not todo:
+            return
+        missing = await asyncio.to_thread(self._missing, todo)
+        self._done.update(set(todo) - set(missing))
+        todo = missing
+        for i in range(0, len(todo), self.workers):
+            batch = todo[i:i + self.workers]
+            await asyncio.gather(*(self.compute(n, e) for n, e in batch), return_exceptions=True)
+
+    async def _loop(self) -> None:
+        # follow the library scanner: after every completed scan, backfill the
+        # (name, ETag) pairs it has not handled yet
+        seen = 0
+        while True:
+            if library.scans != seen:
+                seen = library.scans
+                try:
+                    await self.backfill()
+                except Exception:
+                    pass
+            await asyncio.sleep(self.poll)
+
+    def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": len(self._jobs),
+            "computed": self.computed,
+            "failed": self.failed,
+            "failed_tracks": len(self._failed),
+            "decoders": sorted(DECODERS),
+        }
+
+
+peaks = PeaksService(
+    Path(DB_DIR) / "peaks",
+    workers=settings.PEAKS_WORKERS,
+) if settings.PEAKS_ENABLED else None
@@ -0,0 +1,89 @@
+from __future__ import annotations
+from typing import Dict, Any, Set, Callable, Awaitable
+import asyncio
+
+from .admission import admission
+from .audius_nodes import audius_nodes
+from .settings import settings
+
+# ------------------------------
+# Background prefetch after a search page was served
+# ------------------------------
+# Search handlers hand over follow-up work: the next page (into the search
+# cache) and the top-k Audius stream URLs (into the stream URL cache). Jobs
+# run on a small semaphore, with a cap on how many may be queued, and are
+# dropped when streams are near capacity (or, for jobs that hit Audius, when
+# every Audius node is cooling down); prefetch is the first thing to give up
+# under pressure.
+
+
+class Prefetcher:
+    def __init__(self, max_concurrent: int = 4, max_pending: int = 32, max_pressure: float = 0.75):
+        self.max_pending = max_pending
+        self.max_pressure = max_pressure
+        self._sem = asyncio.Semaphore(max_concurrent)
+        self._pending: Set[str] = set()     # job keys queued or running
+        self._tasks: Set[asyncio.Task] = set()
+        self.scheduled = self.completed = self.failed = 0
+        self.skipped_pressure = self.skipped_budget = self.skipped_duplicate = 0
+
+    def under_pressure(self, audius: bool = False) -> bool:
+        if admission.pressure() >= self.max_pressure:
+            return True
+        return audius and audius_nodes.degraded()
+
+    def schedule(self, key: str, job: Callable[[], Awaitable[Any]], audius: bool = False) -> bool:
+        """Queue `job` unless it is already pending, the budget is spent, or the system is busy."""
+        if key in self._pending:
+            self.skipped_duplicate += 1
+            return False
+        if len(self._pending) >= self.max_pending:
+            self.skipped_budget += 1
+            return False
+        if self.under_pressure(audius):
+            self.skipped_pressure += 1
+            return False
+        self._pending.add(key)
+        self.scheduled += 1
+        task = asyncio.create_task(self._run(key, job, audius))
+        self._tasks.add(task)   # the loop only keeps a weak reference
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _run(self, key: str, job: Callable[[], Awaitable[Any]], audius: bool) -> None:
+        try:
+            async with self._sem:
+                # pressure may have built up while this job waited for a turn
+                if self.under_pressure(audius):
+                    self.skipped_pressure += 1
+                    return
+                await job()
+            self.completed += 1
+        except Exception:
+            self.failed += 1
+        finally:
+            self._pending.discard(key)
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "scheduled": self.scheduled,
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped_pressure": self.skipped_pressure,
+            "skipped_budget": self.skipped_budget,
+            "skipped_duplicate": self.skipped_duplicate,
+        }
+
+
+prefetcher = Prefetcher(
+    max_concurrent=settings.PREFETCH_MAX_CONCURRENT,
+    max_pending=settings.PREFETCH_MAX_PENDING,
+    max_pressure=settings.PREFETCH_MAX_PRESSURE,
+) if settings.PREFETCH_ENABLED else None
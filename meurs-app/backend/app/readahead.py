@@ -0,0 +1,210 @@
+from __future__ import annotations
+from typing import Dict, Any, Optional, Callable, Awaitable
+import asyncio
+import time
+
+import httpx
+from fastapi import Request
+
+from . import upstream
+from .admission import admission
+from .settings import settings
+
+# ------------------------------
+# Speculative read-ahead for range_proxy
+# ------------------------------
+# After a bounded Range (bytes=a-b) has been served in full, the next window
+# (b+1 .. b+window) is fetched in the background. Without the segment cache
+# it is kept in a bounded in-memory buffer and the follow-up request is
+# answered from it; with the segment cache the window is written to disk.
+# A request for a different position (seek) cancels the stream's read-ahead,
+# and idle buffers are dropped, which covers clients that went away.
+# Memory windows reserve their full size against total_max when scheduled
+# (shrunk to what arrived when the fetch ends, released when dropped), and
+# every read-ahead fetch holds a low-priority admission slot, so it is
+# skipped instead of competing with real streams when slots run short.
+
+
+class Window:
+    __slots__ = ("start", "end", "task", "data", "size", "headers", "touched", "reserved")
+
+    def __init__(self, start: int, end: int, size: int, headers: Dict[str, str]):
+        self.start = start
+        self.end = end                      # inclusive
+        self.task: Optional[asyncio.Task] = None
+        self.data: Optional[bytearray] = None   # None in disk mode
+        self.size = size
+        self.headers = headers
+        self.touched = time.monotonic()
+        self.reserved = 0                   # bytes counted against total_max
+
+    def covers(self, start: int, end: int) -> bool:
+        return self.start <= start and end <= self.end
+
+
+class ReadAhead:
+    def __init__(self, window: int = 2 << 20, total_max: int = 64 << 20,
+                 idle_ttl: float = 30.0, wait_timeout: float = 10.0):
+        self.window = window            # bytes fetched ahead per stream (also the per-stream cap)
+        self.total_max = total_max      # in-memory bytes across all streams
+        self.idle_ttl = idle_ttl
+        self.wait_timeout = wait_timeout
+        self.streams: Dict[str, Window] = {}
+        self.reserved = 0
+        self.scheduled = self.hits = self.cancelled = self.skipped = 0
+
+    @staticmethod
+    def stream_id(request: Request, key: str) -> str:
+        host = request.client.host if request.client else "-"
+        return f"{host}|{key}"
+
+    @staticmethod
+    def _client(sid: str) -> str:
+        return sid.split("|", 1)[0]
+
+    def buffered_bytes(self) -> int:
+        return sum(len(w.data) for w in self.streams.values() if w.data is not None)
+
+    def _reserve(self, w: Window, n: int) -> None:
+        self.reserved += n - w.reserved
+        w.reserved = n
+
+    def cancel(self, sid: str) -> None:
+        w = self.streams.pop(sid, None)
+        if w is None:
+            return
+        self._reserve(w, 0)
+        if w.task and not w.task.done():
+            w.task.cancel()
+            self.cancelled += 1
+
+    def _sweep(self) -> None:
+        now = time.monotonic()
+        for sid, w in list(self.streams.items()):
+            if now - w.touched > self.idle_ttl:
+                self.cancel(sid)
+
+    # ---- lookup ---------------------------------------------------------
+    async def take(self, sid: str, start: int, end: int) -> Optional[Window]:
+        """
+        In-memory window covering [start, end] (waits for an in-flight fetch),
+        or None. Any other position counts as a seek and cancels the stream.
+        """
+        w = self.streams.get(sid)
+        if w is None:
+            return None
+        if not w.covers(start, end):
+            self.cancel(sid)
+            return None
+        w.touched = time.monotonic()
+        if w.data is None:
+            return None  # disk mode: the segment cache answers
+        if w.task and not w.task.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(w.task), self.wait_timeout)
+            except (asyncio.TimeoutError, Exception):
+                return None
+        if w.start + len(w.data) <= end:
+            return None  # fetch ended early
+        self.hits += 1
+        return w
+
+    def note_request(self, sid: str, start: int, end: Optional[int]) -> None:
+        """Cancel read-ahead that this request does not continue (seek away)."""
+        w = self.streams.get(sid)
+        if w is not None and (end is None or not w.covers(start, end)):
+            self.cancel(sid)
+
+    # ---- scheduling -----------------------------------------------------
+    def _replace(self, sid: str) -> None:
+        self._sweep()
+        self.cancel(sid)
+
+    def _schedule(self, sid: str, w: Window, slot,
+                  job: Callable[[Window], Awaitable[None]]) -> None:
+        async def run(w: Window) -> None:
+            try:
+                await job(w)
+            finally:
+                slot.release()
+
+        self.streams[sid] = w
+        w.task = asyncio.create_task(run(w))
+        w.task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self.scheduled += 1
+
+    def schedule_memory(self, sid: str, url: str, next_start: int, size: int,
+                        headers: Dict[str, str]) -> None:
+        if next_start >= size:
+            return
+        self._replace(sid)
+        w = Window(next_start, min(size, next_start + self.window) - 1, size, headers)
+        want = w.end - w.start + 1
+        if self.reserved + want > self.total_max:
+            self.skipped += 1
+            return
+        slot = admission.try_acquire(self._client(sid), "readahead")
+        if slot is None:
+            self.skipped += 1
+            return
+        w.data = bytearray()
+        self._reserve(w, want)
+
+        async def job(w: Window) -> None:
+            try:
+                fwd = {"Range": f"bytes={w.start}-{w.end}"}
+                if w.headers.get("etag"):
+                    fwd["If-Range"] = w.headers["etag"]
+                resp = await upstream.open_stream(url, fwd)
+                slot.watch(resp)
+                try:
+                    if resp.status_code != 206:
+                        return
+                    async for chunk in resp.aiter_bytes():
+                        w.data.extend(chunk[: want - len(w.data)])
+                        slot.progress(len(chunk))
+                        if len(w.data) >= want:
+                            break
+                except (httpx.HTTPError, httpx.StreamError):
+                    return
+                finally:
+                    await resp.aclose()
+            finally:
+                if self.streams.get(sid) is w:
+                    self._reserve(w, len(w.data))   # keep only what arrived
+
+        self._schedule(sid, w, slot, job)
+
+    def schedule_disk(self, sid: str, next_start: int, size: int,
+                      fill: Callable[[int, int], Awaitable[None]]) -> None:
+        if next_start >= size:
+            return
+        self._replace(sid)
+        slot = admission.try_acquire(self._client(sid), "readahead")
+        if slot is None:
+            self.skipped += 1
+            return
+        w = Window(next_start, min(size, next_start + self.window) - 1, size, {})
+
+        async def job(w: Window) -> None:
+            await fill(w.start, w.end)
+
+        self._schedule(sid, w, slot, job)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "streams": len(self.streams),
+            "buffered_bytes": self.buffered_bytes(),
+            "reserved_bytes": self.reserved,
+            "scheduled": self.scheduled,
+            "hits": self.hits,
+            "cancelled": self.cancelled,
+            "skipped": self.skipped,
+        }
+
+
+readahead = ReadAhead(
+    window=settings.READAHEAD_WINDOW,
+    total_max=settings.READAHEAD_MAX_TOTAL,
+    idle_ttl=settings.READAHEAD_IDLE_TTL,
+) if settings.READAHEAD_ENABLED else None
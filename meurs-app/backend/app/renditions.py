@@ -0,0 +1,139 @@
+from __future__ import annotations
+from typing import Dict, Any, Optional, List
+from collections import OrderedDict
+import re
+
+from fastapi import Request
+
+# ------------------------------
+# Video rendition selection
+# ------------------------------
+# Search items keep every rendition (tiny .. large); which one `stream_url`
+# points at is chosen per request from an explicit ?quality= or from client
+# hints (Save-Data, ECT, Downlink, Viewport-Width x DPR), taking the most
+# conservative answer. /api/proxy?u=...&quality= can switch an already
+# playing URL to a sibling rendition, looked up in a small registry filled
+# when pages are built, with Pixabay's "_<name>.mp4" file naming as fallback.
+
+QUALITIES: List[str] = ["tiny", "small", "medium", "large"]
+WIDTHS = {"tiny": 640, "small": 960, "medium": 1280, "large": 1920}
+
+# Ask browsers for the hints and tell caches the response depends on them
+ACCEPT_CH = "Save-Data, ECT, Downlink, Viewport-Width, DPR"
+VARY = "Save-Data, ECT, Downlink, Viewport-Width"
+HINT_HEADERS = {"Accept-CH": ACCEPT_CH, "Vary": VARY}
+
+
+def quality_for_height(height: Optional[int]) -> str:
+    h = height or 0
+    if h <= 360:
+        return "tiny"
+    if h <= 540:
+        return "small"
+    if h <= 720:
+        return "medium"
+    return "large"
+
+
+def _lowest(*choices: Optional[str]) -> Optional[str]:
+    picked = [c for c in choices if c in WIDTHS]
+    return min(picked, key=QUALITIES.index) if picked else None
+
+
+def _float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def select_quality(request: Request, explicit: Optional[str] = None, default: str = "large") -> str:
+    """Explicit ?quality= wins; "auto" or nothing falls back to client hints, then `default`."""
+    if explicit in WIDTHS:
+        return explicit
+    h = request.headers
+    by_save = "tiny" if (h.get("save-data") or "").strip().lower() == "on" else None
+
+    ect = (h.get("ect") or "").strip().lower()
+    by_ect = {"slow-2g": "tiny", "2g": "tiny", "3g": "small"}.get(ect)
+
+    downlink = _float(h.get("downlink"))       # Mbps
+    by_downlink = None
+    if downlink is not None:
+        by_downlink = ("tiny" if downlink < 1.5 else "small" if downlink < 4
+                       else "medium" if downlink < 8 else "large")
+
+    vw = _float(h.get("viewport-width"))
+    by_viewport = None
+    if vw:
+        px = vw * (_float(h.get("dpr")) or 1.0)
+        by_viewport = next((q for q in QUALITIES if WIDTHS[q] >= px), "large")
+
+    return _lowest(by_save, by_ect, by_downlink, by_viewport) or default
+
+
+def pick(renditions: Dict[str, Any], quality: str) -> Optional[str]:
+    """Best available name for `quality`: exact, else the next lower one, else the next higher."""
+    if not renditions:
+        return None
+    if quality in renditions:
+        return quality
+    i = QUALITIES.index(quality) if quality in QUALITIES else len(QUALITIES) - 1
+    for q in reversed(QUALITIES[:i]):
+        if q in renditions:
+            return q
+    for q in QUALITIES[i + 1:]:
+        if q in renditions:
+            return q
+    return None
+
+
+def apply_quality(items: List[Dict[str, Any]], quality: str) -> List[Dict[str, Any]]:
+    """Copies of (plain dict) items with `stream_url`/`quality` pointed at the chosen rendition."""
+    out = []
+    for item in items:
+        renditions = item.get("renditions") or {}
+        name = pick(renditions, quality)
+        if name is None or name == item.get("quality"):
+            out.append(item)
+            continue
+        out.append(dict(item, stream_url=renditions[name]["url"], quality=name))
+    return out
+
+
+_PIXABAY_NAME = re.compile(r"_(tiny|small|medium|large)\.mp4$")
+
+
+class RenditionRegistry:
+    """Direct media URL -> its sibling renditions (bounded LRU)."""
+
+    def __init__(self, max_entries: int = 20_000):
+        self.max_entries = max_entries
+        self.siblings: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self.switches = 0
+
+    def register(self, direct: Dict[str, str]) -> None:
+        """`direct`: quality name -> upstream URL for one video."""
+        for url in direct.values():
+            self.siblings[url] = direct
+            self.siblings.move_to_end(url)
+        while len(self.siblings) > self.max_entries:
+            self.siblings.popitem(last=False)
+
+    def switch(self, url: str, quality: str) -> str:
+        group = self.siblings.get(url)
+        if group:
+            name = pick(group, quality)
+            target = group[name] if name else url
+        else:
+            m = _PIXABAY_NAME.search(url)
+            target = url[:m.start(1)] + quality + url[m.end(1):] if m and quality in WIDTHS else url
+        if target != url:
+            self.switches += 1
+        return target
+
+    def stats(self) -> Dict[str, Any]:
+        return {"urls": len(self.siblings), "switches": self.switches}
+
+
+rendition_registry = RenditionRegistry()
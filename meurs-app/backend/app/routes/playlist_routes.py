@@ -0,0 +1,246 @@
+from __future__ import annotations
+from typing import Dict, Any, Collection, List, Optional
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import delete, func, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager
+
+from .. import schemas
+from ..dependencies import get_async_db, get_async_write_db
+from ..models import Playlist, PlaylistItem, User
+
+# ------------------------------
+# Playlists (/api/playlists)
+# ------------------------------
+# Items carry a sparse `position` (multiples of POSITION_GAP) indexed together
+# with playlist_id, so bulk adds and moves compute free positions between
+# their neighbours with two indexed MIN/MAX lookups and only write the rows
+# that actually change; once a gap is used up, the items right after it are
+# pushed up (never down) until one already has room. Listing items is
+# keyset-paginated on (position, id), so page N costs the same as page 1
+# however long the playlist is, and that respacing never makes a cursor skip
+# an item (one at or before the insertion point doesn't repeat any either). A user's playlists with
+# their item counts come back in one query. Every write request is one
+# transaction on the async write session. The owner is named by ?username=,
+# like the comuni endpoints.
+
+router = APIRouter(prefix="/playlists", tags=["playlists"])
+
+POSITION_GAP = 1024
+
+
+def _playlist_dict(pl: Playlist, item_count: int) -> Dict[str, Any]:
+    return {"id": pl.id, "name": pl.name, "media_type": pl.media_type,
+            "owner": pl.owner.username, "item_count": item_count}
+
+
+def _item_dict(it: PlaylistItem) -> Dict[str, Any]:
+    return {"id": it.id, "position": it.position, "source": it.source, "ref": it.ref,
+            "title": it.title, "duration": it.duration, "added_at": it.added_at}
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        position, item_id = cursor.split(".", 1)
+        return int(position), int(item_id)
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+
+
+async def _user(db: AsyncSession, username: str) -> User:
+    user = await db.scalar(select(User).where(User.username == username))
+    if user is None:
+        raise HTTPException(404, "User not found")
+    return user
+
+
+async def _owned(db: AsyncSession, playlist_id: int, username: str) -> Playlist:
+    pl = await db.scalar(select(Playlist).join(Playlist.owner).options(contains_eager(Playlist.owner))
+                         .where(Playlist.id == playlist_id))
+    if pl is None:
+        raise HTTPException(404, "Playlist not found")
+    if pl.owner.username != username:
+        raise HTTPException(403, "Only the owner can change this playlist")
+    return pl
+
+
+# ------------------------------
+# Sparse positions
+# ------------------------------
+async def _anchor(db: AsyncSession, playlist_id: int, item_id: int) -> int:
+    pos = await db.scalar(select(PlaylistItem.position)
+                          .where(PlaylistItem.playlist_id == playlist_id, PlaylistItem.id == item_id))
+    if pos is None:
+        raise HTTPException(404, f"Item {item_id} not in playlist")
+    return pos
+
+
+async def _bounds(db: AsyncSession, playlist_id: int, after: Optional[int], before: Optional[int],
+                  moving: Collection[int]) -> tuple:
+    """(lo, hi) positions the new block goes strictly between; hi is None at the end."""
+    if after is not None and before is not None:
+        raise HTTPException(422, "Give either after or before, not both")
+    if (after is not None and after in moving) or (before is not None and before in moving):
+        raise HTTPException(422, "Cannot anchor a move on an item being moved")
+    others = [PlaylistItem.playlist_id == playlist_id]
+    if moving:
+        others.append(PlaylistItem.id.not_in(moving))
+    if after is not None:
+        lo = await _anchor(db, playlist_id, after)
+        hi = await db.scalar(select(func.min(PlaylistItem.position)).where(*others, PlaylistItem.position > lo))
+    elif before is not None:
+        hi = await _anchor(db, playlist_id, before)
+        lo = await db.scalar(select(func.max(PlaylistItem.position)).where(*others, PlaylistItem.position < hi))
+    else:
+        lo = await db.scalar(select(func.max(PlaylistItem.position)).where(*others))
+        hi = None
+    return (lo if lo is not None else 0), hi
+
+
+async def _positions(db: AsyncSession, playlist_id: int, n: int, after: Optional[int],
+                     before: Optional[int], moving: Collection[int] = ()) -> List[int]:
+    """Positions for a block of `n` items at the requested spot, making room only if it doesn't fit."""
+    lo, hi = await _bounds(db, playlist_id, after, before, moving)
+    if hi is None:
+        return [lo + POSITION_GAP * (i + 1) for i in range(n)]
+    step = (hi - lo) // (n + 1)
+    if step >= 1:
+        return [lo + step * (i + 1) for i in range(n)]
+
+    # Gap used up: leave a hole of n slots after `lo` and push the following items up,
+    # POSITION_GAP apart, until one is already far enough. Positions only ever grow.
+    stmt = select(PlaylistItem.id, PlaylistItem.position).where(
+        PlaylistItem.playlist_id == playlist_id, PlaylistItem.position > lo)
+    if moving:
+        stmt = stmt.where(PlaylistItem.id.not_in(moving))
+    changes, prev = [], lo + n * POSITION_GAP
+    for item_id, pos in (await db.execute(stmt.order_by(PlaylistItem.position, PlaylistItem.id))).all():
+        if pos >= prev + POSITION_GAP:
+            break
+        prev += POSITION_GAP
+        changes.append({"id": item_id, "position": prev})
+    await db.execute(update(PlaylistItem), changes)
+    return [lo + (i + 1) * POSITION_GAP for i in range(n)]
+
+
+# ------------------------------
+# Playlists
+# ------------------------------
+@router.get("")
+async def list_playlists(username: str = Query(..., min_length=1), db: AsyncSession = Depends(get_async_db)):
+    # one query: owner joined and eager-loaded, item counts from a correlated (indexed) subquery
+    count = (select(func.count(PlaylistItem.id)).where(PlaylistItem.playlist_id == Playlist.id)
+             .correlate(Playlist).scalar_subquery())
+    rows = (await db.execute(
+        select(Playlist, count).join(Playlist.owner).options(contains_eager(Playlist.owner))
+        .where(User.username == username).order_by(Playlist.id)
+    )).all()
+    return {"playlists": [_playlist_dict(pl, n) for pl, n in rows]}
+
+
+@router.post("", status_code=201)
+async def create_playlist(
+    body: schemas.PlaylistCreate,
+    username: str = Query(..., min_length=1),
+    db: AsyncSession = Depends(get_async_write_db),
+):
+    if not body.name.strip():
+        raise HTTPException(422, "name is required")
+    if body.media_type not in ("music", "video"):
+        raise HTTPException(422, "media_type must be 'music' or 'video'")
+    user = await _user(db, username)
+    pl = Playlist(name=body.name.strip(), media_type=body.media_type, owner=user)
+    db.add(pl)
+    await db.commit()
+    return _playlist_dict(pl, 0)
+
+
+@router.delete("/{playlist_id}")
+async def delete_playlist(playlist_id: int, username: str = Query(..., min_length=1),
+                          db: AsyncSession = Depends(get_async_write_db)):
+    pl = await _owned(db, playlist_id, username)
+    removed = (await db.execute(delete(PlaylistItem).where(PlaylistItem.playlist_id == playlist_id))).rowcount
+    await db.delete(pl)
+    await db.commit()
+    return {"deleted": True, "items_removed": removed}
+
+
+# ------------------------------
+# Items
+# ------------------------------
+@router.get("/{playlist_id}/items")
+async def list_items(
+    playlist_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    One page of items in playlist order; pass `next_cursor` back as `cursor`
+    for the following page (null on the last one).
+    """
+    if await db.scalar(select(Playlist.id).where(Playlist.id == playlist_id)) is None:
+        raise HTTPException(404, "Playlist not found")
+    stmt = select(PlaylistItem).where(PlaylistItem.playlist_id == playlist_id)
+    if cursor:
+        stmt = stmt.where(tuple_(PlaylistItem.position, PlaylistItem.id) > _decode_cursor(cursor))
+    rows = (await db.scalars(stmt.order_by(PlaylistItem.position, PlaylistItem.id).limit(limit + 1))).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": [_item_dict(it) for it in rows],
+        "next_cursor": f"{rows[-1].position}.{rows[-1].id}" if more else None,
+    }
+
+
+@router.post("/{playlist_id}/items", status_code=201)
+async def add_items(
+    playlist_id: int,
+    body: schemas.PlaylistItemsAdd,
+    username: str = Query(..., min_length=1),
+    db: AsyncSession = Depends(get_async_write_db),
+):
+    await _owned(db, playlist_id, username)
+    positions = await _positions(db, playlist_id, len(body.items), body.after, body.before)
+    now = time.time()
+    new = [PlaylistItem(playlist_id=playlist_id, position=pos, added_at=now, **item.model_dump())
+           for item, pos in zip(body.items, positions)]
+    db.add_all(new)
+    await db.commit()
+    return {"items": [_item_dict(it) for it in new]}
+
+
+@router.post("/{playlist_id}/items/move")
+async def move_items(
+    playlist_id: int,
+    body: schemas.PlaylistItemsMove,
+    username: str = Query(..., min_length=1),
+    db: AsyncSession = Depends(get_async_write_db),
+):
+    await _owned(db, playlist_id, username)
+    ids = list(dict.fromkeys(body.ids))
+    found = await db.scalar(select(func.count(PlaylistItem.id))
+                            .where(PlaylistItem.playlist_id == playlist_id, PlaylistItem.id.in_(ids)))
+    if found != len(ids):
+        raise HTTPException(404, "Some items are not in this playlist")
+    positions = await _positions(db, playlist_id, len(ids), body.after, body.before, moving=set(ids))
+    await db.execute(update(PlaylistItem), [{"id": i, "position": p} for i, p in zip(ids, positions)])
+    await db.commit()
+    return {"moved": [{"id": i, "position": p} for i, p in zip(ids, positions)]}
+
+
+@router.post("/{playlist_id}/items/remove")
+async def remove_items(
+    playlist_id: int,
+    body: schemas.PlaylistItemIds,
+    username: str = Query(..., min_length=1),
+    db: AsyncSession = Depends(get_async_write_db),
+):
+    await _owned(db, playlist_id, username)
+    removed = (await db.execute(
+        delete(PlaylistItem).where(PlaylistItem.playlist_id == playlist_id, PlaylistItem.id.in_(body.ids))
+    )).rowcount
+    await db.commit()
+    return {"removed": removed}
@@ -1,11 +1,12 @@
 from __future__ import annotations
 from typing import Dict, Any, List, Optional
 import os
-import httpx
 import json
 import random
 import time
 
+from . import upstream
+
 # ================= Config =================
 LLM_BASE = os.getenv("LLM_BASE", "").rstrip("/")
 LLM_API_KEY = os.getenv("LLM_API_KEY", "")
@@ -44,12 +45,12 @@ async def ai_comment(state: Dict[str, Any], narration: str) -> str:
             "temperature": 0.4,
             "max_tokens": 60,
         }
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.post(f"{LLM_BASE}/chat/completions",
-                                  headers={"Authorization": f"Bearer {LLM_API_KEY}"},
-                                  json=payload)
-            r.raise_for_status()
-            return r.json()["choices"][0]["message"]["content"].strip()
+        client = upstream.client(LLM_BASE)
+        r = await client.post(f"{LLM_BASE}/chat/completions",
+                              headers={"Authorization": f"Bearer {LLM_API_KEY}"},
+                              json=payload, timeout=30)
+        r.raise_for_status()
+        return r.json()["choices"][0]["message"]["content"].strip()
     except Exception:
         return "Conserve energy and use the right tool—machete for thorns, antivenom for bites, torch for dark, flare at the east shore."
 
@@ -145,12 +146,12 @@ async def generate_full_encounter(
         "max_tokens": 260,
     }
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.post(f"{LLM_BASE}/chat/completions",
-                                  headers={"Authorization": f"Bearer {LLM_API_KEY}"},
-                                  json=payload)
-            r.raise_for_status()
-            txt = r.json()["choices"][0]["message"]["content"]
+        client = upstream.client(LLM_BASE)
+        r = await client.post(f"{LLM_BASE}/chat/completions",
+                              headers={"Authorization": f"Bearer {LLM_API_KEY}"},
+                              json=payload, timeout=30)
+        r.raise_for_status()
+        txt = r.json()["choices"][0]["message"]["content"]
         data = _parse_strict_json(txt)
 
         # sanitize options
@@ -209,13 +210,13 @@ async def llm_diagnostics() -> Dict[str, Any]:
     t0 = time.monotonic()
     sample = None
     try:
-        async with httpx.AsyncClient(timeout=15) as client:
-            r = await client.post(f"{LLM_BASE}/chat/completions",
-                                  headers={"Authorization": f"Bearer {LLM_API_KEY}"},
-                                  json=payload)
-            r.raise_for_status()
-            j = r.json()
-            sample = (j["choices"][0]["message"]["content"] or "").strip()
+        client = upstream.client(LLM_BASE)
+        r = await client.post(f"{LLM_BASE}/chat/completions",
+                              headers={"Authorization": f"Bearer {LLM_API_KEY}"},
+                              json=payload, timeout=15)
+        r.raise_for_status()
+        j = r.json()
+        sample = (j["choices"][0]["message"]["content"] or "").strip()
         return {"configured": True, "ok": sample.upper().startswith("OK"),
                 "latency_ms": round((time.monotonic()-t0)*1000,1),
                 "provider_base": LLM_BASE, "model": LLM_MODEL,
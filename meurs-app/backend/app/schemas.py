@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from typing import Dict, List, Optional, Union
+
+from pydantic import BaseModel, Field
 
 class UserCreate(BaseModel):
     username: str
@@ -12,5 +14,38 @@ class PlaylistCreate(BaseModel):
     name: str
     media_type: str
 
+class PlaylistItemIn(BaseModel):
+    source: str = Field(pattern="^(local|audius|pixabay|pexels)$")
+    ref: str = Field(min_length=1)
+    title: Optional[str] = None
+    duration: Optional[float] = None
+
+# `after` / `before` are item ids; with neither, items go to the end
+class PlaylistItemsAdd(BaseModel):
+    items: List[PlaylistItemIn] = Field(min_length=1, max_length=1000)
+    after: Optional[int] = None
+    before: Optional[int] = None
+
+class PlaylistItemsMove(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=1000)   # moved as a block, in this order
+    after: Optional[int] = None
+    before: Optional[int] = None
+
+class PlaylistItemIds(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=1000)
+
 class UsernameBody(BaseModel):
     username: str   
+
+# Query values a batch sub-request may carry (what httpx can put in a query string)
+Scalar = Union[str, int, float, bool]
+
+class BatchItem(BaseModel):
+    id: str
+    path: str
+    params: Dict[str, Union[Scalar, List[Scalar]]] = {}
+    headers: Dict[str, str] = {}
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+    stream: bool = False
@@ -0,0 +1,227 @@
+from __future__ import annotations
+from typing import Dict, Any, Optional, Callable, Awaitable
+from collections import OrderedDict
+import asyncio
+import hashlib
+import sqlite3
+import time
+
+import msgspec
+from fastapi import Request, Response
+
+from .settings import settings
+from .utils import etag_matches
+
+# ------------------------------
+# Search result cache
+# ------------------------------
+# Tier 1: in-process LRU with TTL + stale-while-revalidate.
+# Tier 2 (optional, SEARCH_CACHE_DB): SQLite file shared by all uvicorn
+#         workers and surviving restarts.
+# Concurrent misses for the same key are coalesced into one upstream call.
+
+
+def normalize_query(q: str) -> str:
+    return " ".join((q or "").lower().split())
+
+
+def make_key(kind: str, q: str, *parts: Any) -> str:
+    return "|".join([kind, normalize_query(q), *(str(p) for p in parts)])
+
+
+class CacheEntry:
+    __slots__ = ("payload", "body", "etag", "stored_at", "fresh_until", "stale_until", "_data")
+
+    def __init__(self, payload: Any, body: bytes, stored_at: float, ttl: float, stale: float):
+        self.payload = payload
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.stored_at = stored_at            # wall clock (shared with other workers)
+        self.fresh_until = stored_at + ttl
+        self.stale_until = stored_at + ttl + stale
+        self._data: Any = None
+
+    @classmethod
+    def from_payload(cls, payload: Any, ttl: float, stale: float) -> "CacheEntry":
+        # payload may hold normalize.py structs; msgspec encodes them directly
+        body = msgspec.json.encode(payload)
+        return cls(payload, body, time.time(), ttl, stale)
+
+    def data(self) -> Any:
+        """Payload as plain dicts/lists (for code that merges or inspects items); built once."""
+        if self._data is None:
+            self._data = msgspec.to_builtins(self.payload)
+        return self._data
+
+    def is_fresh(self, now: float) -> bool:
+        return now < self.fresh_until
+
+    def is_usable(self, now: float) -> bool:
+        return now < self.stale_until
+
+
+class SqliteTier:
+    """Tiny key/value table; all calls run in a worker thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._conn() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                " key TEXT PRIMARY KEY, body BLOB NOT NULL,"
+                " stored_at REAL NOT NULL, stale_until REAL NOT NULL)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str):
+        with self._conn() as db:
+            return db.execute(
+                "SELECT body, stored_at FROM search_cache WHERE key = ? AND stale_until > ?",
+                (key, time.time()),
+            ).fetchone()
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        with self._conn() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO search_cache (key, body, stored_at, stale_until) VALUES (?, ?, ?, ?)",
+                (key, entry.body, entry.stored_at, entry.stale_until),
+            )
+
+    def prune(self) -> None:
+        with self._conn() as db:
+            db.execute("DELETE FROM search_cache WHERE stale_until <= ?", (time.time(),))
+
+
+class SearchCache:
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl: float = 300.0,
+        stale: float = 3600.0,
+        db_path: Optional[str] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale = stale
+        self.mem: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.disk = SqliteTier(db_path) if db_path else None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = self.stale_hits = self.disk_hits = self.misses = self.coalesced = 0
+        self._puts = 0
+
+    # ---- memory tier ----------------------------------------------------
+    def _remember(self, key: str, entry: CacheEntry) -> None:
+        self.mem[key] = entry
+        self.mem.move_to_end(key)
+        while len(self.mem) > self.max_entries:
+            self.mem.popitem(last=False)
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """Usable entry from memory without touching upstream (or None)."""
+        e = self.mem.get(key)
+        return e if e is not None and e.is_usable(time.time()) else None
+
+    def is_fresh(self, key: str) -> bool:
+        e = self.mem.get(key)
+        return e is not None and e.is_fresh(time.time())
+
+    # ---- fetch path -----------------------------------------------------
+    async def _load(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> CacheEntry:
+        payload = await fetch()
+        entry = CacheEntry.from_payload(payload, self.ttl, self.stale)
+        self._remember(key, entry)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.put, key, entry)
+                self._puts += 1
+                if self._puts % 500 == 0:
+                    await asyncio.to_thread(self.disk.prune)
+            except sqlite3.Error:
+                pass
+        return entry
+
+    def _single_flight(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return task
+        task = asyncio.create_task(self._load(key, fetch))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._inflight.pop(key, None))
+        # Background revalidations may never be awaited; don't warn about their errors
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> CacheEntry:
+        now = time.time()
+        entry = self.mem.get(key)
+        if entry is None and self.disk is not None:
+            try:
+                row = await asyncio.to_thread(self.disk.get, key)
+            except sqlite3.Error:
+                row = None
+            if row is not None:
+                body, stored_at = row
+                entry = CacheEntry(msgspec.json.decode(body), bytes(body), stored_at, self.ttl, self.stale)
+                self._remember(key, entry)
+                self.disk_hits += 1
+
+        if entry is not None and entry.is_usable(now):
+            self.mem.move_to_end(key)
+            if entry.is_fresh(now):
+                self.hits += 1
+            else:
+                # stale-while-revalidate: answer now, refresh in the background
+                self.stale_hits += 1
+                self._single_flight(key, fetch)
+            return entry
+
+        self.misses += 1
+        # shield: a client disconnect must not cancel the shared upstream call
+        return await asyncio.shield(self._single_flight(key, fetch))
+
+    async def put(self, key: str, payload: Any) -> CacheEntry:
+        entry = CacheEntry.from_payload(payload, self.ttl, self.stale)
+        self._remember(key, entry)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.put, key, entry)
+            except sqlite3.Error:
+                pass
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self.mem),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+            "disk": self.disk.path if self.disk else None,
+        }
+
+
+def cached_response(request: Request, entry: CacheEntry, extra: Optional[Dict[str, str]] = None) -> Response:
+    """JSON response with ETag / Cache-Control; 304 when the client already has it."""
+    remaining = max(0, int(entry.fresh_until - time.time()))
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": f"public, max-age={remaining}, stale-while-revalidate={int(search_cache.stale)}",
+        **(extra or {}),
+    }
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+search_cache = SearchCache(
+    max_entries=settings.SEARCH_CACHE_MAX_ENTRIES,
+    ttl=settings.SEARCH_CACHE_TTL,
+    stale=settings.SEARCH_CACHE_STALE,
+    db_path=settings.SEARCH_CACHE_DB or None,
+)
@@ -0,0 +1,475 @@
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Set, Tuple, Callable
+from pathlib import Path
+import asyncio
+import hashlib
+import os
+import sqlite3
+import time
+
+import httpx
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+from . import upstream
+from .conditional import is_not_modified, if_range_matches, not_modified_response
+from .database import DB_DIR
+from .flow import UPSTREAM_READ_SIZE
+from .settings import settings
+from .utils import parse_byte_range, resolve_byte_range, parse_content_range
+
+# ------------------------------
+# On-disk byte-range segment cache
+# ------------------------------
+# Remote media objects are stored as sparse files split into fixed-size
+# segments. A metadata index (SQLite) remembers size/ETag/type and which
+# segments are present. Requests are served from local segments and only
+# the missing runs are fetched from upstream (as Range requests), written
+# to disk and streamed to the client at the same time. Whole objects are
+# evicted least-recently-used once the size cap is exceeded.
+
+MAX_RUN_SEGMENTS = 8             # longest single upstream Range fetch, in segments
+ACCESS_PERSIST_INTERVAL = 60.0   # seconds between last_access writes per object
+
+class ObjectMeta:
+    __slots__ = ("key", "digest", "etag", "last_modified", "content_type", "size",
+                 "segments", "last_access", "persisted_access", "pins")
+
+    def __init__(self, key: str, size: int, etag: Optional[str], last_modified: Optional[str],
+                 content_type: Optional[str], segments: Optional[Set[int]] = None,
+                 last_access: Optional[float] = None):
+        self.key = key
+        self.digest = hashlib.sha256(key.encode()).hexdigest()[:40]
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_type = content_type
+        self.segments: Set[int] = segments or set()
+        self.last_access = last_access or time.time()
+        self.persisted_access = self.last_access
+        self.pins = 0            # active readers/writers; pinned objects are never evicted
+
+
+def _passthrough(resp: httpx.Response) -> StreamingResponse:
+    """Relay an upstream error response as-is (and release its connection afterwards)."""
+    headers = {h: resp.headers[h] for h in ("content-type", "content-length", "retry-after")
+               if h in resp.headers}
+
+    async def body():
+        try:
+            async for chunk in resp.aiter_bytes(UPSTREAM_READ_SIZE):
+                yield chunk
+        except (httpx.HTTPError, httpx.StreamError):
+            return
+        finally:
+            await resp.aclose()
+
+    return StreamingResponse(body(), status_code=resp.status_code, headers=headers)
+
+
+def _bitmap(segments: Set[int]) -> bytes:
+    if not segments:
+        return b""
+    buf = bytearray(max(segments) // 8 + 1)
+    for s in segments:
+        buf[s // 8] |= 1 << (s % 8)
+    return bytes(buf)
+
+
+def _from_bitmap(buf: bytes) -> Set[int]:
+    return {i * 8 + b for i, byte in enumerate(buf or b"") for b in range(8) if byte >> b & 1}
+
+
+class SegmentCache:
+    def __init__(self, root: Path, segment_size: int = 1 << 20, max_bytes: int = 2 << 30):
+        self.root = root
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_path = str(root / "index.db")
+        self.objects: Dict[str, ObjectMeta] = {}
+        self.uncacheable: Set[str] = set()
+        self._creating: Dict[str, asyncio.Future] = {}   # key -> in-flight create()
+        self.hits = self.fetched_bytes = self.served_bytes = self.evictions = 0
+        self._load_index()
+
+    # ---- index ----------------------------------------------------------
+    def _db(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.index_path, timeout=5)
+
+    def _load_index(self) -> None:
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS objects ("
+                " key TEXT PRIMARY KEY, size INTEGER NOT NULL, etag TEXT, last_modified TEXT,"
+                " content_type TEXT, segments BLOB, last_access REAL NOT NULL)"
+            )
+            # Segment size is part of the layout; a change invalidates everything
+            db.execute("CREATE TABLE IF NOT EXISTS layout (segment_size INTEGER NOT NULL)")
+            row = db.execute("SELECT segment_size FROM layout").fetchone()
+            if row is None or row[0] != self.segment_size:
+                db.execute("DELETE FROM objects")
+                db.execute("DELETE FROM layout")
+                db.execute("INSERT INTO layout VALUES (?)", (self.segment_size,))
+                for f in self.root.glob("*.bin"):
+                    f.unlink(missing_ok=True)
+            for key, size, etag, lm, ctype, segs, last in db.execute("SELECT * FROM objects"):
+                meta = ObjectMeta(key, size, etag, lm, ctype, _from_bitmap(segs), last)
+                if self.data_path(meta).exists():
+                    self.objects[key] = meta
+
+    def _save(self, meta: ObjectMeta) -> None:
+        with self._db() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (meta.key, meta.size, meta.etag, meta.last_modified, meta.content_type,
+                 _bitmap(meta.segments), meta.last_access),
+            )
+        meta.persisted_access = meta.last_access
+
+    def _delete(self, meta: ObjectMeta) -> None:
+        self._delete_many([meta])
+
+    def _delete_many(self, metas: List[ObjectMeta]) -> None:
+        for meta in metas:
+            self.data_path(meta).unlink(missing_ok=True)
+        with self._db() as db:
+            db.executemany("DELETE FROM objects WHERE key = ?", [(m.key,) for m in metas])
+
+    # ---- storage --------------------------------------------------------
+    def data_path(self, meta: ObjectMeta) -> Path:
+        return self.root / f"{meta.digest}.bin"
+
+    def stored_bytes(self, meta: ObjectMeta) -> int:
+        last = (meta.size - 1) // self.segment_size
+        full = len(meta.segments) * self.segment_size
+        if last in meta.segments:
+            full -= self.segment_size - (meta.size - last * self.segment_size)
+        return full
+
+    def total_bytes(self) -> int:
+        return sum(self.stored_bytes(m) for m in self.objects.values())
+
+    def _create_file(self, meta: ObjectMeta) -> None:
+        # never O_TRUNC: bytes another writer already put there must survive
+        fd = os.open(self.data_path(meta), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != meta.size:
+                os.ftruncate(fd, meta.size)  # sparse: only written segments take disk space
+        finally:
+            os.close(fd)
+
+    def _read(self, meta: ObjectMeta, offset: int, length: int) -> Optional[bytes]:
+        try:
+            fd = os.open(self.data_path(meta), os.O_RDONLY)
+        except OSError:
+            return None
+        try:
+            return os.pread(fd, length, offset)
+        finally:
+            os.close(fd)
+
+    def _write(self, meta: ObjectMeta, offset: int, data: bytes) -> bool:
+        try:
+            fd = os.open(self.data_path(meta), os.O_WRONLY)
+        except OSError:
+            return False
+        try:
+            os.pwrite(fd, data, offset)
+            return True
+        except OSError:
+            return False
+        finally:
+            os.close(fd)
+
+    async def create(self, key: str, size: int, headers: httpx.Headers) -> Optional[ObjectMeta]:
+        """
+        Index entry + sparse file for a new object. Concurrent first requests
+        for one key share a single create; returns None when the object they
+        saw differs (size/ETag) from the one that got created.
+        """
+        etag = headers.get("etag")
+        meta = self.objects.get(key)
+        if meta is None:
+            pending = self._creating.get(key)
+            if pending is None:
+                pending = asyncio.get_running_loop().create_future()
+                self._creating[key] = pending
+                try:
+                    meta = ObjectMeta(key, size, etag, headers.get("last-modified"),
+                                      headers.get("content-type"))
+                    await asyncio.to_thread(self._create_file, meta)
+                    await asyncio.to_thread(self._save, meta)
+                    self.objects[key] = meta
+                    pending.set_result(meta)
+                    return meta
+                finally:
+                    self._creating.pop(key, None)
+                    if not pending.done():
+                        pending.cancel()    # creator failed: waiters fall back to pass-through
+            await asyncio.wait([pending])
+            if pending.cancelled():
+                return None
+            meta = pending.result()
+        return meta if meta.size == size and meta.etag == etag else None
+
+    async def invalidate(self, meta: ObjectMeta) -> None:
+        if self.objects.get(meta.key) is meta:
+            del self.objects[meta.key]
+        await asyncio.to_thread(self._delete, meta)
+
+    async def mark(self, meta: ObjectMeta, segments: Set[int]) -> None:
+        meta.segments |= segments
+        meta.last_access = time.time()
+        await asyncio.to_thread(self._save, meta)
+        if self.total_bytes() > self.max_bytes:
+            await self._evict()
+
+    async def touch(self, meta: ObjectMeta) -> None:
+        meta.last_access = time.time()
+        if meta.last_access - meta.persisted_access > ACCESS_PERSIST_INTERVAL:
+            await asyncio.to_thread(self._save, meta)
+
+    async def _evict(self) -> None:
+        # victims are chosen (and dropped from self.objects) on the event loop;
+        # only the unlinks and row deletes go to a thread
+        target = int(self.max_bytes * 0.9)
+        total = self.total_bytes()
+        victims: List[ObjectMeta] = []
+        for meta in sorted(self.objects.values(), key=lambda m: m.last_access):
+            if total <= target:
+                break
+            if meta.pins:
+                continue
+            total -= self.stored_bytes(meta)
+            self.objects.pop(meta.key, None)
+            victims.append(meta)
+        if victims:
+            self.evictions += len(victims)
+            await asyncio.to_thread(self._delete_many, victims)
+
+    def missing_run(self, meta: ObjectMeta, seg: int, last_seg: int) -> int:
+        """Last segment of the run of missing segments starting at `seg`."""
+        end = seg
+        while end + 1 <= last_seg and end + 1 not in meta.segments and end - seg + 1 < MAX_RUN_SEGMENTS:
+            end += 1
+        return end
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "objects": len(self.objects),
+            "bytes": self.total_bytes(),
+            "max_bytes": self.max_bytes,
+            "segment_size": self.segment_size,
+            "hits": self.hits,
+            "fetched_bytes": self.fetched_bytes,
+            "served_bytes": self.served_bytes,
+            "evictions": self.evictions,
+        }
+
+    # ---- serving --------------------------------------------------------
+    async def _fetch_run(self, url: str, meta: Optional[ObjectMeta], start: int, end: int,
+                         reject_statuses: Tuple[int, ...] = (),
+                         on_open: Optional[Callable[[httpx.Response], None]] = None) -> httpx.Response:
+        headers = {"Range": f"bytes={start}-{end}"}
+        if meta is not None and meta.etag:
+            headers["If-Range"] = meta.etag  # a changed object comes back as 200, not 206
+        resp = await upstream.open_stream(url, headers, reject_statuses)
+        if on_open is not None:
+            on_open(resp)
+        return resp
+
+    async def serve(self, request: Request, url: str, key: str,
+                    reject_statuses: Tuple[int, ...] = (),
+                    on_complete: Optional[Callable[[int, int, int], None]] = None,
+                    on_open: Optional[Callable[[httpx.Response], None]] = None) -> Optional[Response]:
+        """
+        Serve `url` through the cache. Returns None when the request can't be
+        cached (multi-range, upstream without Range support, too large) and the
+        caller should fall back to a plain pass-through proxy. Other upstream
+        errors on the first fetch are relayed as they are and not remembered.
+        `on_complete(start, end, size)` runs once the whole range was sent;
+        `on_open(resp)` sees every upstream response opened for this request.
+        """
+        if key in self.uncacheable:
+            return None
+        rng_header = request.headers.get("range")
+        rng = parse_byte_range(rng_header) if rng_header else (0, None)
+        if rng is None:
+            return None
+
+        S = self.segment_size
+        meta = self.objects.get(key)
+        first: Optional[Tuple[httpx.Response, int]] = None
+        if meta is None:
+            if rng[0] is None:
+                return None  # suffix range on an unknown object: size not known yet
+            seg_start = rng[0] // S * S
+            resp = await self._fetch_run(url, None, seg_start, seg_start + S - 1, reject_statuses, on_open)
+            cr = parse_content_range(resp.headers.get("content-range"))
+            if resp.status_code not in (200, 206):
+                return _passthrough(resp)   # transient (5xx, 429) or 416: nothing to learn
+            if resp.status_code == 200 or cr is None or cr[2] > self.max_bytes // 4:
+                # upstream ignores Range, or the object is too large to cache
+                await resp.aclose()
+                if len(self.uncacheable) > 10_000:
+                    self.uncacheable.clear()
+                self.uncacheable.add(key)
+                return None
+            meta = await self.create(key, cr[2], resp.headers)
+            if meta is None:
+                await resp.aclose()
+                return None
+            first = (resp, seg_start)
+        else:
+            self.hits += 1
+            await self.touch(meta)
+
+        if is_not_modified(request, meta.etag, meta.last_modified):
+            if first:
+                await first[0].aclose()
+            return not_modified_response(meta.etag, meta.last_modified)
+        if rng_header and not if_range_matches(request, meta.etag, meta.last_modified):
+            rng_header, rng = None, (0, None)   # validator changed: send the whole object
+
+        span = resolve_byte_range(rng, meta.size)
+        if span is None:
+            if first:
+                await first[0].aclose()
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{meta.size}"})
+        start, end = span
+
+        seg = start // S
+        if first is not None and first[1] != seg * S:
+            await first[0].aclose()
+            first = None
+        if first is None and seg not in meta.segments:
+            # Open the first missing run before answering so upstream rejections
+            # (e.g. an expired signed URL) still reach the caller as exceptions.
+            run_end = min(meta.size, (self.missing_run(meta, seg, end // S) + 1) * S) - 1
+            resp = await self._fetch_run(url, meta, seg * S, run_end, reject_statuses, on_open)
+            if resp.status_code != 206:
+                await resp.aclose()
+                if resp.status_code == 200:
+                    await self.invalidate(meta)  # object changed upstream
+                return None
+            first = (resp, seg * S)
+
+        headers = {"accept-ranges": "bytes", "content-length": str(end - start + 1)}
+        if meta.content_type:
+            headers["content-type"] = meta.content_type
+        if meta.etag:
+            headers["etag"] = meta.etag
+        if meta.last_modified:
+            headers["last-modified"] = meta.last_modified
+        status = 200
+        if rng_header:
+            status = 206
+            headers["content-range"] = f"bytes {start}-{end}/{meta.size}"
+
+        async def body():
+            sent = 0
+            async for chunk in self._body(url, meta, start, end, first, on_open):
+                sent += len(chunk)
+                yield chunk
+            if on_complete is not None and sent == end - start + 1:
+                on_complete(start, end, meta.size)
+
+        return StreamingResponse(body(), status_code=status, headers=headers)
+
+    async def fill(self, url: str, key: str, start: int, end: int) -> None:
+        """Fetch the missing segments of [start, end] into the cache (read-ahead)."""
+        meta = self.objects.get(key)
+        if meta is None:
+            return
+        S = self.segment_size
+        seg, last = start // S, min(end, meta.size - 1) // S
+        while seg <= last:
+            if seg in meta.segments:
+                seg += 1
+                continue
+            run_last = self.missing_run(meta, seg, last)
+            async for _ in self._body(url, meta, seg * S, min(meta.size, (run_last + 1) * S) - 1, None):
+                pass
+            if not all(s in meta.segments for s in range(seg, run_last + 1)):
+                return  # upstream failed or object changed
+            seg = run_last + 1
+
+    async def _body(self, url: str, meta: ObjectMeta, start: int, end: int,
+                    first: Optional[Tuple[httpx.Response, int]],
+                    on_open: Optional[Callable[[httpx.Response], None]] = None):
+        S = self.segment_size
+        last_seg = end // S
+        pos = start
+        pending = first
+        writable = True
+        meta.pins += 1
+        try:
+            while pos <= end:
+                seg = pos // S
+                if pending is None and seg in meta.segments:
+                    stop = min(end, (seg + 1) * S - 1, pos + UPSTREAM_READ_SIZE - 1)
+                    data = await asyncio.to_thread(self._read, meta, pos, stop - pos + 1)
+                    if data:
+                        self.served_bytes += len(data)
+                        pos += len(data)
+                        yield data
+                        continue
+                    meta.segments.discard(seg)  # file vanished or short read: refetch
+
+                if pending is None:
+                    run_end = min(meta.size, (self.missing_run(meta, seg, last_seg) + 1) * S) - 1
+                    resp = await self._fetch_run(url, meta, seg * S, run_end, on_open=on_open)
+                    if resp.status_code != 206:
+                        await resp.aclose()
+                        if resp.status_code == 200:
+                            await self.invalidate(meta)  # object changed (If-Range failed)
+                        return
+                    pending = (resp, seg * S)
+
+                resp, off = pending
+                pending = None
+                run_start = off
+                done = run_start // S   # next segment that may complete
+                try:
+                    async for chunk in resp.aiter_bytes(UPSTREAM_READ_SIZE):
+                        if not chunk:
+                            continue
+                        if writable:
+                            writable = await asyncio.to_thread(self._write, meta, off, chunk)
+                        self.fetched_bytes += len(chunk)
+                        lo, hi = max(pos, off), min(end + 1, off + len(chunk))
+                        off += len(chunk)
+                        if writable:
+                            complete = {s for s in range(done, off // S)}
+                            if off >= meta.size:
+                                complete.add((meta.size - 1) // S)
+                            if complete:
+                                done = max(complete) + 1
+                                await self.mark(meta, complete)
+                        if hi > lo:
+                            self.served_bytes += hi - lo
+                            pos = hi
+                            yield chunk[lo - (off - len(chunk)):hi - (off - len(chunk))]
+                        if pos > end:
+                            break
+                finally:
+                    await resp.aclose()
+                if off == run_start:
+                    return  # upstream gave us nothing; stop rather than loop
+        except (httpx.HTTPError, httpx.StreamError, asyncio.CancelledError):
+            # StreamError: the admission watchdog closed a stalled upstream
+            return
+        finally:
+            meta.pins -= 1
+
+
+def _build() -> Optional[SegmentCache]:
+    if not settings.SEGMENT_CACHE_ENABLED:
+        return None
+    root = Path(settings.SEGMENT_CACHE_DIR or os.path.join(DB_DIR, "segment_cache"))
+    return SegmentCache(root, settings.SEGMENT_CACHE_SEGMENT_SIZE, settings.SEGMENT_CACHE_MAX_BYTES)
+
+
+segment_cache = _build()
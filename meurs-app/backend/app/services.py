@@ -1,32 +1,47 @@
 import asyncio
-from urllib.parse import urlencode
+import calendar
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit, parse_qs
 
 import httpx
-from fastapi import HTTPException, Request
+from fastapi import HTTPException, Request, Response
 from fastapi.responses import StreamingResponse
 
+from . import upstream
+from .upstream import UpstreamRejected
+from .admission import admission
+from .audius_nodes import audius_nodes
+from .flow import UPSTREAM_READ_SIZE, new_pacer, paced
+from .hedging import hedger
+from .normalize import AudiusSearch, AudiusTrack, PexelsSearch, PixabaySearch, decode
+from .conditional import (
+    validators, is_not_modified, if_range_matches, not_modified_response, forward_conditionals,
+)
+from .readahead import readahead
+from .segment_cache import segment_cache
 from .settings import settings
+from .utils import parse_byte_range, parse_content_range
 from .config import (
     PIXABAY_API_KEY as CONF_PIXABAY_API_KEY,
     YT_API_KEY as CONF_YT_API_KEY,          # reserved for future use
-    PEXELS_API_KEY as CONF_PEXELS_API_KEY,  # reserved for future use
+    PEXELS_API_KEY as CONF_PEXELS_API_KEY,
 )
 
 # ---------------------------------------------------------------------------
 # Audius
 # ---------------------------------------------------------------------------
 
-async def audius_search_tracks(q: str, limit: int, offset: int):
-    async with httpx.AsyncClient(timeout=15) as client:
-        host_resp = await client.get("https://api.audius.co")
-        host_resp.raise_for_status()
-        host = host_resp.json()["data"][0]
-        r = await client.get(
-            f"{host}/v1/tracks/search",
-            params={"query": q, "limit": limit, "offset": offset},
-        )
-        r.raise_for_status()
-        return r.json().get("data", [])
+async def audius_search_tracks(q: str, limit: int, offset: int) -> List[AudiusTrack]:
+    r = await audius_nodes.request(
+        "GET", "/v1/tracks/search",
+        hedger=hedger("audius_search"),
+        params={"query": q, "limit": limit, "offset": offset},
+    )
+    r.raise_for_status()
+    return decode(r.content, AudiusSearch).data
 
 
 async def audius_resolve_stream(track_id: str) -> str:
@@ -35,41 +50,154 @@ async def audius_resolve_stream(track_id: str) -> str:
     Audius typically returns a 302 with the CDN URL in Location.
     We do NOT follow redirects here; we surface the final URL.
     """
-    async with httpx.AsyncClient(timeout=15, follow_redirects=False) as client:
-        host_resp = await client.get("https://api.audius.co")
-        host_resp.raise_for_status()
-        host = host_resp.json()["data"][0]
-
-        resp = await client.get(
-            f"{host}/v1/tracks/{track_id}/stream",
-            follow_redirects=False,
+    resp = await audius_nodes.request(
+        "GET", f"/v1/tracks/{track_id}/stream",
+        hedger=hedger("audius_resolve"),
+        follow_redirects=False,
+    )
+
+    if resp.status_code in (301, 302, 303, 307, 308):
+        loc = resp.headers.get("location")
+        if not loc:
+            raise HTTPException(502, "Audius redirect missing Location")
+        return str(loc)
+
+    if resp.status_code == 200:
+        # Some providers might directly serve the stream
+        return str(resp.url)
+
+    # Surface other errors with a helpful message
+    try:
+        resp.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        detail = e.response.text[:200] if e.response is not None else str(e)
+        raise HTTPException(
+            e.response.status_code if e.response else 502,
+            f"Audius error: {detail}",
         )
 
-        if resp.status_code in (301, 302, 303, 307, 308):
-            loc = resp.headers.get("location")
-            if not loc:
-                raise HTTPException(502, "Audius redirect missing Location")
-            return str(loc)
+# ---------------------------------------------------------------------------
+# Resolved stream URL cache
+# ---------------------------------------------------------------------------
+# Every seek is a new Range request; without this each one would repeat the
+# discovery-node round-trip before the first audio byte. Entries live until
+# shortly before the signed CDN URL expires and are dropped on 403/404.
+
+EXPIRY_PARAMS = ("expires", "expiry", "exp", "expiration")
 
-        if resp.status_code == 200:
-            # Some providers might directly serve the stream
-            return str(resp.url)
 
-        # Surface other errors with a helpful message
+def signed_url_expiry(url: str) -> Optional[float]:
+    """Best-effort unix expiry time encoded in a signed URL (None if unknown)."""
+    qs = {k.lower(): v[0] for k, v in parse_qs(urlsplit(url).query).items() if v}
+    for name in EXPIRY_PARAMS:
+        if qs.get(name, "").isdigit():
+            val = int(qs[name])
+            return val / 1000 if val > 10**11 else float(val)  # ms or s
+    # AWS SigV4: X-Amz-Date=20240101T000000Z&X-Amz-Expires=3600
+    if qs.get("x-amz-date") and qs.get("x-amz-expires", "").isdigit():
         try:
-            resp.raise_for_status()
-        except httpx.HTTPStatusError as e:
-            detail = e.response.text[:200] if e.response is not None else str(e)
-            raise HTTPException(
-                e.response.status_code if e.response else 502,
-                f"Audius error: {detail}",
-            )
+            signed = calendar.timegm(time.strptime(qs["x-amz-date"], "%Y%m%dT%H%M%SZ"))
+            return signed + int(qs["x-amz-expires"])
+        except ValueError:
+            pass
+    # Audius content nodes: signature={"data": "{...\"expiry\": ...}", ...}
+    if qs.get("signature"):
+        try:
+            sig = json.loads(qs["signature"])
+            data = json.loads(sig.get("data") or "{}")
+            for name in EXPIRY_PARAMS:
+                if isinstance(data.get(name), (int, float)):
+                    val = data[name]
+                    return val / 1000 if val > 10**11 else float(val)
+        except (ValueError, AttributeError, TypeError):
+            pass
+    return None
+
+
+class StreamUrlCache:
+    def __init__(self, max_entries: int = 5000, default_ttl: float = 600.0, margin: float = 30.0):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.margin = margin      # stop using a signed URL this long before it expires
+        self.entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = self.misses = self.invalidations = 0
+
+    def _ttl_for(self, url: str) -> float:
+        exp = signed_url_expiry(url)
+        if exp is None:
+            return self.default_ttl
+        return max(0.0, min(self.default_ttl, exp - time.time() - self.margin))
+
+    async def _load(self, track_id: str) -> str:
+        url = await audius_resolve_stream(track_id)
+        ttl = self._ttl_for(url)
+        if ttl > 0:
+            self.entries[track_id] = (url, time.monotonic() + ttl)
+            self.entries.move_to_end(track_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return url
+
+    def peek(self, track_id: str) -> Optional[str]:
+        hit = self.entries.get(track_id)
+        if hit and hit[1] > time.monotonic():
+            return hit[0]
+        return None
+
+    async def resolve(self, track_id: str) -> Tuple[str, bool]:
+        """(url, from_cache) for a track; concurrent misses share one resolve."""
+        url = self.peek(track_id)
+        if url:
+            self.hits += 1
+            self.entries.move_to_end(track_id)
+            return url, True
+        self.entries.pop(track_id, None)
+        self.misses += 1
+        task = self._inflight.get(track_id)
+        if task is None:
+            task = asyncio.create_task(self._load(track_id))
+            self._inflight[track_id] = task
+            task.add_done_callback(lambda t: self._inflight.pop(track_id, None))
+        return await asyncio.shield(task), False
+
+    def invalidate(self, track_id: str) -> None:
+        if self.entries.pop(track_id, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+stream_urls = StreamUrlCache(default_ttl=settings.STREAM_URL_TTL)
+
+
+async def audius_stream(request: Request, track_id: str):
+    """
+    Range-proxy an Audius track via the cached CDN URL. If the CDN rejects a
+    cached URL (expired signature, moved content) resolve again and retry once.
+    """
+    key = f"audius:{track_id}"
+    url, cached = await stream_urls.resolve(track_id)
+    if not cached:
+        return await range_proxy(request, url, cache_key=key)
+    try:
+        return await range_proxy(request, url, reject_statuses=STALE_URL_STATUSES, cache_key=key)
+    except UpstreamRejected:
+        stream_urls.invalidate(track_id)
+        url, _ = await stream_urls.resolve(track_id)
+        return await range_proxy(request, url, cache_key=key)
 
 # ---------------------------------------------------------------------------
 # Pixabay
 # ---------------------------------------------------------------------------
 
-async def pixabay_video_search(q: str, page: int, per_page: int):
+async def pixabay_video_search(q: str, page: int, per_page: int) -> PixabaySearch:
     """
     Use env key if present, else fall back to config.py’s hardcoded key.
     """
@@ -85,31 +213,149 @@ async def pixabay_video_search(q: str, page: int, per_page: int):
         "video_type": "all",
         "safesearch": "true",
     }
-    url = "https://pixabay.com/api/videos/?" + urlencode(params)
+    url = settings.PIXABAY_API + "?" + urlencode(params)
+
+    async def get() -> httpx.Response:
+        return await upstream.client(url).get(url)
+
+    h = hedger("pixabay_search")
+    r = await (h.run(get, get) if h else get())
+    r.raise_for_status()
+    return decode(r.content, PixabaySearch)
+
+# ---------------------------------------------------------------------------
+# Pexels
+# ---------------------------------------------------------------------------
+
+async def pexels_video_search(q: str, page: int, per_page: int) -> PexelsSearch:
+    API_KEY = settings.PEXELS_KEY or CONF_PEXELS_API_KEY
+    if not API_KEY:
+        raise HTTPException(500, "Pexels API key not configured")
 
-    async with httpx.AsyncClient(timeout=15) as client:
-        r = await client.get(url)
-        r.raise_for_status()
-        return r.json()
+    params = {"query": q, "page": page, "per_page": min(max(per_page, 1), 80)}
+    url = settings.PEXELS_API + "?" + urlencode(params)
+
+    r = await upstream.client(url).get(url, headers={"Authorization": API_KEY})
+    r.raise_for_status()
+    return decode(r.content, PexelsSearch)
 
 # ---------------------------------------------------------------------------
 # Range proxy core
 # ---------------------------------------------------------------------------
 
-async def range_proxy(request: Request, target_url: str):
+STALE_URL_STATUSES = (403, 404, 410)
+
+
+def _readahead_response(sid: str, url: str, window, start: int, end: int) -> Response:
+    """Answer a Range request from a read-ahead window and queue the next one."""
+    data = bytes(window.data[start - window.start:end - window.start + 1])
+    headers = {
+        h: window.headers[h] for h in ("content-type", "etag", "last-modified") if h in window.headers
+    }
+    headers.update({
+        "accept-ranges": "bytes",
+        "content-range": f"bytes {start}-{end}/{window.size}",
+    })
+    readahead.schedule_memory(sid, url, end + 1, window.size, window.headers)
+    return Response(content=data, status_code=206, headers=headers)
+
+
+async def range_proxy(
+    request: Request,
+    target_url: str,
+    reject_statuses: Tuple[int, ...] = (),
+    cache_key: Optional[str] = None,
+):
     """
     Stream a remote media file to the client with Range support.
+    Raises UpstreamRejected (after releasing the connection) when the
+    upstream status is in `reject_statuses`.
+    `cache_key` identifies the object in the segment cache when the URL
+    itself is not stable (e.g. signed CDN URLs); defaults to the URL.
     """
-    # Forward the Range header if present (audio/video seeks)
-    fwd_headers = {}
-    if rng := request.headers.get("range"):
-        fwd_headers["Range"] = rng
+    key = cache_key or target_url
+
+    # Conditional requests: answer 304 locally when we already know the validators
+    meta = segment_cache.objects.get(key) if segment_cache is not None else None
+    known = (meta.etag, meta.last_modified) if meta is not None else validators.get(key)
+    if known and is_not_modified(request, *known):
+        validators.local_304 += 1
+        return not_modified_response(*known)
+
+    rng = parse_byte_range(request.headers.get("range"))
+    sid: Optional[str] = None
+    if readahead is not None and rng is not None and rng[0] is not None:
+        sid = readahead.stream_id(request, key)
+        if rng[1] is None:
+            readahead.note_request(sid, rng[0], None)
+        else:
+            window = await readahead.take(sid, rng[0], rng[1])
+            fresh = window is not None and if_range_matches(
+                request, window.headers.get("etag"), window.headers.get("last-modified"),
+            )
+            if fresh:
+                return _readahead_response(sid, target_url, window, rng[0], rng[1])
+    # Only bounded ranges (bytes=a-b) have a predictable "next" request
+    ahead = sid is not None and rng[1] is not None
+
+    # Everything below may open upstream streams: take an admission slot
+    slot = await admission.acquire(request)
+    try:
+        response = await _proxy_upstream(
+            request, target_url, key, known, reject_statuses, slot,
+            sid if ahead else None,
+        )
+    except BaseException:
+        slot.release()
+        raise
+    if settings.STREAM_ADAPTIVE and isinstance(response, StreamingResponse):
+        # Adaptive chunk sizes with a hard per-connection buffer ceiling
+        slot.pacer = new_pacer()
+        response.body_iterator = paced(response.body_iterator, slot.pacer)
+    return admission.hold(slot, response)
+
+
+async def _proxy_upstream(
+    request: Request,
+    target_url: str,
+    key: str,
+    known,
+    reject_statuses: Tuple[int, ...],
+    slot,
+    sid: Optional[str],
+):
+    """Segment cache first, then a plain pass-through stream."""
+    if segment_cache is not None:
+        def on_complete(start: int, end: int, size: int) -> None:
+            if sid is not None:
+                readahead.schedule_disk(
+                    sid, end + 1, size,
+                    lambda s, e: segment_cache.fill(target_url, key, s, e),
+                )
+
+        cached = await segment_cache.serve(
+            request, target_url, key, reject_statuses,
+            on_complete=on_complete, on_open=slot.watch,
+        )
+        if cached is not None:
+            return cached
 
-    client = httpx.AsyncClient(follow_redirects=True, timeout=None)
+    # Forward the Range header if present (audio/video seeks) and the
+    # client's validators so the CDN can answer 304 / honor If-Range itself
+    fwd_headers = forward_conditionals(request)
+    if rng_header := request.headers.get("range"):
+        if known and not if_range_matches(request, *known):
+            fwd_headers.pop("if-range", None)   # known mismatch: ask for the whole object
+        else:
+            fwd_headers["Range"] = rng_header
 
-    # Build & send as a streamed request
-    req = client.build_request("GET", target_url, headers=fwd_headers)
-    upstream = await client.send(req, stream=True)
+    resp = await upstream.open_stream(target_url, fwd_headers, reject_statuses)
+    slot.watch(resp)
+    if resp.status_code in (200, 206, 304):
+        validators.remember(key, resp.headers)
+    if resp.status_code == 304:
+        await resp.aclose()
+        return not_modified_response(resp.headers.get("etag"), resp.headers.get("last-modified"))
 
     # Pass through the most important headers/status for media playback
     passthrough = (
@@ -117,19 +363,24 @@ async def range_proxy(request: Request, target_url: str):
         "content-length", "etag", "last-modified", "cache-control",
         "content-disposition",
     )
-    out_headers = {h: upstream.headers[h] for h in passthrough if h in upstream.headers}
-    status = upstream.status_code
+    out_headers = {h: resp.headers[h] for h in passthrough if h in resp.headers}
+    status = resp.status_code
 
     async def body():
         try:
-            async for chunk in upstream.aiter_bytes():
+            async for chunk in resp.aiter_bytes(UPSTREAM_READ_SIZE):
                 if not chunk:
                     continue
                 yield chunk
-        except (httpx.StreamClosed, asyncio.CancelledError):
+        except (httpx.HTTPError, httpx.StreamError, asyncio.CancelledError):
+            # StreamError covers upstreams the admission watchdog closed
             return
         finally:
-            await upstream.aclose()
-            await client.aclose()
+            # Returns the connection to the shared pool
+            await resp.aclose()
+        # Fully served (client still connected): fetch the next window
+        cr = parse_content_range(resp.headers.get("content-range"))
+        if sid is not None and status == 206 and cr:
+            readahead.schedule_memory(sid, target_url, cr[1] + 1, cr[2], out_headers)
 
     return StreamingResponse(body(), status_code=status, headers=out_headers)
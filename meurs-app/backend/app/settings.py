@@ -9,6 +9,128 @@ class Settings(BaseSettings):
     YT_API_KEY: Optional[str] = None
     CORS_ORIGINS: Optional[str] = None
 
+    # SQLite engines and pools (see database.py)
+    DB_POOL_SIZE: int = 10                   # per engine (sync and async) and worker
+    DB_MAX_OVERFLOW: int = 30                # extra connections under bursts
+    DB_POOL_TIMEOUT: float = 10.0            # waiting for a pooled connection
+    DB_BUSY_TIMEOUT: float = 5.0             # seconds a writer waits for the lock
+    DB_MMAP_SIZE: int = 256 << 20            # 256 MiB
+    DB_CACHE_KIB: int = 16384                # page cache per connection (16 MiB)
+
+    # Shared upstream HTTP client (see upstream.py)
+    UPSTREAM_HTTP2: bool = True
+    UPSTREAM_MAX_CONNECTIONS: int = 100      # per origin
+    UPSTREAM_MAX_KEEPALIVE: int = 20         # per origin
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 30.0  # seconds
+    UPSTREAM_CONNECT_TIMEOUT: float = 5.0
+    UPSTREAM_TIMEOUT: float = 15.0
+
+    # Audius discovery nodes (see audius_nodes.py)
+    AUDIUS_API: str = "https://api.audius.co"
+    AUDIUS_NODES: Optional[str] = None       # comma-separated fixed node list (offline/testing)
+    AUDIUS_NODES_TTL: float = 600.0          # seconds between node-list refreshes
+    AUDIUS_NODE_ATTEMPTS: int = 3            # nodes tried per request before giving up
+
+    # Video APIs (point at bench/fake_upstream.py for offline runs)
+    PIXABAY_API: str = "https://pixabay.com/api/videos/"
+    PEXELS_API: str = "https://api.pexels.com/videos/search"
+    PROXY_EXTRA_HOSTS: Optional[str] = None  # comma-separated hosts /api/proxy may also fetch from
+
+    # Federated /api/search (see federation.py)
+    SEARCH_PROVIDER_DEADLINE: float = 1.5    # seconds; slower providers are reported as "timeout"
+
+    # Hedged requests for Audius search/resolve and Pixabay search (see hedging.py)
+    HEDGE_ENABLED: bool = True
+    HEDGE_PERCENTILE: float = 0.95           # hedge once the first attempt is slower than this
+    HEDGE_MIN_DELAY: float = 0.05
+    HEDGE_MAX_DELAY: float = 2.0             # also the delay until enough latencies are known
+    HEDGE_BUDGET: float = 0.1                # at most ~10% extra upstream requests
+
+    # Background prefetch after search pages (see prefetch.py)
+    PREFETCH_ENABLED: bool = True
+    PREFETCH_TOP_K: int = 3                  # stream URLs pre-resolved per music page
+    PREFETCH_MAX_CONCURRENT: int = 4
+    PREFETCH_MAX_PENDING: int = 32           # queued + running jobs; beyond that, skip
+    PREFETCH_MAX_PRESSURE: float = 0.75      # skip while stream slots are this full
+
+    # /api/batch (see batch.py)
+    BATCH_MAX_REQUESTS: int = 10
+    BATCH_TIMEOUT: float = 10.0              # per sub-request
+
+    # /api/search/suggest (see suggest.py)
+    SUGGEST_MAX_TERMS: int = 20000           # least popular tenth dropped beyond this
+    SUGGEST_HALF_LIFE: float = 86400.0       # seconds for a term's popularity to halve
+
+    # Search cache warm-up at startup and on a timer (see warmup.py)
+    WARMUP_ENABLED: bool = True
+    WARMUP_MUSIC_QUERIES: str = "lofi"       # the front-end's default searches
+    WARMUP_VIDEO_QUERIES: str = "trending"
+    WARMUP_LEARNED_QUERIES: int = 5          # plus this many popular queries per kind
+    WARMUP_INTERVAL: float = 240.0           # +-20% jitter; keep below SEARCH_CACHE_TTL
+    WARMUP_INITIAL_DELAY: float = 1.0
+    WARMUP_MAX_PRESSURE: float = 0.5         # skip while stream slots are this full
+
+    # Search result cache (see search_cache.py)
+    SEARCH_CACHE_MAX_ENTRIES: int = 1000
+    SEARCH_CACHE_TTL: float = 300.0          # fresh for 5 min
+    SEARCH_CACHE_STALE: float = 3600.0       # then served stale while revalidating
+    SEARCH_CACHE_DB: Optional[str] = None    # e.g. /data/search_cache.db to share across workers
+
+    # Resolved Audius stream URLs (capped by the signed URL's own expiry)
+    STREAM_URL_TTL: float = 600.0
+
+    # On-disk byte-range cache under range_proxy (see segment_cache.py)
+    SEGMENT_CACHE_ENABLED: bool = True
+    SEGMENT_CACHE_DIR: Optional[str] = None  # default: <DB_DIR>/segment_cache
+    SEGMENT_CACHE_SEGMENT_SIZE: int = 1 << 20        # 1 MiB
+    SEGMENT_CACHE_MAX_BYTES: int = 2 << 30           # 2 GiB
+
+    # Speculative read-ahead of the next byte range (see readahead.py)
+    READAHEAD_ENABLED: bool = False
+    READAHEAD_WINDOW: int = 2 << 20          # bytes fetched ahead per stream (per-stream cap)
+    READAHEAD_MAX_TOTAL: int = 64 << 20      # in-memory read-ahead across all streams
+    READAHEAD_IDLE_TTL: float = 30.0         # drop windows nobody asked for
+
+    # Local media library index (see library.py)
+    LIBRARY_SCAN_INTERVAL: float = 60.0      # seconds between mtime scans (+-20% jitter)
+
+    # Waveform peaks for local music (see peaks.py)
+    PEAKS_ENABLED: bool = True
+    PEAKS_WORKERS: int = 2                   # decoder processes
+    PEAKS_WAIT: float = 5.0                  # a request waits this long for a fresh job, then 202
+
+    # /api/media local streaming (see local_media.py)
+    MEDIA_MAX_OPEN_FILES: int = 64           # idle fds kept for hot files
+    MEDIA_HANDLE_TTL: float = 30.0           # reopen (re-stat) a hot file after this long
+    MEDIA_READ_BATCH: int = 4 << 20          # bytes per pread (one thread hop) when not using pathsend
+
+    # Resumable uploads into media/ (see uploads.py)
+    UPLOAD_MAX_BYTES: int = 4 << 30          # 4 GiB per file
+    UPLOAD_EXPIRY: float = 86400.0           # unfinished uploads are dropped after a day
+
+    # Artwork/thumbnail cache behind /api/image (see image_cache.py)
+    IMAGE_CACHE_ENABLED: bool = True
+    IMAGE_CACHE_DIR: Optional[str] = None    # default: <DB_DIR>/image_cache
+    IMAGE_CACHE_MAX_BYTES: int = 256 << 20   # 256 MiB
+    IMAGE_MAX_BYTES: int = 5 << 20           # larger images are refused
+    IMAGE_REVALIDATE_AFTER: float = 86400.0  # then checked upstream in the background
+    IMAGE_BROWSER_MAX_AGE: int = 2592000     # Cache-Control max-age for clients (30 days)
+    IMAGE_PROXY_REWRITE: bool = False        # point artwork/thumbnail fields at /api/image
+
+    # Admission control for streaming endpoints (see admission.py)
+    STREAM_MAX_CONCURRENT: int = 64          # upstream streams across all clients
+    STREAM_MAX_PER_CLIENT: int = 6
+    STREAM_QUEUE_MAX: int = 32               # requests allowed to wait for a slot
+    STREAM_QUEUE_TIMEOUT: float = 5.0        # then 503 + Retry-After
+    STREAM_READ_TIMEOUT: float = 30.0        # per upstream read
+    STREAM_IDLE_TIMEOUT: float = 60.0        # no bytes to the client for this long -> close upstream
+
+    # Adaptive chunking / per-connection buffering (see flow.py)
+    STREAM_ADAPTIVE: bool = True
+    STREAM_MIN_CHUNK: int = 16 * 1024
+    STREAM_MAX_CHUNK: int = 512 * 1024
+    STREAM_BUFFER_CEILING: int = 1 << 20     # hard cap on bytes buffered per stream
+
     # Load from .env file if present
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
@@ -37,5 +159,12 @@ class Settings(BaseSettings):
             return []
         return [origin.strip() for origin in self.CORS_ORIGINS.split(",") if origin.strip()]
 
+    @property
+    def proxy_extra_hosts_list(self) -> List[str]:
+        """Parse comma-separated extra proxy hosts into a list."""
+        if not self.PROXY_EXTRA_HOSTS:
+            return []
+        return [h.strip() for h in self.PROXY_EXTRA_HOSTS.split(",") if h.strip()]
+
 # Create a single settings instance
 settings = Settings()
@@ -0,0 +1,140 @@
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Iterable
+from bisect import bisect_left, insort
+from heapq import nlargest
+from itertools import islice
+import math
+import time
+
+from .search_cache import normalize_query
+from .settings import settings
+
+# ------------------------------
+# Search autocomplete: prefix index over past queries and result names
+# ------------------------------
+# Terms live in one sorted list, so a prefix lookup is a bisect plus a short
+# scan, and in a dict holding each term's popularity. Popularity decays
+# exponentially (half-life SUGGEST_HALF_LIFE): a successful search adds 1,
+# a title/artist seen in results adds a fraction. It is stored as
+# log(score) + decay * t, which orders terms the same at any later time, so
+# ranking needs no per-term arithmetic. Answers are memoized per prefix for
+# a couple of seconds (keystrokes repeat prefixes). Past SUGGEST_MAX_TERMS
+# the least popular tenth is dropped. Queries whose page is already in the
+# search cache get a boost, which steers people onto cached queries.
+
+QUERY_WEIGHT = 1.0
+NAME_WEIGHT = 0.2
+MAX_TERM_LEN = 60
+SCAN_LIMIT = 256           # candidates looked at per lookup
+CACHED_BOOST = math.log(1.5)
+MEMO_TTL = 2.0
+MEMO_MAX = 4096
+
+
+class Term:
+    __slots__ = ("rank", "kinds", "searched")
+
+    def __init__(self):
+        self.rank = -math.inf      # log of the score, shifted to t = 0
+        self.kinds: set = set()
+        self.searched = False      # typed by someone, not only seen in results
+
+
+class SuggestIndex:
+    def __init__(self, max_terms: int = 20_000, half_life: float = 86_400.0):
+        self.max_terms = max_terms
+        self.decay = math.log(2) / half_life
+        self.keys: List[str] = []
+        self.terms: Dict[str, Term] = {}
+        self._memo: Dict[tuple, tuple] = {}
+        self.lookups = self.memo_hits = self.evictions = 0
+
+    def _current(self, rank: float, now: float) -> float:
+        return math.exp(rank - self.decay * now)
+
+    def _add(self, text: str, kind: str, weight: float, searched: bool, now: float) -> None:
+        term = normalize_query(text)
+        if not term or len(term) > MAX_TERM_LEN:
+            return
+        t = self.terms.get(term)
+        if t is None:
+            t = self.terms[term] = Term()
+            insort(self.keys, term)
+        t.rank = math.log(self._current(t.rank, now) + weight) + self.decay * now
+        t.kinds.add(kind)
+        t.searched = t.searched or searched
+
+    def note_query(self, q: str, kind: str) -> None:
+        self._add(q, kind, QUERY_WEIGHT, True, time.time())
+        self._trim()
+
+    def note_names(self, names: Iterable[Optional[str]], kind: str) -> None:
+        now = time.time()
+        for name in names:
+            if name:
+                self._add(name, kind, NAME_WEIGHT, False, now)
+        self._trim()
+
+    def _trim(self) -> None:
+        if len(self.terms) <= self.max_terms:
+            return
+        drop = nlargest(max(1, self.max_terms // 10), self.terms, key=lambda k: -self.terms[k].rank)
+        for term in drop:
+            del self.terms[term]
+            i = bisect_left(self.keys, term)
+            if i < len(self.keys) and self.keys[i] == term:
+                del self.keys[i]
+            self.evictions += 1
+
+    def suggest(self, prefix: str, limit: int = 8, kind: Optional[str] = None,
+                is_cached=None) -> List[Dict[str, Any]]:
+        """
+        Most popular terms starting with `prefix`. `is_cached(term, kinds)` marks
+        (and boosts) terms whose results are already cached.
+        """
+        self.lookups += 1
+        p = normalize_query(prefix)
+        if not p:
+            return []
+        now = time.time()
+        memo_key = (p, limit, kind, is_cached is not None)
+        hit = self._memo.get(memo_key)
+        if hit is not None and now - hit[0] < MEMO_TTL:
+            self.memo_hits += 1
+            return hit[1]
+
+        scored = []
+        terms = self.terms
+        for term in islice(self.keys, bisect_left(self.keys, p), None):
+            if not term.startswith(p) or len(scored) >= SCAN_LIMIT:
+                break
+            t = terms[term]
+            if kind and kind not in t.kinds:
+                continue
+            cached = bool(is_cached and t.searched and is_cached(term, t.kinds))
+            scored.append((t.rank + CACHED_BOOST if cached else t.rank, term, t, cached))
+        out = [
+            {"text": term, "score": round(self._current(rank, now), 3),
+             "kinds": sorted(t.kinds), "cached": cached}
+            for rank, term, t, cached in nlargest(limit, scored, key=lambda s: s[0])
+        ]
+        if len(self._memo) >= MEMO_MAX:
+            self._memo.clear()
+        self._memo[memo_key] = (now, out)
+        return out
+
+    def top_queries(self, n: int, kind: Optional[str] = None) -> List[str]:
+        """Most popular terms people actually searched for (not just result names)."""
+        searched = ((term, t) for term, t in self.terms.items()
+                    if t.searched and (kind is None or kind in t.kinds))
+        return [term for term, _ in nlargest(n, searched, key=lambda s: s[1].rank)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"terms": len(self.terms), "lookups": self.lookups,
+                "memo_hits": self.memo_hits, "evictions": self.evictions}
+
+
+suggest_index = SuggestIndex(
+    max_terms=settings.SUGGEST_MAX_TERMS,
+    half_life=settings.SUGGEST_HALF_LIFE,
+)
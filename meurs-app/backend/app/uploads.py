@@ -0,0 +1,390 @@
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Tuple
+from pathlib import Path
+import asyncio
+import base64
+import binascii
+import hashlib
+import mimetypes
+import os
+import re
+import secrets
+import time
+
+import msgspec
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from .database import DB_DIR, SessionLocal
+from .library import library
+from .models import MediaHash
+from .settings import settings
+
+# ------------------------------
+# Resumable uploads into media/music and media/videos (tus 1.0 style)
+# ------------------------------
+# POST /api/uploads creates an upload (Upload-Length, Upload-Metadata with
+# filename + kind). PATCH writes the request body at Upload-Offset with
+# pwrite() as it streams in, so nothing is buffered beyond one write
+# block, and chunks may arrive out of order or in parallel; HEAD reports
+# the contiguous offset. An optional Upload-Checksum ("sha256 <base64>")
+# is verified per chunk. The whole-file sha256 is computed incrementally:
+# in-order bytes are hashed as they arrive, anything that arrived early is
+# read back once the gap before it fills. The partial file lives next to
+# its destination as a dotfile (the library scanner skips those), and on
+# completion it is de-duplicated by content hash, hard-linked into place
+# under a free name (claimed atomically) and indexed in one database
+# transaction.
+
+TUS_VERSION = "1.0.0"
+TUS_HEADERS = {"Tus-Resumable": TUS_VERSION}
+WRITE_BLOCK = 1 << 20
+KINDS = {"music": "music", "videos": "video"}      # metadata value -> library kind
+MIME_PREFIX = {"music": "audio/", "video": "video/"}
+_UNSAFE_NAME = re.compile(r"[\x00-\x1f/\\]")
+
+
+class UploadState(msgspec.Struct):
+    id: str
+    kind: str
+    filename: str
+    length: int
+    created: float
+    ranges: List[Tuple[int, int]] = []      # received [start, end) runs, merged
+    sha256: Optional[str] = None            # expected, from metadata
+    result: Optional[Dict[str, Any]] = None  # set once published
+
+
+class Upload:
+    """In-memory side of an upload: state plus the running hash of its prefix."""
+
+    def __init__(self, state: UploadState):
+        self.state = state
+        self.lock = asyncio.Lock()
+        self.hasher = hashlib.sha256()
+        self.hashed = 0                 # bytes [0, hashed) are in `hasher`
+        self.streaming = False          # a PATCH is feeding `hasher` directly
+
+    @property
+    def offset(self) -> int:
+        r = self.state.ranges
+        return r[0][1] if r and r[0][0] == 0 else 0
+
+
+def _merge(ranges: List[Tuple[int, int]], start: int, end: int) -> List[Tuple[int, int]]:
+    out: List[Tuple[int, int]] = []
+    for a, b in sorted([*ranges, (start, end)]):
+        if out and a <= out[-1][1]:
+            out[-1] = (out[-1][0], max(out[-1][1], b))
+        else:
+            out.append((a, b))
+    return out
+
+
+def _metadata(header: Optional[str]) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    for pair in (header or "").split(","):
+        parts = pair.strip().split(" ", 1)
+        if not parts[0]:
+            continue
+        try:
+            out[parts[0]] = base64.b64decode(parts[1]).decode() if len(parts) > 1 else ""
+        except (binascii.Error, UnicodeDecodeError):
+            raise HTTPException(400, f"Bad Upload-Metadata value for {parts[0]}")
+    return out
+
+
+def _int_header(request: Request, name: str) -> int:
+    try:
+        value = int(request.headers[name])
+    except (KeyError, ValueError):
+        raise HTTPException(400, f"Missing or invalid {name}")
+    if value < 0:
+        raise HTTPException(400, f"Invalid {name}")
+    return value
+
+
+class UploadStore:
+    def __init__(self, root: Path, max_bytes: int, expiry: float):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.expiry = expiry
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.uploads: Dict[str, Upload] = {}
+        self.completed = self.duplicates = self.checksum_failures = 0
+
+    # ---- files ------------------------------------------------------------
+    def state_path(self, upload_id: str) -> Path:
+        return self.root / f"{upload_id}.json"
+
+    def part_path(self, state: UploadState) -> Path:
+        return library.directory(state.kind) / f".upload-{state.id}.part"
+
+    def _save(self, state: UploadState) -> None:
+        tmp = self.state_path(state.id).with_suffix(".tmp")
+        tmp.write_bytes(msgspec.json.encode(state))
+        os.replace(tmp, self.state_path(state.id))
+
+    def _discard(self, state: UploadState) -> None:
+        self.part_path(state).unlink(missing_ok=True)
+        self.state_path(state.id).unlink(missing_ok=True)
+
+    def get(self, upload_id: str) -> Upload:
+        up = self.uploads.get(upload_id)
+        if up is not None:
+            return up
+        if not re.fullmatch(r"[0-9a-f]{32}", upload_id):
+            raise HTTPException(404, "Unknown upload")
+        try:
+            state = msgspec.json.decode(self.state_path(upload_id).read_bytes(), type=UploadState)
+        except (OSError, msgspec.DecodeError):
+            raise HTTPException(404, "Unknown upload")
+        # after a restart the running hash is gone; it is rebuilt from disk on the next catch-up
+        up = self.uploads[upload_id] = Upload(state)
+        return up
+
+    def purge_expired(self) -> None:
+        now = time.time()
+        for path in self.root.glob("*.json"):
+            try:
+                state = msgspec.json.decode(path.read_bytes(), type=UploadState)
+            except (OSError, msgspec.DecodeError):
+                continue
+            if now - state.created > self.expiry:
+                self.uploads.pop(state.id, None)
+                self._discard(state)
+
+    # ---- writing ----------------------------------------------------------
+    def _read(self, state: UploadState, offset: int, length: int) -> bytes:
+        with open(self.part_path(state), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    async def catch_up(self, up: Upload) -> None:
+        """Hash whatever became contiguous beyond what was hashed while streaming."""
+        target = up.offset
+        while up.hashed < target:
+            start = up.hashed
+            block = await asyncio.to_thread(self._read, up.state, start, min(WRITE_BLOCK, target - start))
+            if not block:
+                break
+            if up.hashed != start:
+                continue        # a streaming PATCH hashed this part meanwhile
+            up.hasher.update(block)
+            up.hashed = start + len(block)
+
+    async def write(self, up: Upload, request: Request, offset: int, limit: int,
+                    expected: Optional[Tuple[str, bytes]]) -> int:
+        """Stream the body to the part file at `offset`; returns the bytes stored."""
+        state = up.state
+        async with up.lock:
+            feed = not up.streaming and offset == up.hashed
+            up.streaming = up.streaming or feed
+        chunk_hash = hashlib.new(expected[0]) if expected else None
+        fd = await asyncio.to_thread(os.open, self.part_path(state), os.O_WRONLY | os.O_CREAT, 0o644)
+        written = 0
+        buf = bytearray()
+        try:
+            async for piece in request.stream():
+                if written + len(buf) + len(piece) > limit:
+                    raise HTTPException(413, "Chunk goes past Upload-Length")
+                buf += piece
+                if chunk_hash is not None:
+                    chunk_hash.update(piece)
+                if len(buf) >= WRITE_BLOCK:
+                    written += await self._flush(fd, up, buf, offset + written, feed)
+                    buf = bytearray()
+            if buf:
+                written += await self._flush(fd, up, buf, offset + written, feed)
+        finally:
+            await asyncio.to_thread(os.close, fd)
+            async with up.lock:
+                if feed:
+                    up.streaming = False
+                bad = chunk_hash is not None and written and chunk_hash.digest() != expected[1]
+                if bad:
+                    # the bytes stay on disk but don't count; the running hash saw them, so restart it
+                    self.checksum_failures += 1
+                    if feed:
+                        up.hasher, up.hashed = hashlib.sha256(), 0
+                elif written:
+                    state.ranges = _merge(state.ranges, offset, offset + written)
+                    await asyncio.to_thread(self._save, state)
+        if bad:
+            raise HTTPException(460, "Checksum mismatch")
+        return written
+
+    async def _flush(self, fd: int, up: Upload, buf: bytearray, pos: int, feed: bool) -> int:
+        data = bytes(buf)
+        await asyncio.to_thread(os.pwrite, fd, data, pos)
+        if feed and up.hashed == pos:
+            up.hasher.update(data)
+            up.hashed = pos + len(data)
+        return len(data)
+
+    # ---- publishing -------------------------------------------------------
+    def _publish_sync(self, state: UploadState, digest: str) -> Dict[str, Any]:
+        part = self.part_path(state)
+        with SessionLocal() as db:
+            known = db.get(MediaHash, (digest, state.kind))
+            if known is not None and (library.directory(state.kind) / known.name).exists():
+                part.unlink(missing_ok=True)
+                self.duplicates += 1
+                return {"name": known.name, "sha256": digest, "duplicate": True}
+
+            # link() claims a free name atomically, so two uploads finishing with the
+            # same filename can't both pick it (os.replace would silently overwrite)
+            name, n = state.filename, 1
+            stem, ext = os.path.splitext(state.filename)
+            while True:
+                target = library.directory(state.kind) / name
+                try:
+                    os.link(part, target)
+                    break
+                except FileExistsError:
+                    n += 1
+                    name = f"{stem} ({n}){ext}"
+            try:
+                library.index_into(db, state.kind, name)
+                db.merge(MediaHash(sha256=digest, kind=state.kind, name=name, size=state.length))
+                db.commit()
+            except Exception:
+                target.unlink(missing_ok=True)   # the part file stays: resumable/retryable
+                raise
+            part.unlink(missing_ok=True)
+        return {"name": name, "sha256": digest, "duplicate": False}
+
+    async def finish(self, up: Upload) -> Dict[str, Any]:
+        state = up.state
+        async with up.lock:
+            if state.result is not None:
+                return state.result
+            await self.catch_up(up)
+            digest = up.hasher.hexdigest()
+            if state.sha256 and state.sha256.lower() != digest:
+                self.checksum_failures += 1
+                await asyncio.to_thread(self._discard, state)
+                self.uploads.pop(state.id, None)
+                raise HTTPException(460, "File checksum mismatch; upload discarded")
+            state.result = await asyncio.to_thread(self._publish_sync, state, digest)
+            await asyncio.to_thread(self._save, state)
+            self.completed += 1
+            return state.result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": sum(1 for u in self.uploads.values() if u.state.result is None),
+            "completed": self.completed,
+            "duplicates": self.duplicates,
+            "checksum_failures": self.checksum_failures,
+        }
+
+
+store = UploadStore(Path(DB_DIR) / "uploads", settings.UPLOAD_MAX_BYTES, settings.UPLOAD_EXPIRY)
+
+
+def _status_headers(up: Upload) -> Dict[str, str]:
+    headers = {**TUS_HEADERS, "Upload-Offset": str(up.offset), "Upload-Length": str(up.state.length),
+               "Cache-Control": "no-store"}
+    if up.state.result is not None:
+        headers["Media-Name"] = up.state.result["name"]
+    return headers
+
+
+router = APIRouter()
+
+
+@router.post("/uploads")
+async def create_upload(request: Request):
+    """
+    tus creation: Upload-Length plus Upload-Metadata "filename <b64>,kind <b64>[,sha256 <b64>]"
+    with kind "music" or "videos". Returns 201 with Location.
+    """
+    length = _int_header(request, "upload-length")
+    if length > store.max_bytes:
+        raise HTTPException(413, f"Uploads are limited to {store.max_bytes} bytes")
+    meta = _metadata(request.headers.get("upload-metadata"))
+    kind = KINDS.get(meta.get("kind", ""))
+    filename = meta.get("filename", "").strip()
+    if kind is None:
+        raise HTTPException(400, "Metadata 'kind' must be music or videos")
+    if not filename or filename.startswith(".") or _UNSAFE_NAME.search(filename):
+        raise HTTPException(400, "Invalid filename")
+    mime = mimetypes.guess_type(filename)[0] or ""
+    if not mime.startswith(MIME_PREFIX[kind]):
+        raise HTTPException(415, f"{filename} does not look like {MIME_PREFIX[kind]}*")
+
+    await asyncio.to_thread(store.purge_expired)
+    state = UploadState(id=secrets.token_hex(16), kind=kind, filename=filename, length=length,
+                        created=time.time(), sha256=meta.get("sha256") or None)
+    await asyncio.to_thread(library.directory(kind).mkdir, parents=True, exist_ok=True)
+    await asyncio.to_thread(store.part_path(state).touch)
+    await asyncio.to_thread(store._save, state)
+    up = store.uploads[state.id] = Upload(state)
+    headers = {**TUS_HEADERS, "Location": f"/api/uploads/{state.id}"}
+    if length == 0:
+        result = await store.finish(up)
+        headers["Media-Name"] = result["name"]
+    return Response(status_code=201, headers=headers)
+
+
+@router.head("/uploads/{upload_id}")
+async def upload_offset(upload_id: str):
+    return Response(status_code=200, headers=_status_headers(store.get(upload_id)))
+
+
+@router.get("/uploads/{upload_id}")
+async def upload_status(upload_id: str):
+    up = store.get(upload_id)
+    return {
+        "id": up.state.id,
+        "kind": up.state.kind,
+        "filename": up.state.filename,
+        "length": up.state.length,
+        "offset": up.offset,
+        "received": up.state.ranges,
+        "result": up.state.result,
+    }
+
+
+@router.patch("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request):
+    """
+    Body = bytes for [Upload-Offset, Upload-Offset + len). Offsets don't have to follow
+    the current one, so chunks can be sent in parallel. Upload-Checksum: "sha256 <b64>".
+    """
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        raise HTTPException(415, "Content-Type must be application/offset+octet-stream")
+    up = store.get(upload_id)
+    if up.state.result is not None:
+        return Response(status_code=204, headers=_status_headers(up))
+    offset = _int_header(request, "upload-offset")
+    if offset > up.state.length:
+        raise HTTPException(409, "Upload-Offset past Upload-Length")
+
+    expected = None
+    if request.headers.get("upload-checksum"):
+        algo, _, value = request.headers["upload-checksum"].partition(" ")
+        if algo.lower() not in ("sha256", "sha1", "md5"):
+            raise HTTPException(400, "Unsupported checksum algorithm")
+        try:
+            expected = (algo.lower(), base64.b64decode(value))
+        except binascii.Error:
+            raise HTTPException(400, "Bad Upload-Checksum")
+
+    await store.write(up, request, offset, up.state.length - offset, expected)
+    await store.catch_up(up)
+    if up.offset == up.state.length:
+        await store.finish(up)
+    return Response(status_code=204, headers=_status_headers(up))
+
+
+@router.delete("/uploads/{upload_id}")
+async def cancel_upload(upload_id: str):
+    up = store.get(upload_id)
+    async with up.lock:
+        if up.state.result is None:
+            await asyncio.to_thread(store._discard, up.state)
+        else:
+            await asyncio.to_thread(store.state_path(upload_id).unlink, missing_ok=True)
+        store.uploads.pop(upload_id, None)
+    return Response(status_code=204, headers=TUS_HEADERS)
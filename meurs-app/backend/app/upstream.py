@@ -0,0 +1,140 @@
+from __future__ import annotations
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit
+import importlib.util
+
+import httpx
+
+from .settings import settings
+
+# ------------------------------
+# Shared outbound HTTP client
+# ------------------------------
+# Every upstream call (Audius, Pixabay, Pexels, LLM, CDN range proxy) goes
+# through a pooled httpx.AsyncClient so keep-alive connections and TLS
+# sessions are reused instead of paying a fresh handshake per request.
+# One client (= one connection pool) is kept per origin so a slow CDN can
+# never starve the discovery/search hosts of connections.
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+class UpstreamPool:
+    def __init__(
+        self,
+        http2: bool = True,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        timeout: float = 15.0,
+    ):
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self.closed = False
+
+    def client(self, url: str) -> httpx.AsyncClient:
+        """Pooled client for the origin of `url` (created on first use)."""
+        origin = _origin(url)
+        c = self._clients.get(origin)
+        if c is None or c.is_closed:
+            c = httpx.AsyncClient(http2=self.http2, limits=self.limits, timeout=self.timeout)
+            self._clients[origin] = c
+        return c
+
+    async def aclose(self) -> None:
+        self.closed = True
+        clients, self._clients = list(self._clients.values()), {}
+        for c in clients:
+            try:
+                await c.aclose()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive": self.limits.max_keepalive_connections,
+            "origins": sorted(self._clients.keys()),
+        }
+
+
+_pool: Optional[UpstreamPool] = None
+
+
+def _new_pool() -> UpstreamPool:
+    return UpstreamPool(
+        http2=settings.UPSTREAM_HTTP2,
+        max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive=settings.UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+        connect_timeout=settings.UPSTREAM_CONNECT_TIMEOUT,
+        timeout=settings.UPSTREAM_TIMEOUT,
+    )
+
+
+def start() -> UpstreamPool:
+    """Create the shared pool (called from the app lifespan)."""
+    global _pool
+    if _pool is None or _pool.closed:
+        _pool = _new_pool()
+    return _pool
+
+
+async def close() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.aclose()
+        _pool = None
+
+
+def client(url: str) -> httpx.AsyncClient:
+    """Pooled client for `url`; lazily starts the pool outside the lifespan (scripts, shells)."""
+    return start().client(url)
+
+
+class UpstreamRejected(Exception):
+    """Upstream answered with a status the caller asked to handle itself."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"upstream returned {status_code}")
+        self.status_code = status_code
+
+
+async def open_stream(
+    url: str,
+    headers: Optional[Dict[str, str]] = None,
+    reject_statuses: Tuple[int, ...] = (),
+) -> httpx.Response:
+    """
+    Start a streamed GET (follows redirects). There is no overall deadline
+    because media streams are long-lived, but each read must make progress
+    within STREAM_READ_TIMEOUT so stalled upstreams are reclaimed.
+    The caller must `aclose()` the response.
+    """
+    c = client(url)
+    req = c.build_request(
+        "GET", url, headers=headers or {},
+        timeout=httpx.Timeout(settings.STREAM_READ_TIMEOUT, connect=settings.UPSTREAM_CONNECT_TIMEOUT),
+    )
+    resp = await c.send(req, stream=True, follow_redirects=True)
+    if resp.status_code in reject_statuses:
+        await resp.aclose()
+        raise UpstreamRejected(resp.status_code)
+    return resp
+
+
+def stats() -> Dict[str, Any]:
+    return _pool.stats() if _pool is not None else {"origins": []}
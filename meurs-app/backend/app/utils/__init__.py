@@ -1,4 +1,5 @@
 # backend/app/utils/__init__.py
+import re
 import secrets
 from pathlib import Path
 from urllib.parse import urlparse
@@ -27,12 +28,12 @@ ALLOWED_PROXY_HOSTS = {
     "images.pexels.com", "videos.pexels.com", "player.pexels.com",
 }
 
-def host_allowed(url: str) -> bool:
+def host_allowed(url: str, extra: list[str] | tuple[str, ...] = ()) -> bool:
     try:
         h = urlparse(url).hostname or ""
     except Exception:
         return False
-    for entry in ALLOWED_PROXY_HOSTS:
+    for entry in (*ALLOWED_PROXY_HOSTS, *extra):
         if "*" in entry:
             prefix, suffix = entry.split("*", 1)
             if h.startswith(prefix) and h.endswith(suffix):
@@ -40,3 +41,70 @@ def host_allowed(url: str) -> bool:
         elif h == entry:
             return True
     return False
+
+# ----- HTTP validators -----
+def etag_matches(if_none_match: str | None, etag: str | None) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag."""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    strip = lambda t: t.strip().removeprefix("W/")
+    return strip(etag) in {strip(t) for t in if_none_match.split(",")}
+
+# ----- Range headers -----
+def parse_byte_range(header: str | None):
+    """
+    Parse a single-range header: 'bytes=a-b' -> (a, b), 'bytes=a-' -> (a, None),
+    'bytes=-n' -> (None, n). Returns None for missing, multi-range or malformed values.
+    """
+    if not header or not header.strip().lower().startswith("bytes="):
+        return None
+    spec = header.split("=", 1)[1].strip()
+    if "," in spec or "-" not in spec:
+        return None
+    a, b = (x.strip() for x in spec.split("-", 1))
+    if not a and not b:
+        return None
+    if (a and not a.isdigit()) or (b and not b.isdigit()):
+        return None
+    start, end = (int(a) if a else None), (int(b) if b else None)
+    if start is not None and end is not None and end < start:
+        return None
+    return start, end
+
+def parse_byte_ranges(header: str | None, max_ranges: int = 16):
+    """
+    Like parse_byte_range but for 'bytes=a-b, c-d, ...' -> list of (start, end) pairs.
+    Returns None for missing or malformed values and when there are more than `max_ranges`.
+    """
+    if not header or not header.strip().lower().startswith("bytes="):
+        return None
+    specs = header.split("=", 1)[1].split(",")
+    if len(specs) > max_ranges:
+        return None
+    ranges = []
+    for spec in specs:
+        rng = parse_byte_range("bytes=" + spec.strip())
+        if rng is None:
+            return None
+        ranges.append(rng)
+    return ranges
+
+def resolve_byte_range(rng, size: int):
+    """Clamp a parsed range to an object of `size` bytes -> (start, end) or None if unsatisfiable."""
+    start, end = rng
+    if start is None:  # suffix: last `end` bytes
+        if not end:
+            return None
+        start, end = max(0, size - end), size - 1
+    else:
+        end = size - 1 if end is None else min(end, size - 1)
+    if start >= size:
+        return None
+    return start, end
+
+def parse_content_range(value: str | None):
+    """'bytes a-b/size' -> (a, b, size); None if missing or the size is unknown ('*')."""
+    m = re.match(r"bytes\s+(\d+)-(\d+)/(\d+)", value or "")
+    return (int(m.group(1)), int(m.group(2)), int(m.group(3))) if m else None
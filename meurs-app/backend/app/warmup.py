@@ -0,0 +1,130 @@
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+import asyncio
+import random
+
+from .admission import admission
+from .audius_nodes import audius_nodes
+from .search_cache import search_cache
+from .settings import settings
+from .suggest import suggest_index
+
+# ------------------------------
+# Cache warm-up for default and popular queries
+# ------------------------------
+# After a restart the front-end's default searches ("lofi" on the music tab,
+# "trending" on the video tab) would all go upstream cold. A background loop
+# fills the search cache for those plus the most popular queries learned by
+# the suggest index, and refreshes/probes the Audius node list so the first
+# requests don't pay for node selection either. Timers are jittered so
+# workers don't warm in lockstep, pages still fresh are left alone, a round
+# is skipped while streams are busy, and the music queries are skipped while
+# every Audius node is cooling down.
+
+# kind -> (cache key for q, fetch the page for q); registered by api.py
+Target = Tuple[Callable[[str], str], Callable[[str], Awaitable[Any]]]
+
+
+def _split(raw: Optional[str]) -> List[str]:
+    return [q.strip() for q in (raw or "").split(",") if q.strip()]
+
+
+class Warmer:
+    def __init__(self, queries: Dict[str, List[str]], learned: int = 5,
+                 interval: float = 240.0, initial_delay: float = 1.0, max_pressure: float = 0.5):
+        self.queries = queries
+        self.learned = learned
+        self.interval = interval
+        self.initial_delay = initial_delay
+        self.max_pressure = max_pressure
+        self.targets: Dict[str, Target] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.rounds = self.skipped = self.warmed = self.fresh = self.failed = 0
+
+    def register(self, kind: str, key: Callable[[str], str], fetch: Callable[[str], Awaitable[Any]]) -> None:
+        self.targets[kind] = (key, fetch)
+
+    def hot_queries(self) -> Dict[str, List[str]]:
+        """Configured queries first, then the most popular searched terms of each kind."""
+        out: Dict[str, List[str]] = {}
+        for kind in self.targets:
+            wanted = list(self.queries.get(kind, []))
+            for term in suggest_index.top_queries(self.learned, kind):
+                if term not in wanted:
+                    wanted.append(term)
+            out[kind] = wanted
+        return out
+
+    def busy(self) -> bool:
+        return admission.pressure() >= self.max_pressure
+
+    def degraded(self, kind: str) -> bool:
+        # only the music searches go to Audius; video warm-up doesn't care about its nodes
+        return self.busy() or (kind == "music" and audius_nodes.degraded())
+
+    async def run_once(self) -> None:
+        if self.busy():
+            self.skipped += 1
+            return
+        self.rounds += 1
+        if "music" in self.targets:
+            try:
+                await audius_nodes.refresh()
+            except Exception:
+                pass
+        for kind, queries in self.hot_queries().items():
+            key, fetch = self.targets[kind]
+            for q in queries:
+                if self.degraded(kind):
+                    self.skipped += 1
+                    break
+                if search_cache.is_fresh(key(q)):
+                    self.fresh += 1
+                    continue
+                try:
+                    await fetch(q)
+                    self.warmed += 1
+                except Exception:
+                    self.failed += 1
+
+    async def _loop(self) -> None:
+        await asyncio.sleep(self.initial_delay * random.uniform(0.5, 1.5))
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                self.failed += 1
+            await asyncio.sleep(self.interval * random.uniform(0.8, 1.2))
+
+    def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rounds": self.rounds,
+            "skipped": self.skipped,
+            "warmed": self.warmed,
+            "already_fresh": self.fresh,
+            "failed": self.failed,
+            "queries": self.hot_queries(),
+        }
+
+
+warmer = Warmer(
+    queries={"music": _split(settings.WARMUP_MUSIC_QUERIES), "video": _split(settings.WARMUP_VIDEO_QUERIES)},
+    learned=settings.WARMUP_LEARNED_QUERIES,
+    interval=settings.WARMUP_INTERVAL,
+    initial_delay=settings.WARMUP_INITIAL_DELAY,
+    max_pressure=settings.WARMUP_MAX_PRESSURE,
+) if settings.WARMUP_ENABLED else None
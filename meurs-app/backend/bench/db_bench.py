@@ -0,0 +1,200 @@
+"""
+Concurrent signup/login throughput against the SQLite database.
+
+Runs --workers processes (like uvicorn workers), each with --concurrency
+clients looping over signup (a fresh user, --write-ratio of the time) and
+login (a random seeded user), and reports ops/s, p50/p95/p99 latency and
+errors such as "database is locked" for:
+
+  legacy: the old setup - default engine (rollback journal, no busy timeout
+          tuning, default pool) and sync handlers on a 40-thread pool
+  tuned:  app.database (WAL, synchronous=NORMAL, busy_timeout, mmap, sized
+          pools) and the async /signup and /login handlers from app.api
+
+Each mode gets a fresh database with --seed users.
+
+    python -m bench.db_bench --workers 4 --concurrency 32 --duration 10
+    python -m bench.db_bench --mode tuned --write-ratio 0.5 --out run.json
+"""
+from __future__ import annotations
+from typing import Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import random
+import tempfile
+import time
+
+MODES = ("legacy", "tuned")
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(pct * len(sorted_values)))]
+
+
+def seed(db_dir: str, users: int) -> None:
+    from sqlalchemy import create_engine, insert
+    from app.models import Base, User
+
+    eng = create_engine(f"sqlite:///{os.path.join(db_dir, 'database.db')}")
+    Base.metadata.create_all(bind=eng)
+    with eng.begin() as conn:
+        conn.execute(insert(User), [{"username": f"seed{i}", "password": "pw"} for i in range(users)])
+    eng.dispose()
+
+
+# ------------------------------
+# One worker process
+# ------------------------------
+def _legacy_ops(db_dir: str):
+    """The handlers as they were before database.py was tuned."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app import models
+
+    eng = create_engine(f"sqlite:///{os.path.join(db_dir, 'database.db')}",
+                        connect_args={"check_same_thread": False})
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=eng)
+    pool = ThreadPoolExecutor(40)   # starlette/anyio's default threadpool size
+
+    def signup_sync(username: str) -> None:
+        db = Session()
+        try:
+            if db.query(models.User).filter(models.User.username == username).first():
+                raise RuntimeError("duplicate")
+            u = models.User(username=username, password="pw")
+            db.add(u); db.commit(); db.refresh(u)
+        finally:
+            db.close()
+
+    def login_sync(username: str) -> None:
+        db = Session()
+        try:
+            u = db.query(models.User).filter(models.User.username == username).first()
+            if not u or u.password != "pw":
+                raise RuntimeError("bad login")
+        finally:
+            db.close()
+
+    async def signup(username: str) -> None:
+        await asyncio.get_running_loop().run_in_executor(pool, signup_sync, username)
+
+    async def login(username: str) -> None:
+        await asyncio.get_running_loop().run_in_executor(pool, login_sync, username)
+
+    return signup, login
+
+
+def _tuned_ops():
+    from app import api, schemas
+    from app.database import AsyncSessionLocal, AsyncWriteSessionLocal
+
+    async def signup(username: str) -> None:
+        async with AsyncWriteSessionLocal() as db:
+            await api.signup(schemas.UserCreate(username=username, password="pw"), db)
+
+    async def login(username: str) -> None:
+        async with AsyncSessionLocal() as db:
+            await api.login(schemas.UserLogin(username=username, password="pw"), db)
+
+    return signup, login
+
+
+def worker(mode: str, db_dir: str, idx: int, args: Dict[str, Any], out: "mp.Queue") -> None:
+    os.environ["DB_DIR"] = db_dir   # before anything imports app.database
+    signup, login = _legacy_ops(db_dir) if mode == "legacy" else _tuned_ops()
+
+    async def run() -> Dict[str, Any]:
+        lat: Dict[str, List[float]] = {"signup": [], "login": []}
+        errors: Dict[str, int] = {}
+        deadline = time.perf_counter() + args["duration"]
+        counter = 0
+
+        async def client(cid: int) -> None:
+            nonlocal counter
+            rnd = random.Random(idx * 1000 + cid)
+            while time.perf_counter() < deadline:
+                op = "signup" if rnd.random() < args["write_ratio"] else "login"
+                t0 = time.perf_counter()
+                try:
+                    if op == "signup":
+                        counter += 1
+                        await signup(f"bench-{idx}-{counter}")
+                    else:
+                        await login(f"seed{rnd.randrange(args['seed'])}")
+                    lat[op].append(time.perf_counter() - t0)
+                except Exception as e:
+                    key = f"{op}: {str(getattr(e, 'orig', e) or type(e).__name__)[:60]}"
+                    errors[key] = errors.get(key, 0) + 1
+
+        await asyncio.gather(*(client(c) for c in range(args["concurrency"])))
+        return {"lat": lat, "errors": errors}
+
+    out.put(asyncio.run(run()))
+
+
+def run_mode(mode: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix=f"db_bench_{mode}_") as db_dir:
+        seed(db_dir, args["seed"])
+        ctx = mp.get_context("spawn")
+        out = ctx.Queue()
+        procs = [ctx.Process(target=worker, args=(mode, db_dir, i, args, out))
+                 for i in range(args["workers"])]
+        for p in procs:
+            p.start()
+        results = [out.get() for _ in procs]
+        for p in procs:
+            p.join()
+
+    report: Dict[str, Any] = {"mode": mode, "errors": {}}
+    total = 0
+    for op in ("signup", "login"):
+        values = sorted(v for r in results for v in r["lat"][op])
+        total += len(values)
+        report[op] = {
+            "ok": len(values),
+            "ops_per_s": round(len(values) / args["duration"], 1),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+        }
+    for r in results:
+        for k, n in r["errors"].items():
+            report["errors"][k] = report["errors"].get(k, 0) + n
+    report["ops_per_s"] = round(total / args["duration"], 1)
+    return report
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mode", choices=MODES + ("both",), default="both")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--concurrency", type=int, default=32, help="clients per worker")
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--write-ratio", type=float, default=0.2)
+    ap.add_argument("--seed", type=int, default=1000, help="users created before the run")
+    ap.add_argument("--out", help="write the JSON report here")
+    ns = ap.parse_args()
+    args = {"workers": ns.workers, "concurrency": ns.concurrency, "duration": ns.duration,
+            "write_ratio": ns.write_ratio, "seed": ns.seed}
+
+    reports = [run_mode(m, args) for m in (MODES if ns.mode == "both" else (ns.mode,))]
+    for r in reports:
+        print(f"{r['mode']:>7}: {r['ops_per_s']:>8} ops/s  "
+              f"signup {r['signup']['ops_per_s']}/s p95 {r['signup']['p95_ms']} ms  "
+              f"login {r['login']['ops_per_s']}/s p95 {r['login']['p95_ms']} ms  "
+              f"errors {sum(r['errors'].values())}")
+        for k, n in sorted(r["errors"].items()):
+            print(f"         {n:>6}  {k}")
+    if ns.out:
+        with open(ns.out, "w") as f:
+            json.dump({"args": args, "reports": reports}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Offline stand-in for the upstreams the backend talks to.
+
+One process serves:
+  - an Audius discovery node: GET /  (node list), /health_check,
+    /v1/tracks/search, /v1/tracks/{id}/stream  (302 to the CDN below)
+  - the Pixabay video API:    GET /api/videos/
+  - the Pexels video API:     GET /videos/search
+  - a Range-capable CDN:      GET /cdn/{path}  (ETag, If-None-Match, If-Range, 206/416)
+
+Latency, jitter and error injection apply to the API routes; the CDN has its
+own first-byte latency and an optional per-connection bandwidth cap.
+
+Run it and point the app at it:
+
+    python -m bench.fake_upstream --port 9100 --latency-ms 40 --jitter-ms 20 --error-rate 0.01
+
+    AUDIUS_NODES=http://127.0.0.1:9100 \\
+    PIXABAY_API=http://127.0.0.1:9100/api/videos/ PIXABAY_KEY=bench \\
+    PEXELS_API=http://127.0.0.1:9100/videos/search PEXELS_KEY=bench \\
+    PROXY_EXTRA_HOSTS=127.0.0.1 \\
+    uvicorn app.main:app --port 8000
+"""
+from __future__ import annotations
+from typing import Dict, Any, List, Optional
+import argparse
+import asyncio
+import hashlib
+import random
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+
+# ------------------------------
+# Knobs (set from the command line in main())
+# ------------------------------
+CONFIG: Dict[str, Any] = {
+    "base_url": "http://127.0.0.1:9100",
+    "latency_ms": 0.0,          # added to every API response
+    "jitter_ms": 0.0,           # +/- uniform on top of latency
+    "error_rate": 0.0,          # share of API requests answered with 503
+    "cdn_latency_ms": 0.0,      # time to first byte on /cdn
+    "cdn_bandwidth": 0,         # bytes/sec per connection, 0 = unlimited
+    "object_size": 8 << 20,     # size of every CDN media object
+    "image_size": 24 << 10,     # size of every CDN .jpg
+    "seed": None,
+}
+
+BLOCK = 64 * 1024
+_PATTERN = bytes(range(256)) * (BLOCK // 256)
+
+app = FastAPI(title="meurs fake upstream")
+stats: Dict[str, int] = {"requests": 0, "errors_injected": 0, "cdn_bytes": 0}
+
+
+async def _delay(base_ms: float, jitter_ms: float) -> None:
+    ms = base_ms + (random.uniform(-jitter_ms, jitter_ms) if jitter_ms else 0.0)
+    if ms > 0:
+        await asyncio.sleep(ms / 1000)
+
+
+@app.middleware("http")
+async def inject(request: Request, call_next):
+    stats["requests"] += 1
+    if request.url.path.startswith("/cdn/"):
+        return await call_next(request)
+    await _delay(CONFIG["latency_ms"], CONFIG["jitter_ms"])
+    if CONFIG["error_rate"] and random.random() < CONFIG["error_rate"]:
+        stats["errors_injected"] += 1
+        return JSONResponse({"error": "injected"}, status_code=503)
+    return await call_next(request)
+
+
+# ------------------------------
+# Audius discovery node
+# ------------------------------
+def _track(i: int, q: str) -> Dict[str, Any]:
+    tid = hashlib.sha1(f"{q}:{i}".encode()).hexdigest()[:8]
+    art = f"{CONFIG['base_url']}/cdn/art/{tid}.jpg"
+    return {
+        "id": tid,
+        "title": f"{q.title()} #{i}",
+        "user": {"name": f"artist-{i % 17}"},
+        "artwork": {"150x150": art, "480x480": art, "1000x1000": art},
+        "release_date": f"20{10 + i % 15:02d}-01-01T00:00:00Z",
+        "duration": 120 + i % 240,
+        "play_count": (i * 7919) % 100_000,
+    }
+
+
+@app.get("/")
+async def node_list():
+    return {"data": [CONFIG["base_url"]]}
+
+
+@app.get("/health_check")
+async def health_check():
+    return {"data": {"healthy": True}}
+
+
+@app.get("/v1/tracks/search")
+async def tracks_search(query: str = "", limit: int = 25, offset: int = 0):
+    return {"data": [_track(i, query) for i in range(offset, offset + min(limit, 100))]}
+
+
+@app.get("/v1/tracks/{track_id}/stream")
+async def track_stream(track_id: str):
+    return RedirectResponse(f"{CONFIG['base_url']}/cdn/audio/{track_id}.mp3", status_code=302)
+
+
+# ------------------------------
+# Pixabay video API
+# ------------------------------
+def _rendition(vid: int, name: str, w: int, h: int) -> Dict[str, Any]:
+    return {
+        "url": f"{CONFIG['base_url']}/cdn/video/{vid}_{name}.mp4",
+        "width": w, "height": h, "size": CONFIG["object_size"],
+        "thumbnail": f"{CONFIG['base_url']}/cdn/thumb/{vid}_{name}.jpg",
+    }
+
+
+@app.get("/api/videos/")
+async def pixabay_videos(q: str = "", page: int = 1, per_page: int = 20):
+    per_page = max(1, min(per_page, 200))
+    seed = int(hashlib.sha1(q.encode()).hexdigest()[:6], 16)
+    hits: List[Dict[str, Any]] = []
+    for i in range((page - 1) * per_page, page * per_page):
+        vid = seed + i
+        hits.append({
+            "id": vid,
+            "tags": f"{q}, sample, clip {i}",
+            "duration": 10 + i % 50,
+            "videos": {
+                "large": _rendition(vid, "large", 1920, 1080),
+                "medium": _rendition(vid, "medium", 1280, 720),
+                "small": _rendition(vid, "small", 960, 540),
+                "tiny": _rendition(vid, "tiny", 640, 360),
+            },
+            "user": f"user-{i % 23}",
+            "userImageURL": f"{CONFIG['base_url']}/cdn/user/{i % 23}.jpg",
+        })
+    return {"total": 500, "totalHits": 500, "hits": hits}
+
+
+# ------------------------------
+# Pexels video API
+# ------------------------------
+@app.get("/videos/search")
+async def pexels_videos(query: str = "", page: int = 1, per_page: int = 15):
+    per_page = max(1, min(per_page, 80))
+    seed = int(hashlib.sha1(f"pexels:{query}".encode()).hexdigest()[:6], 16)
+    videos: List[Dict[str, Any]] = []
+    for i in range((page - 1) * per_page, page * per_page):
+        vid = seed + i
+        slug = "-".join(query.split() + ["clip", str(vid)])
+        videos.append({
+            "id": vid,
+            "url": f"https://www.pexels.com/video/{slug}/",
+            "image": f"{CONFIG['base_url']}/cdn/thumb/px{vid}.jpg",
+            "duration": 10 + i % 50,
+            "user": {"name": f"pexels-user-{i % 11}"},
+            "video_files": [
+                {"quality": "hd", "file_type": "video/mp4", "width": 1920, "height": 1080,
+                 "link": f"{CONFIG['base_url']}/cdn/video/px{vid}_1080.mp4"},
+                {"quality": "sd", "file_type": "video/mp4", "width": 960, "height": 540,
+                 "link": f"{CONFIG['base_url']}/cdn/video/px{vid}_540.mp4"},
+            ],
+        })
+    return {"page": page, "per_page": per_page, "total_results": 400, "videos": videos}
+
+
+# ------------------------------
+# Range-capable CDN
+# ------------------------------
+def _etag(path: str) -> str:
+    return '"' + hashlib.sha1(f"{path}:{CONFIG['object_size']}".encode()).hexdigest()[:16] + '"'
+
+
+def _parse_range(header: Optional[str], size: int):
+    """-> (start, end) inclusive, None for no/ignored Range, or 'bad' when unsatisfiable."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    a, _, b = header[6:].strip().partition("-")
+    try:
+        if not a:
+            n = int(b)
+            return (max(0, size - n), size - 1) if n > 0 else "bad"
+        start = int(a)
+        end = min(int(b), size - 1) if b else size - 1
+    except ValueError:
+        return None
+    return (start, end) if start < size and start <= end else "bad"
+
+
+async def _body(start: int, end: int):
+    await _delay(CONFIG["cdn_latency_ms"], 0)
+    bw = CONFIG["cdn_bandwidth"]
+    pos = start
+    while pos <= end:
+        off = pos % BLOCK
+        n = min(BLOCK - off, end - pos + 1)
+        chunk = _PATTERN[off:off + n]
+        stats["cdn_bytes"] += n
+        yield chunk
+        pos += n
+        if bw:
+            await asyncio.sleep(n / bw)
+
+
+@app.get("/cdn/{path:path}")
+async def cdn(path: str, request: Request):
+    image = path.endswith(".jpg")
+    size = CONFIG["image_size" if image else "object_size"]
+    etag = _etag(path)
+    ctype = "audio/mpeg" if path.endswith(".mp3") else ("image/jpeg" if image else "video/mp4")
+    headers = {
+        "etag": etag,
+        "last-modified": "Mon, 01 Jan 2024 00:00:00 GMT",
+        "accept-ranges": "bytes",
+        "cache-control": "public, max-age=86400",
+        "content-type": ctype,
+    }
+    if request.headers.get("if-none-match") in ("*", etag):
+        return Response(status_code=304, headers=headers)
+
+    rng = _parse_range(request.headers.get("range"), size)
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != etag:
+        rng = None
+    if rng == "bad":
+        return Response(status_code=416, headers={"content-range": f"bytes */{size}"})
+    if rng is None:
+        headers["content-length"] = str(size)
+        return StreamingResponse(_body(0, size - 1), status_code=200, headers=headers)
+    start, end = rng
+    headers["content-length"] = str(end - start + 1)
+    headers["content-range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(_body(start, end), status_code=206, headers=headers)
+
+
+@app.get("/_stats")
+async def fake_stats():
+    return {**stats, "config": CONFIG}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import uvicorn
+
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--cdn-latency-ms", type=float, default=0.0)
+    ap.add_argument("--cdn-bandwidth", type=int, default=0, help="bytes/sec per connection")
+    ap.add_argument("--object-size", type=int, default=8 << 20)
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args(argv)
+
+    CONFIG.update(
+        base_url=f"http://{args.host}:{args.port}",
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        cdn_latency_ms=args.cdn_latency_ms, cdn_bandwidth=args.cdn_bandwidth,
+        object_size=args.object_size, seed=args.seed,
+    )
+    if args.seed is not None:
+        random.seed(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
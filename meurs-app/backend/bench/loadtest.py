@@ -0,0 +1,298 @@
+"""
+End-to-end load test for the media endpoints.
+
+Drives a running backend with concurrent clients and prints (or writes) a
+JSON report with throughput and p50/p95/p99 latency per endpoint. Latency is
+measured to the last byte of the body, so proxy numbers include transfer.
+
+    # against an already running app (see bench/fake_upstream.py for the env)
+    python -m bench.loadtest --base http://127.0.0.1:8000 --concurrency 32 --duration 30
+
+    # self-contained: starts the fake upstream and the app, then runs
+    python -m bench.loadtest --spawn --concurrency 32 --duration 30 --out run.json
+
+    # fail (exit 1) if p95 got more than 20% worse than a saved run
+    python -m bench.loadtest --spawn --compare baseline.json --max-regression 0.2
+
+Endpoints: music_search, video_search, search, proxy, music_stream. Search queries
+are drawn from --queries (a small set means mostly cache hits; add
+--unique-queries to force misses). Media requests ask for random
+--range-size windows, like a player seeking.
+"""
+from __future__ import annotations
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlencode
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ENDPOINTS = ("music_search", "video_search", "search", "proxy", "music_stream")
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {e: [] for e in ENDPOINTS}
+        self.errors: Dict[str, int] = {e: 0 for e in ENDPOINTS}
+        self.statuses: Dict[str, Dict[str, int]] = {e: {} for e in ENDPOINTS}
+        self.bytes: Dict[str, int] = {e: 0 for e in ENDPOINTS}
+
+    def add(self, endpoint: str, seconds: float, status: int, nbytes: int) -> None:
+        self.statuses[endpoint][str(status)] = self.statuses[endpoint].get(str(status), 0) + 1
+        if status >= 400 or status == 0:
+            self.errors[endpoint] += 1
+            return
+        self.latencies[endpoint].append(seconds)
+        self.bytes[endpoint] += nbytes
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for e in ENDPOINTS:
+            lat = sorted(self.latencies[e])
+            n = len(lat) + self.errors[e]
+            if not n:
+                continue
+            out[e] = {
+                "requests": n,
+                "errors": self.errors[e],
+                "statuses": self.statuses[e],
+                "throughput_rps": round(len(lat) / elapsed, 2),
+                "throughput_mbps": round(self.bytes[e] * 8 / elapsed / 1e6, 2),
+                "p50_ms": round(percentile(lat, 50) * 1000, 2),
+                "p95_ms": round(percentile(lat, 95) * 1000, 2),
+                "p99_ms": round(percentile(lat, 99) * 1000, 2),
+                "max_ms": round(lat[-1] * 1000, 2) if lat else 0.0,
+            }
+        return out
+
+
+class LoadTest:
+    def __init__(self, base: str, args: argparse.Namespace):
+        self.base = base.rstrip("/")
+        self.args = args
+        self.rec = Recorder()
+        self.track_ids: List[str] = []
+        self.video_urls: List[str] = []
+        self.counter = 0
+
+    def _query(self) -> str:
+        if self.args.unique_queries:
+            self.counter += 1
+            return f"{random.choice(self.args.queries)} {self.counter}"
+        return random.choice(self.args.queries)
+
+    def _range(self) -> Dict[str, str]:
+        start = random.randrange(0, max(1, self.args.object_size - self.args.range_size))
+        return {"Range": f"bytes={start}-{start + self.args.range_size - 1}"}
+
+    async def _timed(self, client: httpx.AsyncClient, endpoint: str, path: str,
+                     headers: Optional[Dict[str, str]] = None) -> Optional[httpx.Response]:
+        t0 = time.perf_counter()
+        nbytes = 0
+        try:
+            async with client.stream("GET", self.base + path, headers=headers) as r:
+                async for chunk in r.aiter_raw():
+                    nbytes += len(chunk)
+                self.rec.add(endpoint, time.perf_counter() - t0, r.status_code, nbytes)
+                return r
+        except httpx.HTTPError:
+            self.rec.add(endpoint, time.perf_counter() - t0, 0, 0)
+            return None
+
+    async def seed(self, client: httpx.AsyncClient) -> None:
+        """Collect track ids and proxied video URLs for the media endpoints."""
+        for q in self.args.queries:
+            r = await client.get(f"{self.base}/api/search/music", params={"q": q})
+            if r.status_code == 200:
+                self.track_ids += [i["id"] for i in r.json().get("items", []) if i.get("id")]
+            r = await client.get(f"{self.base}/api/search/videos", params={"q": q})
+            if r.status_code == 200:
+                self.video_urls += [i["stream_url"] for i in r.json().get("items", [])
+                                    if i.get("stream_url")]
+
+    async def one(self, client: httpx.AsyncClient, endpoint: str) -> None:
+        if endpoint == "music_search":
+            await self._timed(client, endpoint, "/api/search/music?" + urlencode({"q": self._query()}))
+        elif endpoint == "video_search":
+            await self._timed(client, endpoint, "/api/search/videos?" + urlencode({"q": self._query()}))
+        elif endpoint == "search":
+            await self._timed(client, endpoint, "/api/search?" + urlencode({"q": self._query()}))
+        elif endpoint == "proxy" and self.video_urls:
+            await self._timed(client, endpoint, random.choice(self.video_urls), self._range())
+        elif endpoint == "music_stream" and self.track_ids:
+            await self._timed(client, endpoint, f"/api/music/stream/{random.choice(self.track_ids)}",
+                              self._range())
+
+    async def worker(self, client: httpx.AsyncClient, deadline: float, wid: int) -> None:
+        endpoints = self.args.endpoints
+        i = wid
+        while time.perf_counter() < deadline:
+            await self.one(client, endpoints[i % len(endpoints)])
+            i += 1
+
+    async def run(self) -> Dict[str, Any]:
+        limits = httpx.Limits(max_connections=self.args.concurrency,
+                              max_keepalive_connections=self.args.concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=self.args.timeout) as client:
+            await self.seed(client)
+            if self.args.warmup:
+                await asyncio.gather(*(self.worker(client, time.perf_counter() + self.args.warmup, w)
+                                       for w in range(self.args.concurrency)))
+                self.rec = Recorder()
+            t0 = time.perf_counter()
+            deadline = t0 + self.args.duration
+            await asyncio.gather(*(self.worker(client, deadline, w)
+                                   for w in range(self.args.concurrency)))
+            elapsed = time.perf_counter() - t0
+            server = {}
+            for path in ("/api/upstream/stats", "/api/stream/stats"):
+                try:
+                    server[path] = (await client.get(self.base + path)).json()
+                except (httpx.HTTPError, ValueError):
+                    pass
+        return {
+            "config": {
+                "base": self.base,
+                "concurrency": self.args.concurrency,
+                "duration_s": self.args.duration,
+                "endpoints": list(self.args.endpoints),
+                "range_size": self.args.range_size,
+                "queries": self.args.queries,
+                "unique_queries": self.args.unique_queries,
+            },
+            "elapsed_s": round(elapsed, 2),
+            "endpoints": self.rec.report(elapsed),
+            "server": server,
+        }
+
+
+# ------------------------------
+# --spawn: fake upstream + app as subprocesses
+# ------------------------------
+def _wait_ready(url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def spawn(args: argparse.Namespace) -> List[subprocess.Popen]:
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    fake = f"http://127.0.0.1:{args.fake_port}"
+    procs = [subprocess.Popen([
+        sys.executable, "-m", "bench.fake_upstream", "--port", str(args.fake_port),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--error-rate", str(args.error_rate), "--object-size", str(args.object_size),
+    ], cwd=backend)]
+    _wait_ready(fake + "/health_check")
+    env = dict(os.environ)
+    env.update({
+        "AUDIUS_NODES": fake,
+        "PIXABAY_API": fake + "/api/videos/",
+        "PIXABAY_KEY": env.get("PIXABAY_KEY", "bench"),
+        "PEXELS_API": fake + "/videos/search",
+        "PEXELS_KEY": env.get("PEXELS_KEY", "bench"),
+        "PROXY_EXTRA_HOSTS": "127.0.0.1",
+        "DB_DIR": env.get("DB_DIR") or tempfile.mkdtemp(prefix="meurs-bench-"),
+    })
+    procs.append(subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.app_port),
+        "--log-level", "warning",
+    ], cwd=backend, env=env))
+    _wait_ready(f"http://127.0.0.1:{args.app_port}/api/stream/stats")
+    return procs
+
+
+def compare(report: Dict[str, Any], baseline_path: str, max_regression: float) -> List[str]:
+    with open(baseline_path) as f:
+        base = json.load(f).get("endpoints", {})
+    failures = []
+    for name, cur in report["endpoints"].items():
+        old = base.get(name)
+        if not old or not old.get("p95_ms"):
+            continue
+        ratio = cur["p95_ms"] / old["p95_ms"] - 1
+        cur["p95_change"] = round(ratio, 3)
+        if ratio > max_regression:
+            failures.append(f"{name}: p95 {old['p95_ms']}ms -> {cur['p95_ms']}ms (+{ratio:.0%})")
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    ap.add_argument("--base", default=None, help="app URL (default: the spawned app)")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--duration", type=float, default=20.0)
+    ap.add_argument("--warmup", type=float, default=2.0)
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    ap.add_argument("--queries", default="lofi,jazz,ambient,rain,city,ocean")
+    ap.add_argument("--unique-queries", action="store_true")
+    ap.add_argument("--range-size", type=int, default=256 * 1024)
+    ap.add_argument("--object-size", type=int, default=8 << 20,
+                    help="size of upstream media objects (spawned fake upstream uses it too)")
+    ap.add_argument("--out", default=None, help="write the JSON report here as well")
+    ap.add_argument("--compare", default=None, help="baseline JSON report")
+    ap.add_argument("--max-regression", type=float, default=0.2)
+    ap.add_argument("--seed", type=int, default=None)
+    # --spawn
+    ap.add_argument("--spawn", action="store_true")
+    ap.add_argument("--app-port", type=int, default=8765)
+    ap.add_argument("--fake-port", type=int, default=9100)
+    ap.add_argument("--latency-ms", type=float, default=30.0)
+    ap.add_argument("--jitter-ms", type=float, default=10.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    args = ap.parse_args(argv)
+
+    args.endpoints = [e for e in args.endpoints.split(",") if e in ENDPOINTS]
+    args.queries = [q for q in args.queries.split(",") if q]
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    procs: List[subprocess.Popen] = []
+    try:
+        if args.spawn:
+            procs = spawn(args)
+        base = args.base or f"http://127.0.0.1:{args.app_port}"
+        report = asyncio.run(LoadTest(base, args).run())
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+    failures = compare(report, args.compare, args.max_regression) if args.compare else []
+    report["regressions"] = failures
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
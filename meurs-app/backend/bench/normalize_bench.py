@@ -0,0 +1,166 @@
+"""
+Micro-benchmark for search payload normalization (app/normalize.py).
+
+Compares, per upstream page and per item:
+  legacy: json.loads -> walk dicts with .get() chains -> list of dicts -> json.dumps
+  struct: msgspec decode into typed structs -> struct items -> msgspec encode
+
+Both paths must produce the same JSON (apart from the struct path's extra
+rendition fields); the script checks that first.
+
+    python -m bench.normalize_bench --items 50 --rounds 2000
+"""
+from __future__ import annotations
+from typing import Dict, Any, List, Callable, Optional
+from urllib.parse import urlencode
+import argparse
+import datetime as dt
+import json
+import time
+
+from app import normalize as n
+
+
+# ------------------------------
+# Synthetic upstream pages (roughly the size of real responses)
+# ------------------------------
+def audius_page(count: int) -> bytes:
+    rows = []
+    for i in range(count):
+        art = f"https://creatornode.example/content/{i:06d}/480x480.jpg"
+        rows.append({
+            "id": f"T{i:05d}x", "title": f"Track number {i}", "duration": 180 + i,
+            "user": {"name": f"artist {i}", "handle": f"artist{i}", "id": f"U{i}", "is_verified": False,
+                     "follower_count": i * 3, "bio": "x" * 120},
+            "artwork": {"150x150": art, "480x480": art, "1000x1000": art},
+            "release_date": "2021-05-04T00:00:00Z", "created_at": "2021-05-01T00:00:00Z",
+            "genre": "Electronic", "mood": "Peaceful", "tags": "lofi,chill,study",
+            "play_count": i * 100, "favorite_count": i, "repost_count": i,
+            "description": "d" * 200, "permalink": f"/artist{i}/track-{i}",
+        })
+    return json.dumps({"data": rows}).encode()
+
+
+def pixabay_page(count: int) -> bytes:
+    hits = []
+    for i in range(count):
+        videos = {
+            name: {"url": f"https://cdn.pixabay.com/video/2023/{i}/{name}.mp4",
+                   "width": w, "height": h, "size": w * h, "thumbnail": f"https://i.example/{i}_{name}.jpg"}
+            for name, w, h in (("large", 1920, 1080), ("medium", 1280, 720),
+                               ("small", 960, 540), ("tiny", 640, 360))
+        }
+        hits.append({
+            "id": 100000 + i, "pageURL": f"https://pixabay.com/videos/id-{i}/", "type": "film",
+            "tags": "nature, forest, trees", "duration": 20 + i, "videos": videos,
+            "views": i * 10, "downloads": i, "likes": i, "comments": 0, "user_id": i,
+            "user": f"user{i}", "userImageURL": f"https://cdn.pixabay.com/user/{i}.png",
+        })
+    return json.dumps({"total": 500, "totalHits": 500, "hits": hits}).encode()
+
+
+# ------------------------------
+# Legacy path (dict-walking normalizers as they were in api.py)
+# ------------------------------
+def _year_from_date(s: Optional[str]) -> Optional[int]:
+    if not s:
+        return None
+    try:
+        return dt.date.fromisoformat(s[:10]).year
+    except Exception:
+        return None
+
+
+def legacy_audius(body: bytes) -> bytes:
+    rows = json.loads(body).get("data", [])
+    items: List[Dict[str, Any]] = []
+    for t in rows:
+        tid = t.get("id")
+        user = (t.get("user") or {}).get("name") or ""
+        art = (t.get("artwork") or {})
+        artwork = art.get("480x480") or art.get("1000x1000") or art.get("150x150")
+        release = t.get("release_date") or t.get("created_at")
+        items.append({
+            "id": tid, "title": t.get("title") or "Untitled", "artist": user, "artwork": artwork,
+            "source": "audius", "release_date": release, "year": _year_from_date(release),
+            "stream_url": f"/api/music/stream/{tid}" if tid else None,
+        })
+    return json.dumps({"items": items}, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def legacy_pixabay(body: bytes) -> bytes:
+    hits = json.loads(body).get("hits", [])
+    items: List[Dict[str, Any]] = []
+    for v in hits:
+        videos = v.get("videos", {}) or {}
+        file = videos.get("large") or videos.get("medium") or videos.get("small") or {}
+        direct = file.get("url")
+        if not direct:
+            continue
+        thumb = None
+        pics = v.get("video_pictures")
+        if isinstance(pics, list) and pics:
+            thumb = pics[0].get("picture")
+        thumb = thumb or v.get("userImageURL") or v.get("previewURL")
+        items.append({
+            "id": str(v.get("id")), "title": v.get("tags") or f"Pixabay {v.get('id')}",
+            "thumbnail": thumb, "source": "pixabay", "year": None,
+            "stream_url": "/api/proxy?" + urlencode({"u": direct}),
+        })
+    return json.dumps({"items": items}, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+# ------------------------------
+# Struct path (what the app does now)
+# ------------------------------
+def struct_audius(body: bytes) -> bytes:
+    return n.encode({"items": n.audius_music_items(n.decode(body, n.AudiusSearch).data)})
+
+
+def struct_pixabay(body: bytes) -> bytes:
+    return n.encode({"items": n.pixabay_video_items(n.decode(body, n.PixabaySearch).hits)})
+
+
+def _legacy_fields(page: Dict[str, Any]) -> Dict[str, Any]:
+    # video items now also carry the rendition map; compare what both paths produce
+    return {"items": [{k: v for k, v in item.items() if k not in ("quality", "renditions")}
+                      for item in page["items"]]}
+
+
+def timeit(fn: Callable[[bytes], bytes], body: bytes, rounds: int) -> float:
+    fn(body)
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        fn(body)
+    return (time.perf_counter() - t0) / rounds
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    ap.add_argument("--items", type=int, default=50)
+    ap.add_argument("--rounds", type=int, default=2000)
+    args = ap.parse_args(argv)
+
+    cases = {
+        "audius": (audius_page(args.items), legacy_audius, struct_audius),
+        "pixabay": (pixabay_page(args.items), legacy_pixabay, struct_pixabay),
+    }
+    report: Dict[str, Any] = {"items_per_page": args.items, "rounds": args.rounds}
+    for name, (body, legacy, fast) in cases.items():
+        if json.loads(legacy(body)) != _legacy_fields(json.loads(fast(body))):
+            raise SystemExit(f"{name}: struct output differs from legacy output")
+        old = timeit(legacy, body, args.rounds)
+        new = timeit(fast, body, args.rounds)
+        report[name] = {
+            "upstream_bytes": len(body),
+            "legacy_us_per_page": round(old * 1e6, 1),
+            "struct_us_per_page": round(new * 1e6, 1),
+            "legacy_us_per_item": round(old * 1e6 / args.items, 2),
+            "struct_us_per_item": round(new * 1e6 / args.items, 2),
+            "speedup": round(old / new, 2),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# app.database and the module-level caches read DB_DIR at import time: keep test runs out of backend/
+os.environ.setdefault("DB_DIR", tempfile.mkdtemp(prefix="meurs-tests-"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,79 @@
+import asyncio
+
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+from app.admission import AdmissionController
+
+
+def _request(host: str) -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/api/proxy", "headers": [],
+                    "query_string": b"", "client": (host, 1234)})
+
+
+def test_capped_client_does_not_block_others():
+    ctl = AdmissionController(max_concurrent=4, max_per_client=1, max_queue=8, queue_timeout=1.0)
+
+    async def run():
+        a1 = await ctl.acquire(_request("a"))
+        waiting = asyncio.create_task(ctl.acquire(_request("a")))   # queued behind its own cap
+        await asyncio.sleep(0)
+        b1 = await asyncio.wait_for(ctl.acquire(_request("b")), 0.1)
+        assert not waiting.done()
+        a1.release()
+        a2 = await asyncio.wait_for(waiting, 0.1)
+        return a2, b1
+
+    a2, b1 = asyncio.run(run())
+    assert (a2.client, b1.client) == ("a", "b")
+    assert ctl.pressure() == 0.5
+
+
+def test_client_keeps_fifo_order_behind_its_own_waiter():
+    ctl = AdmissionController(max_concurrent=1, max_per_client=1, max_queue=8, queue_timeout=1.0)
+
+    async def run():
+        first = await ctl.acquire(_request("a"))
+        order = []
+
+        async def take(tag):
+            slot = await ctl.acquire(_request("a"))
+            order.append(tag)
+            slot.release()
+
+        tasks = [asyncio.create_task(take(i)) for i in range(3)]
+        await asyncio.sleep(0)
+        first.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == [0, 1, 2]
+
+
+def test_slot_is_released_when_the_body_is_never_consumed():
+    ctl = AdmissionController(max_concurrent=1, max_per_client=1)
+
+    async def run():
+        slot = await ctl.acquire(_request("a"))
+
+        async def body():
+            yield b"never sent"
+
+        response = ctl.hold(slot, StreamingResponse(body()))
+        assert ctl.stats()["in_flight"] == 1
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            raise OSError("client went away")   # fails on http.response.start
+
+        scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+        try:
+            await response(scope, receive, send)
+        except Exception:
+            pass
+        return await asyncio.wait_for(ctl.acquire(_request("b")), 0.1)
+
+    assert asyncio.run(run()).client == "b"
+    assert ctl.stats()["in_flight"] == 1 and ctl.per_client == {"b": 1}
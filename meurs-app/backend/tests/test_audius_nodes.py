@@ -0,0 +1,106 @@
+import asyncio
+
+import httpx
+
+from app import audius_nodes as audius_nodes_module
+from app.audius_nodes import FAILS_BEFORE_COOLDOWN, DiscoveryNodes
+
+A, B, C = "http://a.node", "http://b.node", "http://c.node"
+
+
+def _serve(monkeypatch, handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(audius_nodes_module.upstream, "client", lambda url: client)
+
+
+def test_ranking_follows_latency_and_errors():
+    nodes = DiscoveryNodes(static_nodes=[A, B, C])
+    nodes.record(A, 0.30, True)
+    nodes.record(B, 0.10, True)
+    assert nodes.ranked() == [B, A, C]  # unmeasured nodes get the default guess
+    for _ in range(5):
+        nodes.record(B, 0.10, True)
+        nodes.record(A, 0.05, True)     # EWMA moves A below B over a few samples
+    assert nodes.ranked()[:2] == [A, B]
+    nodes.record(A, 0.05, False)        # one error inflates A's score past B's
+    assert nodes.ranked()[:2] == [B, A]
+
+
+def test_repeated_failures_cool_a_node_down_until_it_succeeds():
+    nodes = DiscoveryNodes(static_nodes=[A, B])
+    nodes.record(A, 0.01, True)
+    nodes.record(B, 0.50, True)
+    for _ in range(FAILS_BEFORE_COOLDOWN):
+        nodes.record(A, 0.01, False)
+    assert nodes.ranked() == [B, A]     # cooled-down nodes only as a last resort
+    assert not nodes.degraded()
+    for _ in range(FAILS_BEFORE_COOLDOWN):
+        nodes.record(B, 0.50, False)
+    assert nodes.degraded()
+    nodes.record(A, 0.01, True)
+    assert not nodes.degraded() and nodes.ranked()[0] == A
+
+
+def test_request_fails_over_in_rank_order(monkeypatch):
+    calls = []
+
+    def handler(req):
+        host = f"http://{req.url.host}"
+        calls.append(host)
+        if host == A:
+            return httpx.Response(503)
+        if host == B:
+            raise httpx.ConnectError("refused", request=req)
+        return httpx.Response(200, json={"data": []})
+
+    _serve(monkeypatch, handler)
+    nodes = DiscoveryNodes(static_nodes=[A, B, C], attempts=3)
+    nodes.record(A, 0.01, True)
+    nodes.record(B, 0.02, True)
+    nodes.record(C, 0.03, True)
+
+    resp = asyncio.run(nodes.request("GET", "/v1/tracks/search"))
+    assert resp.status_code == 200
+    assert calls == [A, B, C]
+    assert nodes.ranked()[0] == C       # both failures now count against A and B
+
+
+def test_client_errors_are_returned_without_failover(monkeypatch):
+    calls = []
+
+    def handler(req):
+        calls.append(req.url.host)
+        return httpx.Response(404)
+
+    _serve(monkeypatch, handler)
+    nodes = DiscoveryNodes(static_nodes=[A, B], attempts=2)
+    resp = asyncio.run(nodes.request("GET", "/v1/tracks/x/stream"))
+    assert resp.status_code == 404 and len(calls) == 1
+
+
+def test_pick_does_not_wait_for_health_checks(monkeypatch):
+    async def run():
+        gate = asyncio.Event()
+
+        async def handler(req):
+            await gate.wait()
+            return httpx.Response(200)
+
+        _serve(monkeypatch, handler)
+
+        async def fetch_nodes():
+            return [A, B]
+
+        nodes = DiscoveryNodes(fetch_nodes=fetch_nodes)
+        try:
+            assert await asyncio.wait_for(nodes.pick(), 1) in (A, B)   # probes still blocked
+            probe = nodes._probe_task
+            await nodes.refresh(force=True)
+            assert nodes._probe_task is probe       # no second probe while one runs
+            gate.set()
+            await probe
+            assert all(nodes.stats_by_host[h].latency is not None for h in (A, B))
+        finally:
+            await nodes.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+from pydantic import ValidationError
+
+from app.batch import router
+from app.schemas import BatchItem
+
+
+def _app():
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+
+    @app.get("/api/search/music")
+    async def music(q: str = ""):
+        return {"q": q}
+
+    @app.get("/api/search/videos")
+    async def videos():
+        raise RuntimeError("bug in one route")
+
+    @app.get("/api/external/music/audius")
+    async def audius():
+        raise HTTPException(404, "nope")
+
+    return app
+
+
+def test_a_crashing_sub_route_fails_only_its_item():
+    app = _app()
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/batch", json={"requests": [
+                {"id": "m", "path": "/api/search/music", "params": {"q": "lofi"}},
+                {"id": "v", "path": "/api/search/videos"},
+                {"id": "s", "path": "/api/external/music/audius"},
+            ]})
+
+    r = asyncio.run(run())
+    assert r.status_code == 200
+    responses = r.json()["responses"]
+    assert responses["m"]["status"] == 200 and responses["m"]["body"] == {"q": "lofi"}
+    assert (responses["v"]["status"], responses["v"]["error"]) == (500, "RuntimeError")
+    assert responses["s"]["status"] == 404
+
+
+def test_params_are_limited_to_scalars():
+    assert BatchItem(id="a", path="/api/search", params={"q": "x", "limit": 5, "kinds": ["a", 1]})
+    with pytest.raises(ValidationError):
+        BatchItem(id="a", path="/api/search", params={"q": {"nested": 1}})
@@ -0,0 +1,70 @@
+import asyncio
+
+import httpx
+
+from app import image_cache as image_cache_module
+from app.image_cache import ImageCache
+
+URL = "https://cdn.pixabay.com/a.jpg"
+PNG = b"\x89PNG" + b"x" * 100
+
+
+def _serve(monkeypatch, handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(image_cache_module.upstream, "client", lambda url: client)
+
+
+def test_refetch_with_unchanged_bytes_keeps_the_blob(tmp_path, monkeypatch):
+    etags = iter(['"a"', '"b"'])     # new upstream validator, same content
+    _serve(monkeypatch, lambda req: httpx.Response(
+        200, content=PNG, headers={"content-type": "image/png", "etag": next(etags)}))
+    cache = ImageCache(tmp_path)
+
+    async def run():
+        first, _ = await cache.get(URL)
+        second = await cache._fetch(URL, first)
+        entry, body = await cache.get(URL)
+        return first, second, entry, body
+
+    first, second, entry, body = asyncio.run(run())
+    assert second.digest == first.digest
+    assert entry is second
+    assert body == PNG
+    assert cache.blob_path(first.digest).exists()
+    assert cache.refs == {first.digest: 1}
+    assert cache.bytes == len(PNG)
+
+
+def test_concurrent_misses_share_one_fetch(tmp_path, monkeypatch):
+    calls = []
+
+    async def handler(req):
+        calls.append(req.url)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, content=PNG, headers={"content-type": "image/png"})
+
+    _serve(monkeypatch, handler)
+    cache = ImageCache(tmp_path)
+
+    async def run():
+        return await asyncio.gather(*(cache.get(URL) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert {body for _, body in results} == {PNG}
+    assert cache.coalesced == 4
+
+
+def test_evict_keeps_the_new_entry(tmp_path, monkeypatch):
+    _serve(monkeypatch, lambda req: httpx.Response(
+        200, content=PNG + req.url.path.encode(), headers={"content-type": "image/png"}))
+    cache = ImageCache(tmp_path, max_bytes=200)
+
+    async def run():
+        for i in range(3):
+            await cache.get(f"https://cdn.pixabay.com/{i}.jpg")
+
+    asyncio.run(run())
+    assert list(cache.entries) == ["https://cdn.pixabay.com/2.jpg"]
+    assert cache.bytes <= 200
+    assert len(list(tmp_path.glob("*/*.bin"))) == 1
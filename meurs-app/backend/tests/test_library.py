@@ -0,0 +1,25 @@
+from app.database import SessionLocal, engine
+from app.library import Library
+from app.models import Base
+
+
+def _names(lib):
+    with SessionLocal() as db:
+        return lib.names(db, "music")
+
+
+def test_list_requests_rescan_when_the_directory_changes(tmp_path):
+    Base.metadata.create_all(bind=engine)
+    lib = Library(root=tmp_path)
+    lib.scan_sync()
+    assert _names(lib) == [] and lib.scans == 1
+    assert not lib.refresh_sync("music")           # nothing changed: no rescan
+
+    (lib.directory("music") / "new.wav").write_bytes(b"RIFF")
+    assert lib.refresh_sync("music")
+    assert _names(lib) == ["new.wav"] and lib.scans == 2
+
+    (lib.directory("music") / "new.wav").unlink()
+    assert lib.refresh_sync("music")
+    assert _names(lib) == []
+    assert not lib.refresh_sync("video")
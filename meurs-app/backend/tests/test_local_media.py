@@ -0,0 +1,84 @@
+import asyncio
+import types
+
+from starlette.requests import Request
+
+from app import local_media as local_media_module
+from app.local_media import HandleCache, serve_local
+
+BATCH = 64 * 1024
+DATA = bytes(range(256)) * (BATCH // 128)        # two read batches
+
+
+def _setup(tmp_path, monkeypatch):
+    (tmp_path / "a.bin").write_bytes(DATA)
+    lib = types.SimpleNamespace(files={}, directory=lambda kind: tmp_path)
+    monkeypatch.setattr(local_media_module, "library", lib)
+    monkeypatch.setattr(local_media_module, "handles", HandleCache())
+    monkeypatch.setattr(local_media_module, "READ_BATCH", BATCH)
+    monkeypatch.setattr(local_media_module, "sent", dict.fromkeys(local_media_module.sent, 0))
+
+
+def _get(range_header=None, extensions=None):
+    headers = [(b"range", range_header.encode())] if range_header else []
+    scope = {"type": "http", "method": "GET", "path": "/api/media/music/a.bin", "headers": headers,
+             "query_string": b"", "extensions": extensions or {}}
+    return scope, Request(scope)
+
+
+def _run(scope, response, on_body=None):
+    messages = []
+    done = asyncio.Event()
+
+    async def receive():
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+        if on_body and message["type"] == "http.response.body":
+            on_body()
+
+    async def go():
+        await response(scope, receive, send)
+        done.set()
+
+    asyncio.run(go())
+    body = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+    complete = messages[-1].get("more_body") is False
+    return messages, body, complete
+
+
+def test_ranges_are_read_with_pread(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    scope, request = _get("bytes=10-19,-5")
+    response = serve_local(request, "music", "a.bin")
+    _, body, complete = _run(scope, response)
+    assert response.status_code == 206 and complete
+    assert DATA[10:20] in body and DATA[-5:] in body
+    assert local_media_module.handles.handles[("music", "a.bin")].refs == 0
+
+    scope, request = _get()
+    messages, body, complete = _run(scope, serve_local(request, "music", "a.bin"))
+    assert body == DATA and complete
+    assert len(messages) == 4          # start, one message per batch, end
+    stats = local_media_module.stats()["sent"]
+    assert (stats["pread"], stats["reads"], stats["pathsend"]) == (2, 4, 0)
+    assert stats["pread_bytes"] == 15 + len(DATA)
+
+
+def test_whole_file_uses_pathsend_when_offered(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    scope, request = _get(extensions={"http.response.pathsend": {}})
+    messages, _, _ = _run(scope, serve_local(request, "music", "a.bin"))
+    assert messages[-1] == {"type": "http.response.pathsend", "path": str(tmp_path / "a.bin")}
+    assert local_media_module.stats()["sent"]["pathsend_bytes"] == len(DATA)
+
+
+def test_truncated_file_ends_the_body_short(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    scope, request = _get()
+    response = serve_local(request, "music", "a.bin")
+    _, body, complete = _run(scope, response, on_body=lambda: (tmp_path / "a.bin").write_bytes(b""))
+    assert body == DATA[:BATCH]
+    assert not complete
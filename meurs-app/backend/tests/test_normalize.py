@@ -0,0 +1,26 @@
+from app.normalize import AudiusSearch, audius_external_items, audius_music_items, decode
+
+PAGE = b"""{"data": [
+  {"id": "D8vJx", "title": "Night Drive", "user": {"name": "Kai", "handle": "kai"},
+   "artwork": {"150x150": "https://cn.audius.co/a/150x150.jpg",
+               "480x480": "https://cn.audius.co/a/480x480.jpg",
+               "1000x1000": "https://cn.audius.co/a/1000x1000.jpg",
+               "mirrors": ["https://cn2.audius.co", "https://cn3.audius.co"]},
+   "release_date": "2024-03-01T00:00:00Z", "duration": 184, "play_count": 12},
+  {"title": "No id", "artwork": null},
+  {"id": "Q2w", "title": null, "artwork": {"mirrors": []}}
+]}"""
+
+
+def test_audius_page_with_mirrors_and_missing_ids():
+    tracks = decode(PAGE, AudiusSearch).data
+    items = audius_music_items(tracks)
+    assert [i.id for i in items] == ["D8vJx", "Q2w"]
+    first = items[0]
+    assert first.artwork == "https://cn.audius.co/a/480x480.jpg"
+    assert (first.artist, first.year, first.stream_url) == ("Kai", 2024, "/api/music/stream/D8vJx")
+    assert items[1].title == "Untitled" and items[1].artwork is None
+
+    external = audius_external_items(tracks)
+    assert [i.id for i in external] == ["D8vJx", "Q2w"]
+    assert external[0].thumb == "https://cn.audius.co/a/150x150.jpg"
@@ -0,0 +1,54 @@
+import asyncio
+import types
+import wave
+
+from app import peaks as peaks_module
+from app.library import FileInfo
+from app.peaks import PeaksService
+
+
+def _library(monkeypatch, music, files):
+    lib = types.SimpleNamespace(files=files, directory=lambda kind: music)
+    monkeypatch.setattr(peaks_module, "library", lib)
+
+
+def _write_wav(path):
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b"\x00\x10" * 4000)
+
+
+def test_backfill_skips_handled_versions_and_remembers_failures(tmp_path, monkeypatch):
+    music = tmp_path / "music"
+    music.mkdir()
+    _write_wav(music / "good.wav")
+    (music / "bad.wav").write_bytes(b"not a wav")
+    files = {("music", "good.wav"): FileInfo(1, 1.0, '"g1"', "audio/wav"),
+             ("music", "bad.wav"): FileInfo(1, 1.0, '"b1"', "audio/wav")}
+    _library(monkeypatch, music, files)
+
+    async def run():
+        svc = PeaksService(tmp_path / "peaks", workers=2)
+        try:
+            await svc.backfill()
+            assert (svc.computed, svc.failed) == (1, 1)
+            await svc.backfill()                         # nothing new: no jobs, no retry
+            assert (svc.computed, svc.failed) == (1, 1)
+            files[("music", "bad.wav")] = FileInfo(2, 2.0, '"b2"', "audio/wav")
+            await svc.backfill()                         # changed track is tried again
+            assert (svc.computed, svc.failed) == (1, 2)
+            assert svc.stats()["failed_tracks"] == 1
+        finally:
+            await svc.stop()
+
+        fresh = PeaksService(tmp_path / "peaks", workers=2)
+        try:
+            await fresh.backfill()                       # peak file on disk already matches
+            assert (fresh.computed, fresh.failed) == (0, 1)
+            assert (await fresh.load("good.wav", '"g1"')).samples == 4000
+        finally:
+            await fresh.stop()
+
+    asyncio.run(run())
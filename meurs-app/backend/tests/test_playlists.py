@@ -0,0 +1,144 @@
+import asyncio
+import itertools
+
+import pytest
+from fastapi import HTTPException
+
+from app import schemas
+from app.database import AsyncWriteSessionLocal, async_write_engine, engine
+from app.models import Base, User
+from app.routes.playlist_routes import (
+    POSITION_GAP, add_items, create_playlist, list_items, move_items, remove_items,
+)
+
+_users = itertools.count()
+
+
+def _run(test):
+    """Run `test(call, playlist_id, username)` with one write session per route call, like requests."""
+    Base.metadata.create_all(bind=engine)
+    username = f"pl-user-{next(_users)}"
+
+    async def call(route, *args, **kwargs):
+        async with AsyncWriteSessionLocal() as db:
+            return await route(*args, db=db, **kwargs)
+
+    async def go():
+        try:
+            async with AsyncWriteSessionLocal() as db:
+                db.add(User(username=username, password="pw"))
+                await db.commit()
+            pl = await call(create_playlist, schemas.PlaylistCreate(name="mix", media_type="music"),
+                            username=username)
+            await test(call, pl["id"], username)
+        finally:
+            await async_write_engine.dispose()
+
+    asyncio.run(go())
+
+
+def _adding(*refs, after=None, before=None):
+    return schemas.PlaylistItemsAdd(items=[schemas.PlaylistItemIn(source="local", ref=r) for r in refs],
+                                    after=after, before=before)
+
+
+async def _add(call, pl, user, *refs, after=None, before=None):
+    out = await call(add_items, pl, _adding(*refs, after=after, before=before), username=user)
+    return [it["id"] for it in out["items"]]
+
+
+async def _move(call, pl, user, ids, after=None, before=None):
+    return await call(move_items, pl, schemas.PlaylistItemsMove(ids=ids, after=after, before=before),
+                      username=user)
+
+
+async def _walk(call, pl, limit=1000):
+    """Every item in playlist order, following next_cursor page by page."""
+    items, cursor = [], None
+    while True:
+        page = await call(list_items, pl, cursor=cursor, limit=limit)
+        items += page["items"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return items
+
+
+def _positions(items):
+    return [it["position"] for it in items]
+
+
+def test_used_up_gap_pushes_the_following_items_up():
+    async def test(call, pl, user):
+        a, b = await _add(call, pl, user, "a", "b")
+        inserted = []
+        for i in range(11):      # each insert halves the gap after `a`; the 11th finds none left
+            inserted += await _add(call, pl, user, f"x{i}", after=a)
+        items = await _walk(call, pl)
+        assert [it["id"] for it in items] == [a, *reversed(inserted), b]
+        assert _positions(items) == [POSITION_GAP * (i + 1) for i in range(13)]
+
+    _run(test)
+
+
+def test_moves_make_room_without_counting_the_moved_items():
+    async def test(call, pl, user):
+        a, b, c, d, e, f = await _add(call, pl, user, *"abcdef")
+        await call(remove_items, pl, schemas.PlaylistItemIds(ids=[c]), username=user)
+        order = [a, b, d, e, f]
+        for i in range(12):      # alternate d and e right after a until the gap is gone
+            moved = (d, e)[i % 2]
+            await _move(call, pl, user, [moved], after=a)
+            order.remove(moved)
+            order.insert(1, moved)
+        items = await _walk(call, pl)
+        assert [it["id"] for it in items] == order
+        positions = dict(zip(order, _positions(items)))
+        assert positions[a] == POSITION_GAP and positions[b] == 4 * POSITION_GAP   # b was pushed up
+        assert positions[f] == 6 * POSITION_GAP                          # f already had room
+        assert _positions(items) == sorted(set(_positions(items)))
+
+        out = await _move(call, pl, user, [f, a], before=e)    # a block keeps the given order
+        assert [m["id"] for m in out["moved"]] == [f, a]
+        assert [it["id"] for it in await _walk(call, pl)] == [f, a, e, d, b]
+
+    _run(test)
+
+
+def test_before_and_after_anchors():
+    async def test(call, pl, user):
+        a, b = await _add(call, pl, user, "a", "b")
+        first, = await _add(call, pl, user, "first", before=a)
+        mid1, mid2 = await _add(call, pl, user, "m1", "m2", after=a)
+        last, = await _add(call, pl, user, "last", after=b)
+        items = await _walk(call, pl)
+        assert [it["id"] for it in items] == [first, a, mid1, mid2, b, last]
+        assert 0 < items[0]["position"] < POSITION_GAP
+
+        with pytest.raises(HTTPException) as e:
+            await _add(call, pl, user, "x", after=a, before=b)
+        assert e.value.status_code == 422
+        with pytest.raises(HTTPException) as e:
+            await _move(call, pl, user, [a, b], after=b)
+        assert e.value.status_code == 422
+        with pytest.raises(HTTPException) as e:
+            await _add(call, pl, user, "x", before=10 ** 9)
+        assert e.value.status_code == 404
+
+    _run(test)
+
+
+def test_keyset_cursor_survives_making_room():
+    async def test(call, pl, user):
+        ids = await _add(call, pl, user, *(f"t{i}" for i in range(8)))
+        assert [it["id"] for it in await _walk(call, pl, limit=3)] == ids
+
+        first_page = await call(list_items, pl, limit=3)
+        seen = [it["id"] for it in first_page["items"]]
+        inserted = []
+        for _ in range(11):      # the last insert after the cursor's item pushes the rest up
+            inserted += await _add(call, pl, user, "x", after=seen[-1])
+        rest = await call(list_items, pl, cursor=first_page["next_cursor"], limit=1000)
+        assert [it["id"] for it in rest["items"]] == [*reversed(inserted), *ids[3:]]
+        assert [it["id"] for it in await _walk(call, pl, limit=3)] == seen + [it["id"] for it in rest["items"]]
+
+    _run(test)
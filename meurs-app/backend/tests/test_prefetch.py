@@ -0,0 +1,43 @@
+import asyncio
+
+from app import prefetch
+from app.prefetch import Prefetcher
+
+
+def test_audius_outage_only_stops_audius_jobs(monkeypatch):
+    monkeypatch.setattr(prefetch.audius_nodes, "degraded", lambda: True)
+    ran = []
+
+    async def run():
+        p = Prefetcher()
+
+        async def job(tag):
+            ran.append(tag)
+
+        assert p.schedule("videos:next", lambda: job("video"))
+        assert not p.schedule("music:next", lambda: job("music"), audius=True)
+        await asyncio.sleep(0.01)
+        return p
+
+    p = asyncio.run(run())
+    assert ran == ["video"]
+    assert p.skipped_pressure == 1
+
+
+def test_running_jobs_are_kept_and_cancelled_on_stop():
+    async def run():
+        p = Prefetcher()
+        started = asyncio.Event()
+
+        async def job():
+            started.set()
+            await asyncio.sleep(60)
+
+        assert p.schedule("music:next", job)
+        await started.wait()
+        assert len(p._tasks) == 1 and p.stats()["pending"] == 1
+        await p.stop()
+        return p
+
+    p = asyncio.run(run())
+    assert not p._tasks and p.stats()["pending"] == 0
@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+
+from app import readahead as readahead_module
+from app.admission import AdmissionController
+from app.readahead import ReadAhead
+
+URL = "https://cdn.example/a.mp3"
+SIZE = 1000
+
+
+def _serve(monkeypatch, handler, ctl):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(readahead_module.upstream, "client", lambda url: client)
+    monkeypatch.setattr(readahead_module, "admission", ctl)
+
+
+def test_in_flight_windows_count_against_the_budget(monkeypatch):
+    ctl = AdmissionController(max_concurrent=10, max_per_client=10)
+    ra = ReadAhead(window=100, total_max=150)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def handler(req):
+            await release.wait()
+            return httpx.Response(206, content=b"x" * 50)
+
+        _serve(monkeypatch, handler, ctl)
+        ra.schedule_memory("a|1", URL, 0, SIZE, {})
+        ra.schedule_memory("b|2", URL, 0, SIZE, {})    # nothing filled yet, but 100 is reserved
+        assert (ra.reserved, ra.skipped, len(ctl.active)) == (100, 1, 1)
+        release.set()
+        await ra.streams["a|1"].task
+        assert (ra.reserved, len(ctl.active)) == (50, 0)   # short fetch keeps only what arrived
+        ra.cancel("a|1")
+        assert ra.reserved == 0
+
+    asyncio.run(run())
+
+
+def test_skipped_without_a_spare_admission_slot(monkeypatch):
+    ctl = AdmissionController(max_concurrent=2, max_per_client=6)
+    _serve(monkeypatch, lambda req: httpx.Response(206, content=b"x" * 100), ctl)
+    ra = ReadAhead(window=100, total_max=1000)
+
+    async def run():
+        ctl._admit("c", "/api/proxy")       # one real stream: the last slot stays free
+        ra.schedule_memory("a|1", URL, 0, SIZE, {})
+        ra.schedule_disk("a|2", 0, SIZE, lambda s, e: asyncio.sleep(0))
+
+    asyncio.run(run())
+    assert (ra.scheduled, ra.skipped, ra.reserved) == (0, 2, 0)
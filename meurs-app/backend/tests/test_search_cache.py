@@ -0,0 +1,87 @@
+import asyncio
+
+from app.search_cache import SearchCache, make_key
+
+KEY = make_key("music", "  LoFi  Beats", 20, 0)
+
+
+def _fetcher(calls, gate=None, fail=False):
+    async def fetch():
+        calls.append(1)
+        if gate is not None:
+            await gate.wait()
+        if fail:
+            raise RuntimeError("upstream down")
+        return {"data": [len(calls)]}
+    return fetch
+
+
+def test_concurrent_misses_share_one_fetch():
+    cache = SearchCache()
+    calls = []
+
+    async def run():
+        gate = asyncio.Event()
+        fetch = _fetcher(calls, gate)
+        waiting = [asyncio.create_task(cache.get_or_fetch(KEY, fetch)) for _ in range(5)]
+        await asyncio.sleep(0)
+        gate.set()
+        return await asyncio.gather(*waiting)
+
+    entries = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(e is entries[0] for e in entries)
+    assert (cache.misses, cache.coalesced) == (5, 4)
+    assert KEY == "music|lofi beats|20|0"
+
+
+def test_stale_entry_is_served_while_one_refresh_runs():
+    cache = SearchCache()
+    calls = []
+
+    async def run():
+        first = await cache.get_or_fetch(KEY, _fetcher(calls))
+        first.fresh_until = 0                 # now stale, still usable
+        gate = asyncio.Event()
+        fetch = _fetcher(calls, gate)
+        served = [await cache.get_or_fetch(KEY, fetch) for _ in range(3)]
+        assert all(e is first for e in served)    # answered without waiting
+        await asyncio.sleep(0)
+        assert len(calls) == 2                    # one background revalidation
+        gate.set()
+        await asyncio.sleep(0.01)
+        return first, await cache.get_or_fetch(KEY, fetch)
+
+    first, refreshed = asyncio.run(run())
+    assert refreshed is not first and refreshed.payload == {"data": [2]}
+    assert (cache.stale_hits, cache.coalesced, cache.hits) == (3, 2, 1)
+
+
+def test_failed_revalidation_keeps_the_stale_entry():
+    cache = SearchCache()
+    calls = []
+
+    async def run():
+        first = await cache.get_or_fetch(KEY, _fetcher(calls))
+        first.fresh_until = 0
+        assert await cache.get_or_fetch(KEY, _fetcher(calls, fail=True)) is first
+        await asyncio.sleep(0.01)
+        return first, cache.peek(KEY)
+
+    first, kept = asyncio.run(run())
+    assert kept is first and len(calls) == 2
+
+
+def test_disk_tier_is_shared_between_instances(tmp_path):
+    db = str(tmp_path / "search_cache.db")
+    calls = []
+
+    async def run():
+        await SearchCache(db_path=db).get_or_fetch(KEY, _fetcher(calls))
+        other = SearchCache(db_path=db)
+        entry = await other.get_or_fetch(KEY, _fetcher(calls))
+        return other, entry
+
+    other, entry = asyncio.run(run())
+    assert len(calls) == 1 and other.disk_hits == 1
+    assert entry.payload == {"data": [1]}
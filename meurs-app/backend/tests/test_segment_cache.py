@@ -0,0 +1,98 @@
+import asyncio
+
+import httpx
+from starlette.requests import Request
+
+from app import segment_cache as segment_cache_module
+from app.segment_cache import SegmentCache
+
+HEADERS = httpx.Headers({"etag": '"v1"', "content-type": "audio/mpeg"})
+
+
+def test_concurrent_create_is_single_flight(tmp_path):
+    cache = SegmentCache(tmp_path, segment_size=4, max_bytes=1 << 20)
+    calls = []
+    create_file = cache._create_file
+    cache._create_file = lambda meta: (calls.append(meta.key), create_file(meta))
+
+    async def run():
+        return await asyncio.gather(*(cache.create("k", 10, HEADERS) for _ in range(5)))
+
+    metas = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(m is metas[0] for m in metas)
+    assert cache.objects["k"] is metas[0]
+
+
+def test_create_keeps_bytes_already_written(tmp_path):
+    cache = SegmentCache(tmp_path, segment_size=4, max_bytes=1 << 20)
+
+    async def run():
+        meta = await cache.create("k", 10, HEADERS)
+        assert cache._write(meta, 0, b"abcd")
+        await cache.mark(meta, {0})
+        # a late first request for the same object must not truncate the file
+        again = await cache.create("k", 10, HEADERS)
+        return meta, again
+
+    meta, again = asyncio.run(run())
+    assert again is meta
+    assert cache._read(meta, 0, 4) == b"abcd"
+    cache._create_file(meta)        # reopening an existing file doesn't truncate either
+    assert cache._read(meta, 0, 4) == b"abcd"
+
+
+def test_create_rejects_a_different_object(tmp_path):
+    cache = SegmentCache(tmp_path, segment_size=4, max_bytes=1 << 20)
+
+    async def run():
+        await cache.create("k", 10, HEADERS)
+        return await cache.create("k", 12, httpx.Headers({"etag": '"v2"'}))
+
+    assert asyncio.run(run()) is None
+
+
+def test_evict_drops_least_recent_unpinned(tmp_path):
+    cache = SegmentCache(tmp_path, segment_size=4, max_bytes=20)
+
+    async def run():
+        metas = []
+        for i in range(3):
+            m = await cache.create(f"k{i}", 8, HEADERS)
+            m.last_access = i
+            metas.append(m)
+        metas[0].pins = 1
+        for m in metas[:2]:
+            m.segments |= {0, 1}
+        await cache.mark(metas[2], {0, 1})     # 24 bytes > 20: evict down to 18
+        return metas
+
+    metas = asyncio.run(run())
+    assert set(cache.objects) == {"k0", "k2"}     # k0 is pinned, k1 is the oldest unpinned
+    assert not cache.data_path(metas[1]).exists()
+    assert cache.evictions == 1
+
+
+def _request(range_header):
+    return Request({"type": "http", "method": "GET", "path": "/api/proxy", "query_string": b"",
+                    "headers": [(b"range", range_header.encode())]})
+
+
+def test_only_range_ignoring_upstreams_become_uncacheable(tmp_path, monkeypatch):
+    replies = iter([httpx.Response(503, headers={"retry-after": "1"}),
+                    httpx.Response(206, content=b"abcd", headers={"content-range": "bytes 0-3/10"}),
+                    httpx.Response(200, content=b"0123456789")])
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda req: next(replies)))
+    monkeypatch.setattr(segment_cache_module.upstream, "client", lambda url: client)
+    cache = SegmentCache(tmp_path, segment_size=4, max_bytes=1 << 20)
+
+    async def run():
+        failed = await cache.serve(_request("bytes=0-3"), "https://cdn/a", "a")
+        assert failed.status_code == 503 and failed.headers["retry-after"] == "1"
+        assert "a" not in cache.uncacheable
+        served = await cache.serve(_request("bytes=0-3"), "https://cdn/a", "a")
+        assert served.status_code == 206 and "a" in cache.objects
+        assert await cache.serve(_request("bytes=0-3"), "https://cdn/b", "b") is None
+        assert "b" in cache.uncacheable
+
+    asyncio.run(run())
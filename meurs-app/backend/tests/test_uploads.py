@@ -0,0 +1,34 @@
+import asyncio
+import hashlib
+import time
+
+from app.database import engine
+from app.library import library
+from app.models import Base
+from app.uploads import UploadState, UploadStore
+
+
+def _finished(store, upload_id, body):
+    state = UploadState(id=upload_id, kind="music", filename="song.wav", length=len(body),
+                        created=time.time(), ranges=[(0, len(body))])
+    store.part_path(state).write_bytes(body)
+    return state, hashlib.sha256(body).hexdigest()
+
+
+def test_concurrent_publishes_with_one_filename_keep_both_files(tmp_path, monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(library, "root", tmp_path / "media")
+    library.directory("music").mkdir(parents=True)
+    store = UploadStore(tmp_path / "uploads", max_bytes=1 << 20, expiry=60)
+    bodies = [b"first" * 100, b"second" * 100, b"third" * 100]
+    jobs = [_finished(store, f"{i:032x}", body) for i, body in enumerate(bodies)]
+
+    async def run():
+        return await asyncio.gather(*(asyncio.to_thread(store._publish_sync, s, d) for s, d in jobs))
+
+    results = asyncio.run(run())
+    names = sorted(r["name"] for r in results)
+    assert names == ["song (2).wav", "song (3).wav", "song.wav"]
+    music = library.directory("music")
+    assert sorted((music / r["name"]).read_bytes() for r in results) == sorted(bodies)
+    assert sorted(p.name for p in music.iterdir()) == names       # part files are gone
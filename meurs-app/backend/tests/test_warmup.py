@@ -0,0 +1,43 @@
+import asyncio
+
+from app import warmup
+from app.audius_nodes import DiscoveryNodes
+from app.warmup import Warmer
+
+
+def _warmer(monkeypatch, nodes, fetched):
+    monkeypatch.setattr(warmup, "audius_nodes", nodes)
+    monkeypatch.setattr(warmup.search_cache, "is_fresh", lambda key: False)
+    w = Warmer({"music": ["lofi"], "video": ["trending"]}, learned=0)
+
+    async def fetch(kind, q):
+        fetched.append((kind, q))
+
+    w.register("music", lambda q: f"music:{q}", lambda q: fetch("music", q))
+    w.register("video", lambda q: f"video:{q}", lambda q: fetch("video", q))
+    return w
+
+
+def test_cold_start_refreshes_and_warms(monkeypatch):
+    refreshed = []
+
+    async def fetch_nodes():
+        refreshed.append(True)
+        return ["https://n1.invalid"]
+
+    nodes = DiscoveryNodes(fetch_nodes=fetch_nodes, probe=False)
+    assert not nodes.degraded()          # empty list: unknown, not degraded
+    fetched = []
+    asyncio.run(_warmer(monkeypatch, nodes, fetched).run_once())
+    assert refreshed
+    assert fetched == [("music", "lofi"), ("video", "trending")]
+
+
+def test_audius_outage_still_warms_videos(monkeypatch):
+    nodes = DiscoveryNodes(static_nodes=["https://n1.invalid"])
+    nodes.degraded = lambda: True
+    fetched = []
+    w = _warmer(monkeypatch, nodes, fetched)
+    asyncio.run(w.run_once())
+    assert fetched == [("video", "trending")]
+    assert w.skipped == 1